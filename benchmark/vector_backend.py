@@ -0,0 +1,96 @@
+"""
+Compare the vector db backends on ingest throughput and query latency
+
+    python -m benchmark.vector_backend --docs 20000 --dim 768
+
+Random unit vectors are used as embeddings so only the storage / search cost is
+measured (no Ollama needed). Every backend writes into its own temp folder.
+"""
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from src.RAG.backend import ChromaBackend, NumpyBackend
+
+
+def make_backend(kind: str, path: str, hnsw_threshold: int):
+    if kind == "numpy":
+        return NumpyBackend(path, "bench", hnsw_threshold=hnsw_threshold)
+    return ChromaBackend(path, "bench", None)
+
+
+def run(kind: str, vectors: np.ndarray, queries: np.ndarray, batch: int, k: int, hnsw_threshold: int):
+    path = tempfile.mkdtemp(prefix=f"bench_{kind}_")
+    try:
+        backend = make_backend(kind, path, hnsw_threshold)
+        n = len(vectors)
+        ids = [f"doc-{i}" for i in range(n)]
+        docs = [f"document {i}" for i in range(n)]
+        metas = [{"file": f"file-{i % 50}", "folder": f"folder-{i % 5}"} for i in range(n)]
+
+        start = time.perf_counter()
+        for s in range(0, n, batch):
+            backend.upsert(ids[s : s + batch], docs[s : s + batch], metas[s : s + batch], vectors[s : s + batch].tolist())
+        backend.flush()
+        ingest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        make_backend(kind, path, hnsw_threshold).count()
+        load = time.perf_counter() - start
+
+        def latency(where):
+            samples = []
+            for q in queries:
+                t = time.perf_counter()
+                backend.query([q.tolist()], k, where)
+                samples.append((time.perf_counter() - t) * 1000)
+            samples.sort()
+            return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+        # first query builds lazy structures (e.g. the hnsw index)
+        backend.query([queries[0].tolist()], k)
+        p50, p95 = latency(None)
+        fp50, fp95 = latency({"folder": "folder-1"})
+        return {
+            "ingest_docs_per_s": round(n / ingest),
+            "load_s": round(load, 3),
+            "query_p50_ms": round(p50, 2),
+            "query_p95_ms": round(p95, 2),
+            "filtered_p50_ms": round(fp50, 2),
+            "filtered_p95_ms": round(fp95, 2),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--hnsw-threshold", type=int, default=20000)
+    parser.add_argument("--backends", default="numpy,chroma")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.docs, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    for kind in args.backends.split(","):
+        try:
+            result = run(kind, vectors, queries, args.batch, args.k, args.hnsw_threshold)
+        except ImportError as e:
+            print(f"{kind:>6}: skipped ({e})")
+            continue
+        print(f"{kind:>6}: " + ", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
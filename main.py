@@ -35,8 +35,13 @@ async def generate_report(query, planner: Planner, agents: list[Agent]):
     return report
 
 from src.api.app import router  # Import the router with all your routes
+from src.browser.pool import get_browser_pool
+from src.browser.http_client import close_http_client
+from src.model.client_pool import get_client_pool
+from src.RAG.ingest import close_ingestion_queues
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
 STEP = 10
 import logging
@@ -46,15 +51,30 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] - %(message)s",
 )
+logger = logging.getLogger(__name__)
 
 # DON'T create a new router here - use the imported one
 # router = APIRouter()  # ← Remove this line!
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm up the shared browser so the first search does not pay the cold start
+    try:
+        await get_browser_pool().warm_up()
+    except Exception as e:
+        logger.warning(f"browser warm up failed: {e}")
+    yield
+    await get_browser_pool().close()
+    await close_http_client()
+    await get_client_pool().aclose()
+    close_ingestion_queues()
+
 # Create FastAPI app
 app = FastAPI(
     title="Your API",
     description="API Documentation", 
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Include the imported router (which has all your routes)
@@ -0,0 +1,418 @@
+"""
+Storage backends behind VectorSearch
+
+    - ChromaBackend: chromadb.PersistentClient (default)
+    - NumpyBackend: in process, no external service. Unit normalised float32
+      matrix in a .npy file (memory mapped on load), cosine top-k with one matrix
+      product, an HNSW index (hnswlib, shipped with chromadb) once the collection
+      is larger than hnsw_threshold. Changes are kept in memory and written by
+      flush(), or once save_every rows changed.
+Backends store precomputed embeddings, VectorSearch does the embedding.
+query() returns the chroma shape so callers do not depend on the backend:
+    {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+"""
+
+from abc import ABC, abstractmethod
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VectorBackend(ABC):
+    @abstractmethod
+    def upsert(
+        self,
+        ids: list[str],
+        documents: list[str],
+        metadatas: list[dict] | None,
+        embeddings: list,
+    ):
+        pass
+
+    @abstractmethod
+    def delete(self, ids: list[str]):
+        pass
+
+    @abstractmethod
+    def query(self, embeddings: list, k: int, where: dict = None) -> dict:
+        pass
+
+    @abstractmethod
+    def get(self, ids: list[str] = None) -> dict:
+        """
+        {"ids": [...], "documents": [...], "metadatas": [...]}, everything when ids is None
+        """
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+    def max_batch_size(self) -> int:
+        return 5000
+
+    def flush(self):
+        """
+        write pending changes, backends that persist every change do nothing
+        """
+        pass
+
+
+class ChromaBackend(VectorBackend):
+    def __init__(self, path: str, name: str, embedding):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.name = name
+        self.embedding = embedding
+        self.client = chromadb.PersistentClient(
+            path=path, settings=Settings(allow_reset=True)
+        )
+        try:
+            self.collection = self.client.get_collection(
+                name=name, embedding_function=embedding
+            )
+        except:
+            self.collection = self.client.create_collection(
+                name=name, embedding_function=embedding
+            )
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        kwargs = {"documents": documents, "ids": ids, "embeddings": embeddings}
+        if metadatas != None:
+            kwargs["metadatas"] = metadatas
+        self.collection.upsert(**kwargs)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def query(self, embeddings, k, where=None):
+        return self.collection.query(query_embeddings=embeddings, n_results=k, where=where)
+
+    def get(self, ids=None):
+        return self.collection.get(ids=ids, include=["documents", "metadatas"])
+
+    def count(self):
+        return self.collection.count()
+
+    def reset(self):
+        self.client.reset()
+        self.collection = self.client.create_collection(
+            name=self.name, embedding_function=self.embedding
+        )
+
+    def max_batch_size(self):
+        return self.client.get_max_batch_size()
+
+
+def matches(metadata: dict, where: dict | None) -> bool:
+    """
+    the subset of chroma's where filter used here:
+    {"file": x}, {"file": {"$eq": x}}, {"$ne"}, {"$in": [...]}, {"$nin": [...]},
+    {"$and": [...]}, {"$or": [...]}
+    """
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, c) for c in cond):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+            for op, expected in cond.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+    return True
+
+
+class NumpyBackend(VectorBackend):
+    """
+    <path>/<name>.json holds ids, documents, metadatas and the name of the vector
+    file. New vectors are written to a fresh .npy file first and the json is
+    replaced last (os.replace), so a crash never leaves a half written index.
+    Vectors live in a buffer with spare rows, so an upsert does not copy the
+    whole matrix; the file on disk is only rewritten by flush().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        hnsw_threshold: int = 20000,
+        save_every: int = 10000,
+    ):
+        self.path = path
+        self.name = name
+        self.hnsw_threshold = hnsw_threshold
+        self.save_every = save_every
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, f"{name}.json")
+
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.metadatas: list[dict] = []
+        # rows [0, len(ids)) are in use, memory mapped until the first change
+        self._matrix = None
+        self._vector_file = None
+        self._index: dict[str, int] = {}
+        self._hnsw = None
+        self._unsaved = 0
+        # where filter -> matching rows, valid until the next change
+        self._filter_cache: dict[str, np.ndarray] = {}
+        # queries run in worker threads while upsert / delete change the rows
+        self._lock = threading.RLock()
+        self._load()
+
+    @property
+    def vectors(self):
+        if self._matrix is None or not self.ids:
+            return None
+        return self._matrix[: len(self.ids)]
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.documents = meta["documents"]
+        self.metadatas = meta["metadatas"]
+        self._vector_file = meta.get("vectors")
+        if self._vector_file:
+            # memory mapped, pages are read on first use
+            self._matrix = np.load(
+                os.path.join(self.path, self._vector_file), mmap_mode="r"
+            )
+        self._index = {id: i for i, id in enumerate(self.ids)}
+
+    def _save(self):
+        vector_file = None
+        if self.vectors is not None:
+            vector_file = f"{self.name}.{uuid.uuid4().hex[:8]}.npy"
+            np.save(os.path.join(self.path, vector_file), self.vectors)
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ids": self.ids,
+                    "documents": self.documents,
+                    "metadatas": self.metadatas,
+                    "vectors": vector_file,
+                },
+                f,
+            )
+        os.replace(tmp, self._meta_path)
+        old = self._vector_file
+        self._vector_file = vector_file
+        if old and old != vector_file:
+            try:
+                os.remove(os.path.join(self.path, old))
+            except OSError:
+                pass
+
+    def flush(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+                self._unsaved = 0
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        m = np.asarray(embeddings, dtype=np.float32)
+        if m.ndim == 1:
+            m = m.reshape(1, -1)
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return m / norms
+
+    def _reserve(self, rows: int, dim: int) -> np.ndarray:
+        """
+        writable buffer with room for rows vectors, grown by half when full
+        """
+        matrix = self._matrix
+        if matrix is not None and matrix.flags.writeable and len(matrix) >= rows:
+            return matrix
+        n = len(self.ids)
+        buffer = np.empty((max(rows, n + n // 2, 256), dim), dtype=np.float32)
+        if matrix is not None and n:
+            buffer[:n] = matrix[:n]
+        self._matrix = buffer
+        return buffer
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        new = self._normalize(embeddings)
+        if len(new) != len(ids):
+            raise ValueError(f"{len(ids)} ids but {len(new)} embeddings")
+        with self._lock:
+            if self.vectors is not None and new.shape[1] != self._matrix.shape[1]:
+                # checked before anything changes, ids and vectors stay in sync
+                raise ValueError(
+                    f"embedding dimension {new.shape[1]} does not match "
+                    f"the collection ({self._matrix.shape[1]})"
+                )
+            if metadatas == None:
+                metadatas = [{} for _ in ids]
+            base = len(self.ids)
+            updated: dict[int, int] = {}
+            # new id -> batch row, the same id twice in one batch: the last one wins
+            appended: dict[str, int] = {}
+            for row, id in enumerate(ids):
+                i = self._index.get(id)
+                if i is None:
+                    appended[id] = row
+                else:
+                    updated[i] = row
+
+            matrix = self._reserve(base + len(appended), new.shape[1])
+            for i, row in updated.items():
+                matrix[i] = new[row]
+                self.documents[i] = documents[row]
+                self.metadatas[i] = metadatas[row] or {}
+            rows = list(appended.values())
+            if rows:
+                matrix[base : base + len(rows)] = new[rows]
+                self.documents.extend(documents[row] for row in rows)
+                self.metadatas.extend(metadatas[row] or {} for row in rows)
+                for n, id in enumerate(appended):
+                    self._index[id] = base + n
+                self.ids.extend(appended)
+            self._update_hnsw(list(updated) + list(range(base, len(self.ids))))
+            self._changed(len(ids))
+
+    def delete(self, ids):
+        with self._lock:
+            drop = {self._index[id] for id in ids if id in self._index}
+            if not drop:
+                return
+            keep = [i for i in range(len(self.ids)) if i not in drop]
+            self._matrix = np.array(self.vectors[keep]) if keep else None
+            self.ids = [self.ids[i] for i in keep]
+            self.documents = [self.documents[i] for i in keep]
+            self.metadatas = [self.metadatas[i] for i in keep]
+            self._index = {id: i for i, id in enumerate(self.ids)}
+            # rows moved, the index is rebuilt on the next query
+            self._hnsw = None
+            self._changed(len(drop))
+
+    def _changed(self, rows: int):
+        self._filter_cache = {}
+        self._unsaved += rows
+        if self._unsaved >= self.save_every:
+            self.flush()
+
+    def _update_hnsw(self, labels: list[int]):
+        if self._hnsw is None or not labels:
+            return
+        if len(self.ids) > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(len(self.ids), 2 * self._hnsw.get_max_elements()))
+        # an existing label is updated in place
+        self._hnsw.add_items(self._matrix[labels], np.asarray(labels))
+
+    def _filter_rows(self, where: dict) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True, default=str)
+        rows = self._filter_cache.get(key)
+        if rows is None:
+            rows = np.array(
+                [i for i, m in enumerate(self.metadatas) if matches(m, where)],
+                dtype=np.int64,
+            )
+            if len(self._filter_cache) > 256:
+                self._filter_cache = {}
+            self._filter_cache[key] = rows
+        return rows
+
+    def _get_hnsw(self):
+        if self._hnsw is None:
+            try:
+                import hnswlib
+            except ImportError:
+                return None
+            index = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+            index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+            index.add_items(np.asarray(self.vectors), np.arange(len(self.ids)))
+            index.set_ef(100)
+            self._hnsw = index
+        return self._hnsw
+
+    def query(self, embeddings, k, where=None):
+        queries = self._normalize(embeddings)
+        with self._lock:
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if self.vectors is None or not self.ids:
+                for key in result:
+                    result[key] = [[] for _ in range(len(queries))]
+                return result
+
+            rows = self._filter_rows(where) if where else None
+            n = len(self.ids) if rows is None else len(rows)
+            k = min(k, n)
+
+            hnsw = self._get_hnsw() if len(self.ids) >= self.hnsw_threshold else None
+            for q in queries:
+                if k == 0:
+                    top, scores = [], []
+                elif hnsw is not None and rows is None:
+                    labels, distances = hnsw.knn_query(q, k=k)
+                    top = labels[0].tolist()
+                    scores = (1.0 - distances[0]).tolist()
+                else:
+                    # filtered queries scan the (small) filtered subset exactly
+                    matrix = self.vectors if rows is None else self.vectors[rows]
+                    sims = matrix @ q
+                    best = np.argpartition(-sims, k - 1)[:k]
+                    best = best[np.argsort(-sims[best])]
+                    top = best.tolist() if rows is None else rows[best].tolist()
+                    scores = sims[best].tolist()
+                result["ids"].append([self.ids[i] for i in top])
+                result["documents"].append([self.documents[i] for i in top])
+                result["metadatas"].append([self.metadatas[i] for i in top])
+                result["distances"].append([1.0 - s for s in scores])
+            return result
+
+    def get(self, ids=None):
+        with self._lock:
+            rows = (
+                range(len(self.ids))
+                if ids is None
+                else [self._index[id] for id in ids if id in self._index]
+            )
+            return {
+                "ids": [self.ids[i] for i in rows],
+                "documents": [self.documents[i] for i in rows],
+                "metadatas": [self.metadatas[i] for i in rows],
+            }
+
+    def count(self):
+        return len(self.ids)
+
+    def reset(self):
+        with self._lock:
+            self.ids, self.documents, self.metadatas = [], [], []
+            self._matrix = None
+            self._index = {}
+            self._hnsw = None
+            self._filter_cache = {}
+            self._save()
+            self._unsaved = 0
@@ -0,0 +1,134 @@
+"""
+Incremental BM25 keyword index kept next to the vector db
+
+An inverted index in SQLite (term -> chunk, term frequency), updated on every
+upsert / delete of VectorSearch, so keyword search never rebuilds the index and
+survives restarts. Scored with Okapi BM25 at query time.
+"""
+
+from collections import Counter
+import json
+import math
+import os
+import sqlite3
+import threading
+
+from ..browser.prune import TOKENIZER_VERSION, tokenize
+from .backend import matches
+
+
+class BM25Index:
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_id ON postings (id);
+            """
+        )
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != TOKENIZER_VERSION:
+            # terms of another tokenizer never match, VectorSearch refills an empty index
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+        self._conn.commit()
+
+    def _remove(self, ids: list[str]):
+        # caller holds the lock
+        self._conn.executemany("DELETE FROM postings WHERE id = ?", [(i,) for i in ids])
+        self._conn.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in ids])
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict] = None):
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            self._remove(ids)
+            for id, document, metadata in zip(ids, documents, metadatas):
+                terms = Counter(tokenize(document))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO docs (id, length, metadata) VALUES (?, ?, ?)",
+                    (id, sum(terms.values()), json.dumps(metadata or {})),
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                    [(term, id, tf) for term, tf in terms.items()],
+                )
+            self._conn.commit()
+
+    def remove(self, ids: list[str]):
+        with self._lock:
+            self._remove(ids)
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+
+    def search(self, query: str, k: int, where: dict = None) -> list[tuple[str, float]]:
+        """
+        Return:
+            [(chunk id, bm25 score)] best first, only chunks matching a query term
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+            ).fetchone()
+            if n == 0:
+                return []
+            avg_length = (total / n) or 1
+            placeholders = ",".join("?" * len(terms))
+            df = dict(
+                self._conn.execute(
+                    f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term",
+                    tuple(terms),
+                ).fetchall()
+            )
+            rows = self._conn.execute(
+                f"""
+                SELECT p.term, p.id, p.tf, d.length, d.metadata
+                FROM postings p JOIN docs d ON d.id = p.id
+                WHERE p.term IN ({placeholders})
+                """,
+                tuple(terms),
+            ).fetchall()
+
+        idf = {
+            term: math.log(1 + (n - count + 0.5) / (count + 0.5))
+            for term, count in df.items()
+        }
+        scores: dict[str, float] = {}
+        allowed: dict[str, bool] = {}
+        for term, id, tf, length, metadata in rows:
+            if where:
+                if id not in allowed:
+                    allowed[id] = matches(json.loads(metadata or "{}"), where)
+                if not allowed[id]:
+                    continue
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[id] = scores.get(id, 0.0) + idf[term] * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda s: s[1], reverse=True)[:k]
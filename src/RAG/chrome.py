@@ -1,42 +1,129 @@
-import chromadb
-from chromadb.utils.embedding_functions.ollama_embedding_function import (
-    OllamaEmbeddingFunction,
-)
-from chromadb.config import Settings
+import os
+
+from .backend import ChromaBackend, NumpyBackend, VectorBackend
+from .bm25 import BM25Index
+from .embedding import get_embedding_function
 
 
 class VectorSearch:
+    """
+    Args:
+        model: ollama embedding model
+        name: collection name
+        path: storage folder
+        backend: "chroma" or "numpy" (in process), default config "vector_backend"
+    """
+
     def __init__(
         self,
         model: str = "nomic-embed-text:latest",
         name="new_collection",
         path: str = "./db",
+        backend: str = None,
     ):
         self.name = name
-        self.client = chromadb.PersistentClient(
-            path=path, settings=Settings(allow_reset=True)
-        )
-        self.embedding = OllamaEmbeddingFunction(
-            url="http://localhost:11434", model_name=model
-        )
-        try:
-            self.collection = self.client.get_collection(name=name)
-        except:
-            self.collection = self.client.create_collection(
-                name=name, embedding_function=self.embedding
+        self.model = model
+        # batched and cached on disk, see embedding.py
+        self.embedding = get_embedding_function(model)
+        self.backend = self._create_backend(backend, path)
+        # keyword index for hybrid retrieval, updated with every change
+        self.keyword = BM25Index(os.path.join(path, f"{name}_bm25.db"))
+        if self.keyword.count() == 0 and self.backend.count() > 0:
+            # db filled before the keyword index existed
+            existing = self.backend.get()
+            self.keyword.add(existing["ids"], existing["documents"], existing["metadatas"])
+
+    def _create_backend(self, backend: str, path: str) -> VectorBackend:
+        from ..utils import config_section
+
+        conf = config_section("vector_backend")
+        backend = backend or conf.get("type", "chroma")
+        if backend == "numpy":
+            return NumpyBackend(
+                path,
+                self.name,
+                hnsw_threshold=conf.get("hnsw_threshold", 20000),
+                save_every=conf.get("save_every", 10000),
             )
+        return ChromaBackend(path, self.name, self.embedding)
 
     def add_document(self, documents: str, id: str, metadatas: None = None):
-        if metadatas == None:
-            self.collection.add(documents=documents, ids=id)
-        else:
-            self.collection.add(documents=documents, ids=id, metadatas=metadatas)
+        documents = [documents] if isinstance(documents, str) else documents
+        ids = [id] if isinstance(id, str) else id
+        if isinstance(metadatas, dict):
+            metadatas = [metadatas]
+        self.upsert_documents(documents, ids, metadatas)
+
+    def add_documents(
+        self,
+        documents: list[str],
+        ids: list[str],
+        metadatas: list[dict] = None,
+        batch_size: int = None,
+    ):
+        """
+        bulk add (upsert): embedded in batches of batch_size (config "embedding"
+        by default) with concurrent requests, already known texts come from the
+        embedding cache
+        """
+        if not ids:
+            return
+        embeddings = self.embedding.embed(documents, batch_size)
+        step = self.backend.max_batch_size()
+        for start in range(0, len(ids), step):
+            end = start + step
+            self.upsert_documents(
+                documents[start:end],
+                ids[start:end],
+                None if metadatas == None else metadatas[start:end],
+                embeddings[start:end],
+            )
+        self.flush()
+
+    def upsert_documents(
+        self,
+        documents: list[str],
+        ids: list[str],
+        metadatas: list[dict] = None,
+        embeddings: list[list[float]] = None,
+    ):
+        """
+        embeddings: precomputed embeddings, embedded here when None
+        """
+        if not ids:
+            return
+        if embeddings == None:
+            embeddings = self.embedding(documents)
+        self.backend.upsert(ids, documents, metadatas, embeddings)
+        self.keyword.add(ids, documents, metadatas)
+
+    def flush(self):
+        """
+        persist the changes the backend still holds in memory
+        """
+        self.backend.flush()
+
+    def delete(self, ids: list[str]):
+        if ids:
+            self.backend.delete(ids)
+            self.keyword.remove(ids)
+
+    def get(self, ids: list[str]) -> dict:
+        return self.backend.get(ids)
+
+    def count(self) -> int:
+        return self.backend.count()
+
+    def query(self, query: str, k: int, where: dict = None):
+        """
+        where: metadata filter, e.g. {"file": path} or {"folder": folder}
+        """
+        queries = [query] if isinstance(query, str) else query
+        return self.backend.query(self.embedding(queries), k, where)
 
-    def query(self, query: str, k: int):
-        return self.collection.query(query_texts=query, n_results=k)
+    def keyword_search(self, query: str, k: int, where: dict = None) -> list[tuple[str, float]]:
+        return self.keyword.search(query, k, where)
 
     def reset(self):
-        self.client.reset()
-        self.collection = self.client.create_collection(
-            name=self.name, embedding_function=self.embedding
-        )
+        self.backend.reset()
+        self.keyword.clear()
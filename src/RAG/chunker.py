@@ -0,0 +1,164 @@
+"""
+Markdown aware chunker shared by RAG_agent (ingestion), LocalRAG and Summary
+
+Chunks are slices of the original text, cut on paragraph boundaries where possible:
+    - a markdown heading always starts a new chunk (no overlap across sections)
+    - paragraphs are packed until a chunk reaches size units
+    - a paragraph longer than size is cut into size-unit pieces
+    - consecutive chunks of a section share overlap units
+Units are characters (unit="char") or whitespace separated tokens (unit="token").
+The text is scanned once and only sliced, so time and memory grow linearly with
+the document. Chunk ids are content hashes, stable across runs.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Iterator
+import hashlib
+import re
+
+PARAGRAPH_PATTERN = re.compile(r"\n[ \t]*\n")
+HEADING_PATTERN = re.compile(r"#{1,6}\s")
+TOKEN_PATTERN = re.compile(r"\S+")
+
+
+class Chunk:
+    def __init__(self, id: str, text: str, index: int, start: int, end: int, heading: str):
+        self.id = id
+        self.text = text
+        self.index = index
+        # character offsets in the source text
+        self.start = start
+        self.end = end
+        # closest markdown heading above the chunk, "" if none
+        self.heading = heading
+
+
+class _Units:
+    """
+    measure / move by units between character offsets of the text
+    """
+
+    def __init__(self, text: str, unit: str):
+        if unit not in ("char", "token"):
+            raise ValueError(f"unknown chunk unit {unit}")
+        self.tokens = unit == "token"
+        self.size = len(text)
+        if self.tokens:
+            spans = [(m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+            self.starts = [s for s, _ in spans]
+            self.ends = [e for _, e in spans]
+
+    def length(self, start: int, end: int) -> int:
+        if not self.tokens:
+            return end - start
+        return bisect_right(self.ends, end) - bisect_left(self.starts, start)
+
+    def forward(self, start: int, n: int) -> int:
+        """offset after n units from start"""
+        if not self.tokens:
+            return min(start + n, self.size)
+        i = bisect_left(self.starts, start) + n - 1
+        return self.ends[i] if i < len(self.ends) else self.size
+
+    def back(self, end: int, n: int) -> int:
+        """offset of the n-th unit before end"""
+        if not self.tokens:
+            return max(end - n, 0)
+        i = bisect_right(self.ends, end) - n
+        return self.starts[max(i, 0)] if self.starts else 0
+
+
+def _blocks(text: str) -> Iterator[tuple[int, int]]:
+    start = 0
+    for m in PARAGRAPH_PATTERN.finditer(text):
+        yield start, m.start()
+        start = m.end()
+    yield start, len(text)
+
+
+def iter_chunks(
+    text: str,
+    size: int = 1500,
+    overlap: int = 150,
+    unit: str = "char",
+    source: str = "",
+) -> Iterator[Chunk]:
+    """
+    Args:
+        text: markdown / plain text
+        size: max units per chunk
+        overlap: units repeated at the start of the next chunk of the same section
+        unit: "char" or "token"
+        source: e.g. the file path, part of the id so equal text in two files
+                gets two ids
+    """
+    size = max(1, size)
+    overlap = min(max(0, overlap), size // 2)
+    units = _Units(text, unit)
+    seen_ids: dict[str, int] = {}
+    index = 0
+    heading = ""
+
+    def emit(start: int, end: int):
+        nonlocal index
+        piece = text[start:end].strip()
+        if not piece:
+            return None
+        digest = hashlib.sha256(f"{source}\0{piece}".encode("utf-8")).hexdigest()[:32]
+        # the same text twice in one source still needs two ids
+        n = seen_ids.get(digest, 0)
+        seen_ids[digest] = n + 1
+        chunk = Chunk(digest if n == 0 else f"{digest}-{n}", piece, index, start, end, heading)
+        index += 1
+        return chunk
+
+    cur_start = None
+    cur_end = 0
+    for block_start, block_end in _blocks(text):
+        if not text[block_start:block_end].strip():
+            continue
+        is_heading = HEADING_PATTERN.match(text, block_start) is not None
+        if is_heading and cur_start is not None:
+            chunk = emit(cur_start, cur_end)
+            if chunk:
+                yield chunk
+            cur_start = None
+        if is_heading:
+            line_end = text.find("\n", block_start, block_end)
+            heading = text[block_start : block_end if line_end < 0 else line_end].lstrip("#").strip()
+
+        if cur_start is not None and units.length(cur_start, block_end) > size:
+            chunk = emit(cur_start, cur_end)
+            if chunk:
+                yield chunk
+            # carry the tail of the previous chunk over
+            cur_start = units.back(cur_end, overlap) if overlap else None
+            if cur_start is not None and units.length(cur_start, block_end) > size:
+                cur_start = None
+
+        if cur_start is None:
+            cur_start = block_start
+        # cut paragraphs that do not fit in one chunk
+        while units.length(cur_start, block_end) > size:
+            end = units.forward(cur_start, size)
+            chunk = emit(cur_start, end)
+            if chunk:
+                yield chunk
+            next_start = units.back(end, overlap) if overlap else end
+            cur_start = next_start if next_start > cur_start else end
+        cur_end = block_end
+
+    if cur_start is not None:
+        chunk = emit(cur_start, cur_end)
+        if chunk:
+            yield chunk
+
+
+def chunk_text(
+    text: str,
+    size: int = 1500,
+    overlap: int = 150,
+    unit: str = "char",
+    source: str = "",
+) -> list[Chunk]:
+    return list(iter_chunks(text, size, overlap, unit, source))
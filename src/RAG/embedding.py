@@ -0,0 +1,161 @@
+"""
+Batched, cached embedding function for the vector db
+
+Embeddings are stored on disk (SQLite) keyed by (model, sha256(text)), so a chunk
+that was embedded once is never embedded again, also not after a db reset, in an
+other collection or from an other folder. Least recently used ones are dropped
+once the cache outgrows cache_max_bytes.
+Missing texts are sent to Ollama in batches of batch_size, concurrency batches at
+a time.
+"""
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils.embedding_functions.ollama_embedding_function import (
+    OllamaEmbeddingFunction,
+)
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+
+import numpy as np
+
+from ..utils import SQLiteCache, config_section
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SQLiteCache):
+    def __init__(self, path: str = "./cache/embeddings.db", max_bytes: int = 1024 * 1024 * 1024):
+        # shared by the server and the ingestion worker processes
+        super().__init__(
+            path,
+            "embeddings",
+            {"vector": "BLOB NOT NULL"},
+            max_bytes=max_bytes,
+            timeout=30,
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, np.ndarray]:
+        prefix = f"{model}:"
+        rows = self._read([prefix + h for h in hashes], ["vector"])
+        found = {
+            key[len(prefix) :]: np.frombuffer(row[0], dtype=np.float32)
+            for key, row in rows.items()
+        }
+        self.hits += len(found)
+        self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: dict[str, np.ndarray]):
+        self._write(
+            {
+                f"{model}:{h}": {"vector": np.asarray(v, dtype=np.float32).tobytes()}
+                for h, v in vectors.items()
+            }
+        )
+
+    def clear(self, model: str = None):
+        super().clear(None if model is None else f"{model}:")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **super().stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class CachedOllamaEmbedding(EmbeddingFunction[Documents]):
+    """
+    drop in replacement of OllamaEmbeddingFunction for chromadb collections
+    """
+
+    def __init__(
+        self,
+        model: str,
+        url: str = "http://localhost:11434",
+        batch_size: int = 32,
+        concurrency: int = 4,
+        cache: EmbeddingCache = None,
+    ):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self._embed = OllamaEmbeddingFunction(url=url, model_name=model)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed(input)
+
+    def embed(self, input: Documents, batch_size: int = None) -> Embeddings:
+        batch_size = max(1, batch_size or self.batch_size)
+        hashes = [text_hash(text) for text in input]
+        vectors = self.cache.get_many(self.model, hashes) if self.cache else {}
+
+        missing = {}
+        for h, text in zip(hashes, input):
+            if h not in vectors:
+                missing[h] = text
+        if missing:
+            keys = list(missing)
+            batches = [
+                keys[start : start + batch_size]
+                for start in range(0, len(keys), batch_size)
+            ]
+
+            def embed_batch(batch):
+                return dict(
+                    zip(batch, self._embed([missing[h] for h in batch]))
+                )
+
+            new = {}
+            if len(batches) == 1:
+                new.update(embed_batch(batches[0]))
+            else:
+                with ThreadPoolExecutor(min(self.concurrency, len(batches))) as pool:
+                    for result in pool.map(embed_batch, batches):
+                        new.update(result)
+            new = {h: np.asarray(v, dtype=np.float32) for h, v in new.items()}
+            if self.cache:
+                self.cache.put_many(self.model, new)
+            vectors.update(new)
+        return [vectors[h] for h in hashes]
+
+
+_cache: EmbeddingCache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        conf = config_section("embedding")
+        _cache = EmbeddingCache(
+            conf.get("cache_path", "./cache/embeddings.db"),
+            max_bytes=conf.get("cache_max_bytes", 1024 * 1024 * 1024),
+        )
+    return _cache
+
+
+def get_embedding_function(model: str) -> CachedOllamaEmbedding:
+    """
+    configured by "embedding" in config.json
+    {"url": "http://localhost:11434", "batch_size": 32, "concurrency": 4,
+     "cache_path": "./cache/embeddings.db", "cache_max_bytes": 1073741824}
+    """
+    conf = config_section("embedding")
+    return CachedOllamaEmbedding(
+        model,
+        url=conf.get("url", "http://localhost:11434"),
+        batch_size=conf.get("batch_size", 32),
+        concurrency=conf.get("concurrency", 4),
+        cache=get_embedding_cache(),
+    )
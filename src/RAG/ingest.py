@@ -0,0 +1,269 @@
+"""
+Background ingestion of local files into the vector db
+
+Converting documents with MarkItDown and embedding the chunks is slow, so it is
+done in a process pool as soon as a file is uploaded or a folder is selected
+instead of on the first query that needs the files.
+    - workers: convert -> chunk -> embed (batched), returns chunks + embeddings
+    - main process: upserts into the vector db and updates the file manifest
+    - status(): per file "queued" / "processing" / "done" / "failed"
+The vector db mirrors one folder (the selected one, config "db"), like RAG_agent.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import time
+
+from .chrome import VectorSearch
+from .chunker import chunk_text
+from .embedding import get_embedding_function
+from .manifest import FileManifest, file_hash
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _convert_and_embed(filepath: str, model: str, chunk_conf: dict):
+    """
+    runs in a worker process
+    Return:
+        ([(id, text, metadata)], embeddings or None, content hash)
+    """
+    from markitdown import MarkItDown
+
+    digest = file_hash(filepath)
+    markdown = MarkItDown().convert(filepath).markdown
+    chunks = [
+        (
+            c.id,
+            c.text,
+            {
+                "file": filepath,
+                "folder": os.path.dirname(filepath),
+                "chunk": c.index,
+                "heading": c.heading,
+            },
+        )
+        for c in chunk_text(markdown, source=filepath, **chunk_conf)
+    ]
+    texts = [text for _, text, _ in chunks]
+
+    embeddings = None
+    try:
+        # batched, concurrent and cached (shared with the server process)
+        embeddings = [
+            list(map(float, e)) for e in get_embedding_function(model)(texts)
+        ]
+    except Exception as e:
+        # the db embeds the chunks itself on upsert
+        logger.warning(f"embedding {filepath} in worker failed: {e}")
+        embeddings = None
+    return chunks, embeddings, digest
+
+
+class IngestionQueue:
+    def __init__(
+        self,
+        path: str = "./local_db",
+        workers: int = 2,
+        chunk_size: int = 1500,
+        chunk_overlap: int = 150,
+        chunk_unit: str = "char",
+        persist_interval: float = 30,
+    ):
+        self.db = VectorSearch(path=path)
+        self.manifest = FileManifest(os.path.join(path, "manifest.json"))
+        if not self.manifest.exists:
+            # db filled without a manifest can not be updated incrementally
+            self.db.reset()
+        self.workers = max(1, workers)
+        self.chunk_conf = {"size": chunk_size, "overlap": chunk_overlap, "unit": chunk_unit}
+        # the db and the manifest are written together: when the queue drains
+        # or every persist_interval seconds, not after every file
+        self.persist_interval = persist_interval
+        self._persisted_at = time.monotonic()
+
+        self._executor = None
+        self._semaphore = None
+        self._store_lock = asyncio.Lock()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._background: set[asyncio.Task] = set()
+        self._status: dict[str, dict] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: do not fork the threads / sockets of the server process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _set_status(self, filepath: str, status: str, **extra):
+        self._status[filepath] = {"status": status, "updated_at": time.time(), **extra}
+
+    def submit(self, filepath: str) -> asyncio.Future:
+        """
+        queue a file, a file that is already queued is not queued twice
+        """
+        future = self._pending.get(filepath)
+        if future is not None:
+            return future
+        self._set_status(filepath, "queued")
+        future = asyncio.ensure_future(self._ingest(filepath))
+        self._pending[filepath] = future
+        future.add_done_callback(lambda _: self._pending.pop(filepath, None))
+        return future
+
+    async def _ingest(self, filepath: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        async with self._semaphore:
+            self._set_status(filepath, "processing")
+            start = time.monotonic()
+            try:
+                loop = asyncio.get_running_loop()
+                chunks, embeddings, digest = await loop.run_in_executor(
+                    self._get_executor(),
+                    _convert_and_embed,
+                    filepath,
+                    self.db.model,
+                    self.chunk_conf,
+                )
+            except Exception as e:
+                logger.error(f"failed to ingest {filepath}: {e}")
+                self._set_status(filepath, "failed", error=str(e))
+                return
+
+            try:
+                # one writer at a time, off the event loop
+                async with self._store_lock:
+                    try:
+                        await asyncio.to_thread(self._store, filepath, chunks, embeddings, digest)
+                    finally:
+                        if self._persist_due(filepath):
+                            await asyncio.to_thread(self._persist)
+            except Exception as e:
+                logger.error(f"failed to store {filepath}: {e}")
+                self._set_status(filepath, "failed", error=str(e))
+                return
+            self._set_status(
+                filepath,
+                "done",
+                chunks=len(chunks),
+                seconds=round(time.monotonic() - start, 2),
+            )
+
+    def _store(self, filepath: str, chunks: list, embeddings, digest: str):
+        old_ids = self.manifest.remove(filepath)
+        ids = [i for i, _, _ in chunks]
+        try:
+            self.db.upsert_documents(
+                [text for _, text, _ in chunks],
+                ids,
+                [metadata for _, _, metadata in chunks],
+                embeddings=embeddings,
+            )
+        except Exception:
+            self.db.delete(old_ids)
+            raise
+        # the new chunk ids overwrite the old ones, drop the ones left over
+        new_ids = set(ids)
+        self.db.delete([i for i in old_ids if i not in new_ids])
+        self.manifest.set(filepath, ids, digest)
+
+    def _persist_due(self, filepath: str) -> bool:
+        others = [p for p in self._pending if p != filepath]
+        return not others or time.monotonic() - self._persisted_at > self.persist_interval
+
+    def _persist(self):
+        # vectors first: a manifest entry never points at unsaved chunks
+        self.db.flush()
+        self.manifest.save()
+        self._persisted_at = time.monotonic()
+
+    def _sync_folder(self, folder: str) -> tuple[list[str], list[str]]:
+        changed, deleted = self.manifest.scan(folder)
+        for filepath in deleted:
+            logger.info(f"removing the file {filepath}")
+            self.db.delete(self.manifest.remove(filepath))
+        self._persist()
+        return changed, deleted
+
+    async def ingest_folder(self, folder: str):
+        """
+        bring the db in sync with the folder and wait until it is
+        """
+        async with self._store_lock:
+            changed, deleted = await asyncio.to_thread(self._sync_folder, folder)
+        for filepath in deleted:
+            self._status.pop(filepath, None)
+        futures = [self.submit(filepath) for filepath in changed]
+        # files of this folder queued earlier (e.g. an upload) are waited for too
+        prefix = os.path.join(os.path.abspath(folder), "")
+        futures += [
+            f for p, f in self._pending.items()
+            if p not in changed and os.path.abspath(p).startswith(prefix)
+        ]
+        if futures:
+            await asyncio.gather(*futures)
+
+    def schedule_folder(self, folder: str):
+        """
+        ingest_folder without waiting, e.g. right after the folder is selected
+        """
+        task = asyncio.ensure_future(self.ingest_folder(folder))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def status(self, filepath: str = None) -> dict:
+        if filepath is not None:
+            return self._status.get(filepath, {"status": "unknown"})
+        counts = {}
+        for s in self._status.values():
+            counts[s["status"]] = counts.get(s["status"], 0) + 1
+        return {"counts": counts, "files": self._status}
+
+    def close(self):
+        for task in self._background:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        try:
+            self._persist()
+        except Exception as e:
+            logger.error(f"failed to persist the vector db: {e}")
+
+
+_queues: dict[str, IngestionQueue] = {}
+
+
+def get_ingestion_queue(path: str = "./local_db") -> IngestionQueue:
+    """
+    one queue per vector db path, sized by "ingestion" in config.json
+    {"workers": 2, "chunk_size": 1500, "chunk_overlap": 150, "chunk_unit": "char",
+     "persist_interval": 30}
+    """
+    queue = _queues.get(path)
+    if queue is None:
+        from ..utils import config_section
+
+        conf = config_section("ingestion")
+        queue = _queues[path] = IngestionQueue(
+            path=path,
+            workers=conf.get("workers", 2),
+            chunk_size=conf.get("chunk_size", 1500),
+            chunk_overlap=conf.get("chunk_overlap", 150),
+            chunk_unit=conf.get("chunk_unit", "char"),
+            persist_interval=conf.get("persist_interval", 30),
+        )
+    return queue
+
+
+def close_ingestion_queues():
+    for queue in _queues.values():
+        queue.close()
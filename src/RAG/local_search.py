@@ -7,10 +7,9 @@ from openai import OpenAI
 from markitdown import MarkItDown
 
 from .chrome import VectorSearch
+from .chunker import iter_chunks
 from ..model import model
 
-import hashlib
-
 
 class LocalRAG:
     """
@@ -43,30 +42,13 @@ class LocalRAG:
         add_document will add the document to the db, ID with sha256 of content
         """
         text = self.convert_to_markdown(path)
-        words = text.split()
-        patch = []
-        counter = 0
-        arr = []
-
-        for word in words:
-            counter += 1
-            arr.append(word)
-            if counter == k:
-                patch.append(" ".join(arr))
-                arr = []
-                counter = 0
-
-        if counter != 0:
-            patch.append(" ".join(arr))
+        patch = list(iter_chunks(text, size=k, overlap=k // 10, unit="token", source=path))
 
-        # now patch is an array of strings
-        patch_counter = 0  # reset counter for metadata
-        for p in patch:
-            sha_id = hashlib.sha256(p.encode("utf-8")).hexdigest()
-            self.vector_db.add_document(
-                p, sha_id, {"source": path, "patch": patch_counter}
-            )
-            patch_counter += 1
+        self.vector_db.add_documents(
+            [p.text for p in patch],
+            [p.id for p in patch],
+            [{"source": path, "patch": p.index} for p in patch],
+        )
 
     def search_document(self, query: str, k: int = 1):
         return self.vector_db.query(query=query, k=k)
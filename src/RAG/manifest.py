@@ -0,0 +1,99 @@
+"""
+File manifest for incremental indexing of local files
+
+Remembers for every indexed file its size, mtime, content hash and the ids of the
+chunks stored in the vector db, so a folder is only re-indexed for files that were
+added, changed or deleted since the last run.
+Stored as JSON next to the vector db, e.g. ./local_db/manifest.json
+"""
+
+import hashlib
+import json
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(filepath: str) -> str:
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FileManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self.files: dict[str, dict] = {}
+        if self.exists:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"manifest {path} unreadable, re-indexing: {e}")
+                self.exists = False
+
+    def scan(self, root: str) -> tuple[list[str], list[str]]:
+        """
+        Walk the folder and compare it with the manifest.
+        Return:
+            (changed, deleted): files that must be (re)indexed and files that are gone
+        A file whose size / mtime changed but whose content did not is only
+        updated in the manifest.
+        """
+        changed = []
+        seen = set()
+        for dirpath, _, files in os.walk(root):
+            for file in files:
+                filepath = os.path.join(dirpath, file)
+                seen.add(filepath)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                entry = self.files.get(filepath)
+                if (
+                    entry is not None
+                    and entry["size"] == stat.st_size
+                    and entry["mtime"] == stat.st_mtime
+                ):
+                    continue
+                digest = file_hash(filepath)
+                if entry is not None and entry["hash"] == digest:
+                    entry["size"] = stat.st_size
+                    entry["mtime"] = stat.st_mtime
+                    continue
+                changed.append(filepath)
+        deleted = [filepath for filepath in self.files if filepath not in seen]
+        return changed, deleted
+
+    def get(self, filepath: str) -> dict | None:
+        return self.files.get(filepath)
+
+    def set(self, filepath: str, chunk_ids: list[str], digest: str = None):
+        stat = os.stat(filepath)
+        self.files[filepath] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": digest or file_hash(filepath),
+            "chunk_ids": chunk_ids,
+        }
+
+    def remove(self, filepath: str) -> list[str]:
+        """
+        forget the file, return the chunk ids to delete from the db
+        """
+        entry = self.files.pop(filepath, None)
+        return entry["chunk_ids"] if entry else []
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp, self.path)
+        self.exists = True
@@ -0,0 +1,132 @@
+"""
+Hybrid retrieval: BM25 keyword search + vector search, fused with reciprocal rank
+fusion (RRF), optionally reranked by a local cross encoder.
+
+Configured by "retrieval" in config.json
+{
+    "k": 3,                    # chunks returned
+    "vector_k": 10,            # candidates from the vector search
+    "keyword_k": 10,           # candidates from BM25
+    "rrf_k": 60,
+    "max_distance": null,      # drop vector hits further away (cosine distance)
+    "min_keyword_score": 0.0,  # drop BM25 hits with a lower score
+    "rerank_model": null,      # e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    "min_rerank_score": null   # drop reranked chunks with a lower score
+}
+"""
+
+from .chrome import VectorSearch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_rerankers = {}
+
+
+def get_reranker(model: str):
+    """
+    cross encoders are loaded once per process, on first use
+    """
+    if model not in _rerankers:
+        from sentence_transformers import CrossEncoder
+
+        _rerankers[model] = CrossEncoder(model, device="cpu")
+    return _rerankers[model]
+
+
+class HybridRetriever:
+    def __init__(self, db: VectorSearch, conf: dict = None):
+        if conf is None:
+            from ..utils import config_section
+
+            conf = config_section("retrieval")
+        self.db = db
+        self.k = conf.get("k", 3)
+        self.vector_k = conf.get("vector_k", 10)
+        self.keyword_k = conf.get("keyword_k", 10)
+        self.rrf_k = conf.get("rrf_k", 60)
+        self.max_distance = conf.get("max_distance")
+        self.min_keyword_score = conf.get("min_keyword_score", 0.0)
+        self.rerank_model = conf.get("rerank_model")
+        self.min_rerank_score = conf.get("min_rerank_score")
+
+    def retrieve(self, query: str, k: int = None, where: dict = None) -> list[dict]:
+        """
+        Return:
+            [{"id", "document", "metadata", "score", "vector_rank", "keyword_rank"}]
+            best first, at most k ("rerank_score" too when reranking)
+        """
+        k = k or self.k
+        candidates: dict[str, dict] = {}
+
+        def candidate(id: str) -> dict:
+            if id not in candidates:
+                candidates[id] = {
+                    "id": id,
+                    "document": None,
+                    "metadata": {},
+                    "score": 0.0,
+                    "vector_rank": None,
+                    "keyword_rank": None,
+                }
+            return candidates[id]
+
+        vector = self.db.query(query, self.vector_k, where)
+        rank = 0
+        for id, document, metadata, distance in zip(
+            vector["ids"][0],
+            vector["documents"][0],
+            vector["metadatas"][0],
+            vector["distances"][0],
+        ):
+            if self.max_distance is not None and distance > self.max_distance:
+                continue
+            rank += 1
+            c = candidate(id)
+            c["document"] = document
+            c["metadata"] = metadata or {}
+            c["vector_rank"] = rank
+            c["score"] += 1 / (self.rrf_k + rank)
+
+        keyword = [
+            (id, score)
+            for id, score in self.db.keyword_search(query, self.keyword_k, where)
+            if score > self.min_keyword_score
+        ]
+        for rank, (id, _) in enumerate(keyword, start=1):
+            c = candidate(id)
+            c["keyword_rank"] = rank
+            c["score"] += 1 / (self.rrf_k + rank)
+
+        # texts of keyword only hits
+        missing = [id for id, c in candidates.items() if c["document"] is None]
+        if missing:
+            found = self.db.get(missing)
+            for id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                candidates[id]["document"] = document
+                candidates[id]["metadata"] = metadata or {}
+
+        ranked = sorted(
+            (c for c in candidates.values() if c["document"] is not None),
+            key=lambda c: c["score"],
+            reverse=True,
+        )
+        if self.rerank_model and ranked:
+            ranked = self._rerank(query, ranked)
+        return ranked[:k]
+
+    def _rerank(self, query: str, ranked: list[dict]) -> list[dict]:
+        try:
+            scores = get_reranker(self.rerank_model).predict(
+                [(query, c["document"]) for c in ranked]
+            )
+        except Exception as e:
+            logger.warning(f"rerank failed, keeping fused order: {e}")
+            return ranked
+        for c, score in zip(ranked, scores):
+            c["rerank_score"] = float(score)
+        ranked = sorted(ranked, key=lambda c: c["rerank_score"], reverse=True)
+        if self.min_rerank_score is not None:
+            ranked = [c for c in ranked if c["rerank_score"] >= self.min_rerank_score]
+        return ranked
@@ -3,15 +3,22 @@ This file provide method so summaries content with long length with LLM
 """
 
 from ..model import Model
-from ..prompt import summary_prompt
+from ..prompt import summary_prompt, summary_reduce_prompt
+from ..prompt.summary import SUMMARY_PROMPT_VERSION, SUMMARY_REDUCE_PROMPT_VERSION
+from .chunker import iter_chunks
+from .summary_cache import get_summary_cache, content_key, model_name
 
 from pydantic import BaseModel, Field
 
+import asyncio
 import json
+import logging
 import re
 import secrets
 import string
 
+logger = logging.getLogger(__name__)
+
 
 class Summary(object):
     def __init__(self, model: Model, k: int = 10000):
@@ -23,6 +30,9 @@ class Summary(object):
         self.chunks: list[str] = []
 
         self.length = 4
+        # map_reduce: chunks summarised / chunks in the content, and reduce calls that failed
+        self.coverage = (0, 0)
+        self.failed_merges = 0
 
     def summary(self, content: str):
         """
@@ -32,53 +42,129 @@ class Summary(object):
             id , url, title , summary , brief_summary , keywords
         }
         """
-        texts = content.split()
-        counter = 0
-        paragraph = ""
-
-        for text in texts:
-            counter += 1
-            paragraph += text + " "
-            if counter >= self.k:
-                self.chunks.append(paragraph)
-                paragraph = ""
-                counter = 0
-        self.chunks.append(paragraph)
+        cache = get_summary_cache()
+        key = content_key(content)
+        version = f"{SUMMARY_PROMPT_VERSION}:k={self.k}"
+        cached = cache.get(key, model_name(self.model), version)
+        if cached is not None:
+            self.result = cached
+            return self.result
+
+        self.chunks = [
+            c.text for c in iter_chunks(content, size=self.k, overlap=0, unit="token")
+        ]
         for chunk in self.chunks:
             prompt = summary_prompt(chunk, self.db)
             """
             """
-            alphabet = string.ascii_letters + string.digit
-
             r = self.model.completion(prompt)
-            json_str = self.extract_json_from_codeblock(r)
-            if json_str is None:
-                print("No JSON code block found in response")
+            response_obj = self._to_record(r)
+            if response_obj is None:
                 continue
 
-            try:
-                d = json.loads(json_str)
-                rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
-                response_obj = {
-                    "id": rand_id,
-                    "url": d.get("url", ""),
-                    "title": d.get("title", ""),
-                    "summary": d.get("summary", ""),
-                    "brief_summary": d.get("brief_summary", ""),
-                    "keywords": d.get("keywords", []),
-                }
-
-                full_summary = response_obj["summary"]
-                short_summary = response_obj["brief_summary"]
+            short_summary = response_obj["brief_summary"]
 
-                self.db.append(short_summary)
-                self.result.append(response_obj)
+            self.db.append(short_summary)
+            self.result.append(response_obj)
 
-            except:
-                print(f"Failed to parse or validate JSON summary")
+        if self.result:
+            cache.put(key, model_name(self.model), version, self.result)
+        return self.result
 
+    async def map_reduce(
+        self, content: str, k: int = 3000, concurrency: int = 4, fan_in: int = 4
+    ) -> list[dict]:
+        """
+        map: every k word chunk is summarised concurrently, without the summaries of
+        the other chunks in the prompt
+        reduce: fan_in summaries are merged per call, level by level, until one is left
+        A chunk whose summary failed is left out, a failed merge keeps the first
+        summary of its group. self.coverage and self.failed_merges tell how much of
+        the content the result covers, a partial result is not cached.
+        Return:
+            [{id , url, title , summary , brief_summary , keywords}] (one record)
+        """
+        fan_in = max(2, fan_in)
+        cache = get_summary_cache()
+        key = content_key(content)
+        version = f"{SUMMARY_PROMPT_VERSION}+{SUMMARY_REDUCE_PROMPT_VERSION}:k={k}:fan_in={fan_in}"
+        cached = await cache.aget(key, model_name(self.model), version)
+        if cached is not None:
+            self.result = cached
+            return self.result
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def call(prompt: str) -> dict | None:
+            async with semaphore:
+                try:
+                    r = await self.model.acompletion(prompt)
+                except Exception as e:
+                    logger.error(f"summary request failed: {e}")
+                    return None
+            return self._to_record(r)
+
+        self.chunks = [
+            c.text for c in iter_chunks(content, size=k, overlap=0, unit="token")
+        ]
+        records = await asyncio.gather(
+            *[call(summary_prompt(chunk, [])) for chunk in self.chunks]
+        )
+        records = [r for r in records if r is not None]
+        self.coverage = (len(records), len(self.chunks))
+        self.failed_merges = 0
+
+        while len(records) > 1:
+            groups = [records[i : i + fan_in] for i in range(0, len(records), fan_in)]
+            merged = await asyncio.gather(
+                *[
+                    call(summary_reduce_prompt(group)) if len(group) > 1 else _done(group[0])
+                    for group in groups
+                ]
+            )
+            # a failed merge keeps the first summary of its group
+            self.failed_merges += sum(
+                m is None and len(g) > 1 for m, g in zip(merged, groups)
+            )
+            records = [m if m is not None else g[0] for m, g in zip(merged, groups)]
+
+        self.result = records
+        if self.partial:
+            logger.warning(
+                f"map-reduce summary covers {self.coverage[0]}/{self.coverage[1]} chunks, "
+                f"{self.failed_merges} merges failed"
+            )
+        elif self.result:
+            await cache.aput(key, model_name(self.model), version, self.result)
         return self.result
 
+    @property
+    def partial(self) -> bool:
+        """the last map_reduce result misses chunks or merges that failed"""
+        return self.coverage[0] < self.coverage[1] or self.failed_merges > 0
+
+    def _to_record(self, r: str) -> dict | None:
+        json_str = self.extract_json_from_codeblock(r)
+        if json_str is None:
+            print("No JSON code block found in response")
+            return None
+
+        alphabet = string.ascii_letters + string.digits
+        try:
+            d = json.loads(json_str)
+            rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
+            return {
+                "id": rand_id,
+                "url": d.get("url", ""),
+                "title": d.get("title", ""),
+                "summary": d.get("summary", ""),
+                "brief_summary": d.get("brief_summary", ""),
+                "keywords": d.get("keywords", []),
+            }
+        except:
+            print(f"Failed to parse or validate JSON summary")
+            return None
+
     def extract_json_from_codeblock(self, text: str) -> str | None:
         pattern = r"```json\s*(.*?)\s*```"
         match = re.search(pattern, text, re.DOTALL)
@@ -87,6 +173,10 @@ class Summary(object):
         return None
 
 
+async def _done(record: dict) -> dict:
+    return record
+
+
 class _Response(BaseModel):
     full_summary: str
     short_summary: str
@@ -0,0 +1,144 @@
+"""
+Persistent, content addressed store of LLM summaries
+
+The same arxiv paper or news page keeps coming back across research topics, so
+summaries are stored by what was summarised instead of where it came from:
+    key = (sha256 of the content, query bucket or "", model, prompt version)
+    - query bucket: the normalised query terms, for summaries that depend on
+      the query (web pages), "" for query independent ones (pdfs, documents)
+    - prompt version: bump it when a prompt changes so old summaries are not reused
+Entries older than max_age are dropped, then least recently used ones until the
+store fits in max_bytes.
+The async variants (aget, aget_many, aput) run the SQLite work in a thread.
+"""
+
+import asyncio
+import hashlib
+import json
+
+from ..browser.prune import tokenize
+from ..utils import SQLiteCache, config_section
+
+
+def content_key(content: str | bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def query_bucket(query: str | None) -> str:
+    """
+    queries with the same terms (any order, case, stop words) share a bucket
+    """
+    if not query:
+        return ""
+    return " ".join(sorted(set(tokenize(query))))
+
+
+def model_name(model) -> str:
+    try:
+        return f"{type(model).__name__}:{model.get_model()}"
+    except Exception:
+        return type(model).__name__
+
+
+class SummaryCache(SQLiteCache):
+    def __init__(
+        self,
+        path: str = "./cache/summaries.db",
+        max_bytes: int = 50 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+    ):
+        super().__init__(
+            path,
+            "summaries",
+            {"records": "TEXT NOT NULL"},
+            max_bytes=max_bytes,
+            max_age=max_age,
+        )
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, content_hash: str, query: str | None, model: str, version: str) -> str:
+        return hashlib.sha256(
+            "\0".join([content_hash, query_bucket(query), model, version]).encode("utf-8")
+        ).hexdigest()
+
+    def get(
+        self, content_hash: str, model: str, version: str, query: str = None
+    ) -> list[dict] | None:
+        return self.get_many([content_hash], model, version, query)[0]
+
+    def get_many(
+        self, content_hashes: list[str], model: str, version: str, query: str = None
+    ) -> list[list[dict] | None]:
+        """
+        the records of every content hash, None where nothing is stored, in one read
+        """
+        keys = [self._key(h, query, model, version) for h in content_hashes]
+        rows = self._read(list(set(keys)), ["records"])
+        found = [json.loads(rows[key][0]) if key in rows else None for key in keys]
+        hits = sum(r is not None for r in found)
+        self.hits += hits
+        self.misses += len(found) - hits
+        return found
+
+    def put(
+        self,
+        content_hash: str,
+        model: str,
+        version: str,
+        records: list[dict],
+        query: str = None,
+    ):
+        key = self._key(content_hash, query, model, version)
+        self._write({key: {"records": json.dumps(records)}})
+
+    async def aget(
+        self, content_hash: str, model: str, version: str, query: str = None
+    ) -> list[dict] | None:
+        return await asyncio.to_thread(self.get, content_hash, model, version, query)
+
+    async def aget_many(
+        self, content_hashes: list[str], model: str, version: str, query: str = None
+    ) -> list[list[dict] | None]:
+        return await asyncio.to_thread(self.get_many, content_hashes, model, version, query)
+
+    async def aput(
+        self,
+        content_hash: str,
+        model: str,
+        version: str,
+        records: list[dict],
+        query: str = None,
+    ):
+        await asyncio.to_thread(self.put, content_hash, model, version, records, query)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **super().stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache: SummaryCache = None
+
+
+def get_summary_cache() -> SummaryCache:
+    """
+    process wide store, configured by "summary_cache" in config.json
+    {"path": "./cache/summaries.db", "max_bytes": 52428800, "max_age": 2592000}
+    """
+    global _cache
+    if _cache is None:
+        conf = config_section("summary_cache")
+        _cache = SummaryCache(
+            path=conf.get("path", "./cache/summaries.db"),
+            max_bytes=conf.get("max_bytes", 50 * 1024 * 1024),
+            max_age=conf.get("max_age", 30 * 24 * 3600),
+        )
+    return _cache
@@ -39,6 +39,10 @@ class Planner(Agent):
         """
         It should generate a to do list
         and then pass to different agent
+
+        When more than one task is ready at the same time (all of their
+        dependencies are finished) the planner hand back a "PARALLEL" message
+        so that the server can run them concurrently.
         """
         # Initialization
         # only run for oen time
@@ -50,29 +54,32 @@ class Planner(Agent):
                 list(self._output_model.values()),
                 self.query,
             )
-            res = self._model.completion(prompt)
+            res = await self._model.acompletion(prompt)
 
             logger.info(f"get response {res}")
 
             self._response_todo_handler(res)
 
             self.initialize = True
-
-            task = self._todo_list.pop_task()
-            logger.info(f"handling {task.task}")
-
-            obj = {"agent": task.agent, "task": task.task, "data": data}
-            return obj
         else:
             self._response_handler(response)
-            new_task = self._todo_list.pop_task()
-            if new_task == None:
-                logger.info("Terminate processs")
-                obj = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
-            else:
-                obj = {"agent": new_task.agent, "task": new_task.task, "data": data}
-                logger.info(f"handling next obj {obj}")
-            return obj
+            self._todo_list.finish_running()
+
+        tasks = self._todo_list.pop_ready()
+        if not tasks:
+            logger.info("Terminate processs")
+            obj = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
+        elif len(tasks) == 1:
+            obj = {"agent": tasks[0].agent, "task": tasks[0].task, "data": data}
+            logger.info(f"handling next obj {obj}")
+        else:
+            obj = {
+                "agent": "PARALLEL",
+                "task": [{"agent": t.agent, "task": t.task} for t in tasks],
+                "data": data,
+            }
+            logger.info(f"handling {len(tasks)} tasks in parallel {obj['task']}")
+        return obj
 
     def _response_handler(self, response):
         pass
@@ -89,38 +96,86 @@ class Planner(Agent):
         """
         For planner json response should be handling an array []
         add everything into the todo list queue
+
+        Each element may carry an "id" and a "depends_on" list. If the planner
+        does not give any dependency at all we keep the old behaviour and run
+        the tasks one by one in the given order.
         """
         obj = self._extract_response(json_response)
         logger.info(f"handling task {obj}")
-        for response in obj:
+        has_dependency = any("depends_on" in response for response in obj)
+        prev_id = None
+        for i, response in enumerate(obj):
             task = response["task"]
             agent = response["agent"]
-            self._todo_list.add_task(task, agent)
+            task_id = str(response.get("id", i + 1))
+            if has_dependency:
+                depends_on = [str(d) for d in response.get("depends_on") or []]
+            else:
+                depends_on = [] if prev_id is None else [prev_id]
+            self._todo_list.add_task(task, agent, task_id, depends_on)
+            prev_id = task_id
 
 
 """
     Private class to handle as a to do list
     One task --> multiple subtask to correct agent
+    Tasks form a DAG, a task is ready once every task it depends on is finished
 """
 
 
 class _todo:
     def __init__(self):
         self.todo_list = deque()
+        self.running: list[_task] = []
+        self.finished: set[str] = set()
 
-    def add_task(self, task: str, Agent: Agent):
-        self.todo_list.append(_task(task, Agent))
+    def add_task(
+        self, task: str, Agent: Agent, task_id: str = None, depends_on: list[str] = None
+    ):
+        if task_id is None:
+            task_id = str(len(self.todo_list) + len(self.running) + len(self.finished) + 1)
+        self.todo_list.append(_task(task, Agent, task_id, depends_on))
 
     def pop_task(self):
         if self.len() == 0:
             return None
         return self.todo_list.popleft()
 
+    def pop_ready(self) -> list["_task"]:
+        """
+        pop every task whose dependencies are finished, in plan order.
+        Unknown dependency ids are ignored. If nothing is ready but tasks are
+        left (a cycle in the plan) the first one is forced so we never hang.
+        """
+        known = {t.id for t in self.todo_list} | {t.id for t in self.running}
+        ready = [
+            t
+            for t in self.todo_list
+            if all(d in self.finished or d not in known for d in t.depends_on)
+        ]
+        if not ready and self.len() != 0 and not self.running:
+            logger.warning("cycle in task dependencies, forcing the next task")
+            ready = [self.todo_list[0]]
+        for t in ready:
+            self.todo_list.remove(t)
+        self.running.extend(ready)
+        return ready
+
+    def finish_running(self):
+        for t in self.running:
+            self.finished.add(t.id)
+        self.running = []
+
     def len(self):
         return len(self.todo_list)
 
 
 class _task:
-    def __init__(self, task: str, agent: Agent):
+    def __init__(
+        self, task: str, agent: Agent, task_id: str = "", depends_on: list[str] = None
+    ):
         self.task = task
         self.agent = agent
+        self.id = task_id
+        self.depends_on = [d for d in (depends_on or []) if d != task_id]
@@ -1,11 +1,13 @@
 from .agent import Agent
 from ..prompt.reporter import report_prompt, report_plan, report_task
 
-from ..model import Model
+from ..model import Model, Conversation
+from ..utils import read_config
 
 import string
 import secrets
 import json
+import asyncio
 
 import time
 
@@ -15,11 +17,28 @@ logger = logging.getLogger(__name__)
 
 
 class Reporter(Agent):
-    def __init__(self, model: Model):
+    """
+    Args:
+        model: a LLM model
+        parallel: write the planned sections concurrently, default read from config "parallel_report"
+        max_concurrency: max number of sections written at the same time, default read from config "report_concurrency"
+    """
+
+    def __init__(self, model: Model, parallel: bool = None, max_concurrency: int = None):
         self.model: Model = model
+        # the planning turn, every section starts from a copy of it
+        self.conversation = Conversation()
         self.todo = []
         self.db = None
 
+        config = read_config()
+        self.parallel = config.get("parallel_report", False) if parallel is None else parallel
+        self.max_concurrency = (
+            config.get("report_concurrency", 4) if max_concurrency is None else max_concurrency
+        )
+        # async callback (index, section) called once a section and every section before it is written
+        self.section_handler = None
+
         self.description = "generateing report"
 
         self.source = {}
@@ -30,6 +49,9 @@ class Reporter(Agent):
     def set_name(self, name):
         self.name = name
 
+    def set_section_handler(self, handler):
+        self.section_handler = handler
+
     async def run(self, query: str, data=None):
         """
         based on query and data to write a response
@@ -50,7 +72,7 @@ class Reporter(Agent):
 
         logger.info(f"handling tasks {tasks}")
 
-        r = self._task_handler(tasks)
+        r = await self._task_handler(tasks)
 
         logger.info(f"response {r}")
 
@@ -102,38 +124,68 @@ class Reporter(Agent):
     async def _planner(self, query, db=None):
         print("planning what to write")
         prompt = report_plan(query, db)
-        res = self.model.completion(prompt)
+        self.conversation = Conversation()
+        res = await self.model.acompletion(prompt, self.conversation)
         return res
 
-    def _task_handler(self, tasks):
-        i = 0
+    async def _task_handler(self, tasks):
+        """
+        Write every planned section and join them in plan order.
+        Each section is written on its own copy of the planning conversation,
+        so sections never see each other's prompts or replies. In parallel
+        mode sections are generated concurrently (bounded by max_concurrency)
+        but still joined and handed to section_handler in plan order, so the
+        report does not depend on the mode or on which section finishes first.
+        """
+        jobs = []
+        if self.parallel:
+            semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+
+            async def write(task):
+                async with semaphore:
+                    return await self._write_section(tasks, task)
+
+            jobs = [asyncio.create_task(write(task)) for task in tasks]
+
         final_report = ""
-        for task in tasks:
-            t = task.get("task", "")
-            data = task.get("data", "")
+        try:
+            for i, task in enumerate(tasks):
+                if self.parallel:
+                    content = await jobs[i]
+                else:
+                    content = await self._write_section(tasks, task)
+                section = "\n" + content
+                final_report += section
+                logger.info("final report ... ")
+                if self.section_handler is not None:
+                    await self.section_handler(i, section)
+        finally:
+            for job in jobs:
+                job.cancel()
 
-            logger.info(f"handling task {t}")
+        return final_report
 
-            source = self.get_source(data)
+    async def _write_section(self, tasks, task) -> str:
+        t = task.get("task", "")
+        data = task.get("data", "")
 
-            logger.info(f"reading sources ... {source}")
+        logger.info(f"handling task {t}")
 
-            prompt = report_task(tasks, t, source)
-            res = self.model.completion(prompt)
-            logger.info(f"geting response {res}")
-            res = self._extract_response(res)
+        source = self.get_source(data)
 
-            logger.info(f"getting response {res}")
-            try:
-                final_report += "\n"
-                final_report += res["content"]
-                logger.info(res)
-                logger.info(type(res))
-            except:
-                final_report += ""
-            logger.info("final report ... ")  # maybe yield final report here ?
+        logger.info(f"reading sources ... {source}")
 
-        return final_report
+        prompt = report_task(tasks, t, source)
+        res = await self.model.acompletion(prompt, self.conversation.copy())
+        logger.info(f"geting response {res}")
+        res = self._extract_response(res)
+
+        logger.info(f"getting response {res}")
+        try:
+            content = res["content"]
+        except:
+            return ""
+        return content if isinstance(content, str) else ""
 
     def _get_relevant_data(self):
         pass
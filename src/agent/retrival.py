@@ -1,11 +1,12 @@
-from ..RAG.chrome import VectorSearch
+from ..RAG.ingest import get_ingestion_queue
+from ..RAG.retriever import HybridRetriever
 from .agent import Agent
 from ..model import Model
-from ..prompt import retrieval_prompt
+from ..prompt import retrieval_prompt, retrieval_batch_prompt
+from ..browser.prune import batch_pages
 from ..utils import read_config
 
-from markitdown import MarkItDown
-
+import asyncio
 import os
 import string
 import json
@@ -29,13 +30,17 @@ class RAG_agent(Agent):
     ):
         logger.info("Initalize RAG agent")
         self.model = model
-        self.db = VectorSearch(path=path)
-        # TODO: maybe don't use hard reset ?
-        self.db.reset()
+        # files are converted and embedded by the shared background ingestion queue
+        self.ingestion = get_ingestion_queue(path)
+        self.db = self.ingestion.db
+        # BM25 + vector search, k and thresholds from config "retrieval"
+        self.retriever = HybridRetriever(self.db)
         self.tool_list = ["add_document", "query", "reset"]
 
         config = read_config()
         self.filelist = config.get("db", filelist)
+        # summarise all retrieved chunks in one (or a few concurrent) calls
+        self.batch_conf = config.get("retrieval_batch", {})
 
         self.name = "local-retrieval"
         self.description = "read local files and get summary"
@@ -49,22 +54,19 @@ class RAG_agent(Agent):
         use model to form {} format
         """
         logger.info("retrival running ...")
-        mk = MarkItDown()
-        for root, dirs, files in os.walk(self.filelist):
-            for file in files:
-                logger.info(f"handling the file{file}")
-                self._file_handler(os.path.join(root, file), mk)
-
-        result = self.db.query(task, 2)
-        logger.info(f"get the result {result}")
-        for i, docs in enumerate(result["documents"]):
-
-            """
-            TODO: refactor use localRAG class
-            """
-            file_path = result["metadatas"][0][i]["file"]  # fix: index correctly
-            prompt = retrieval_prompt(docs, file_path)
-            res = self.model.completion(prompt)
+        # only waits for files that are not ingested yet (new / changed ones)
+        await self.ingestion.ingest_folder(self.filelist)
+
+        chunks = await asyncio.to_thread(self.retriever.retrieve, task)
+        logger.info(f"retrieved {[c['id'] for c in chunks]}")
+        if self.batch_conf.get("enabled", True):
+            data.extend(await self._summarise_batched(task, chunks))
+            return {"agent": "planner", "data": data, "task": ""}
+
+        for chunk in chunks:
+            file_path = chunk["metadata"].get("file", "")
+            prompt = retrieval_prompt(chunk["document"], file_path)
+            res = await self.model.acompletion(prompt)
             logger.info(f"response from llm: {res}")
             res = self._extract_response(res)
             logger.info(f"getting response {res}")
@@ -74,6 +76,62 @@ class RAG_agent(Agent):
 
         return {"agent": "planner", "data": data, "task": ""}
 
+    def _group_by_source(self, chunks: list[dict], token_budget: int) -> list[dict]:
+        """
+        chunks (best first) grouped per file, at most token_budget tokens in total
+        (estimated as 4 characters per token)
+        """
+        budget = token_budget * 4
+        sources: dict[str, list[str]] = {}
+        for chunk in chunks:
+            if budget <= 0:
+                break
+            text = chunk["document"][:budget]
+            budget -= len(text)
+            sources.setdefault(chunk["metadata"].get("file", ""), []).append(text)
+        return [
+            {"url": file, "title": "", "content": "\n\n...\n\n".join(texts)}
+            for file, texts in sources.items()
+        ]
+
+    async def _summarise_batched(self, task: str, chunks: list[dict]) -> list[dict]:
+        """
+        one structured request per group of sources instead of one per chunk,
+        returns the same records as the per chunk path (one per source file)
+        """
+        sources = self._group_by_source(chunks, self.batch_conf.get("token_budget", 6000))
+        if not sources:
+            return []
+        batches = batch_pages(
+            sources,
+            batch_chars=self.batch_conf.get("token_budget", 6000) * 4,
+            max_pages=self.batch_conf.get("sources_per_call", 4),
+        )
+        semaphore = asyncio.Semaphore(self.batch_conf.get("concurrency", 3))
+
+        async def summarise(batch: list[dict]) -> list:
+            async with semaphore:
+                try:
+                    res = await self.model.acompletion(retrieval_batch_prompt(task, batch))
+                except Exception as e:
+                    logger.error(f"retrieval summary failed: {e}")
+                    return []
+            logger.info(f"response from llm: {res}")
+            records = self._extract_response(res)
+            if isinstance(records, dict):
+                records = [records]
+            if not isinstance(records, list):
+                return []
+            for i, record in enumerate(records):
+                if isinstance(record, dict) and not record.get("url") and i < len(batch):
+                    record["url"] = batch[i]["url"]
+            return [r for r in records if isinstance(r, dict)]
+
+        results = []
+        for records in await asyncio.gather(*[summarise(b) for b in batches]):
+            results.extend(records)
+        return results
+
     def _json_handler(self, res: str):
         """
         json handler handlers handle json response and then pass it to correct tool
@@ -91,14 +149,3 @@ class RAG_agent(Agent):
 
     def _todo(self, task):
         pass
-
-    def _file_handler(self, filepath, mk: MarkItDown):
-        result = mk.convert(filepath)
-        result = result.markdown
-        temp = ""
-        for i, ch in enumerate(result):
-            temp += ch
-            if i % 1500 == 0 and i != 0:
-                self.db.add_document(temp, str(i), {"file": filepath})
-
-        self.db.add_document(temp, str(len(result) + 1), {"file": filepath})
@@ -8,7 +8,7 @@ from ..browser.crawl_ai import Crawl
 from collections import deque
 import json
 
-import time 
+import asyncio
 
 import logging 
 logger = logging.getLogger(__name__)
@@ -60,7 +60,7 @@ class Search_agent(Agent):
         """
         logger.info("SEARCHER: RUNNING ")
         logger.info(f"{self.todo} testing..")
-        steps =self._plan(task)
+        steps = await self._plan(task)
         tools = {} 
         url_list = []
         cur_task = 0
@@ -96,7 +96,7 @@ class Search_agent(Agent):
     def get_recv_format(self):
         pass
 
-    def _plan(self , task:str , k:int=6):
+    async def _plan(self , task:str , k:int=6):
         """
         Searcher planner
         """
@@ -104,9 +104,9 @@ class Search_agent(Agent):
         logger.info(f"task {task}")
         logger.info(prompt)
 
-        response = self.model.completion(prompt)
+        response = await self.model.acompletion(prompt)
         logger.info(f"searcher response: {response}")
-        time.sleep(3) ## foo foo solution
+        await asyncio.sleep(3) ## foo foo solution
         todo_list = (self._extract_response(response))
         
         logger.info(todo_list)
@@ -6,9 +6,7 @@ from fastapi import UploadFile
 """
 
 
-def select_folder_handler(folder_name: str):
-    folder_path = f"./local_files/{folder_name}"
-
+def select_folder_handler(folder_path: str):
     config = read_config()
     config["db"] = folder_path
 
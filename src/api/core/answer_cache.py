@@ -0,0 +1,200 @@
+"""
+Semantic answer cache for /quick and /stream_completion
+
+Queries are embedded with the MiniLM model of controller/extraction.py. A new
+query whose embedding is close enough (cosine >= threshold) to a query answered
+within the last ttl seconds gets the stored answer (or the stored stream chunks
+replayed) instead of search + completion.
+    - "search:" queries and plain chat queries never share answers
+    - every kind has its own threshold, kinds without one are not cached
+      (plain chat by default, close chat questions often want different answers)
+    - numbers and month names must match exactly: "gdp in 2023" and "gdp in 2024"
+      embed almost the same but must not share an answer
+    - answers are scoped to provider / model
+    - only first messages are cached, follow ups depend on the conversation
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .config import read_config
+
+logger = logging.getLogger(__name__)
+
+SPACES = re.compile(r"\s+")
+NUMBERS = re.compile(r"\d+(?:[.,:/-]\d+)*")
+MONTHS = frozenset(
+    [
+        "january", "february", "march", "april", "may", "june", "july", "august",
+        "september", "october", "november", "december",
+        "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    ]
+)
+
+DEFAULT_THRESHOLDS = {"search": 0.95, "quick": 0.95}
+
+
+def normalize_query(query: str) -> str:
+    query = query.replace("search:", " ")
+    return SPACES.sub(" ", query).strip().lower()
+
+
+def exact_terms(query: str) -> tuple:
+    """
+    the terms of a normalized query that have to match exactly, in order
+    """
+    numbers = NUMBERS.findall(query)
+    months = [w for w in re.findall(r"[a-z]+", query) if w in MONTHS]
+    return tuple(numbers), tuple(months)
+
+
+class _Entry:
+    def __init__(self, kind: str, scope: str, query: str, vector: np.ndarray, answer: Any, latency: float):
+        self.kind = kind
+        self.scope = scope
+        self.query = query
+        self.exact = exact_terms(query)
+        self.vector = vector
+        self.answer = answer
+        self.latency = latency
+        self.created_at = time.time()
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        scope: str,
+        thresholds: Dict[str, float] = None,
+        ttl: float = 600,
+        max_entries: int = 1000,
+    ):
+        """
+        scope: provider / model the answers belong to
+        thresholds: kind -> minimum cosine similarity, kinds not listed are not cached
+        """
+        self.scope = scope
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: List[_Entry] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    async def _embed(self, query: str) -> np.ndarray:
+        from ..controller.extraction import get_model
+
+        def encode():
+            return get_model().encode([query], normalize_embeddings=True)[0]
+
+        return np.asarray(await asyncio.to_thread(encode), dtype=np.float32)
+
+    def caches(self, kind: str) -> bool:
+        return self.thresholds.get(kind) is not None
+
+    async def lookup(self, query: str, kind: str):
+        """
+        Return:
+            (answer or None, embedding): pass the embedding to store() on a miss
+        """
+        if not self.caches(kind):
+            return None, None
+        start = time.perf_counter()
+        normalized = normalize_query(query)
+        exact = exact_terms(normalized)
+        try:
+            vector = await self._embed(normalized)
+        except Exception as e:
+            logger.warning(f"answer cache disabled for this query: {e}")
+            return None, None
+
+        now = time.time()
+        self._entries = [e for e in self._entries if now - e.created_at < self.ttl]
+        candidates = [
+            e for e in self._entries
+            if e.kind == kind and e.scope == self.scope and e.exact == exact
+        ]
+        best = None
+        if candidates:
+            sims = np.stack([e.vector for e in candidates]) @ vector
+            i = int(np.argmax(sims))
+            if sims[i] >= self.thresholds[kind]:
+                best = candidates[i]
+
+        elapsed = time.perf_counter() - start
+        self.lookup_seconds += elapsed
+        if best is None:
+            self.misses += 1
+            return None, vector
+        self.hits += 1
+        self.saved_seconds += max(0.0, best.latency - elapsed)
+        return best.answer, vector
+
+    def store(self, query: str, kind: str, vector: np.ndarray, answer: Any, latency: float):
+        """
+        latency: seconds the answer took, reported as saved on every hit
+        """
+        if vector is None or not self.caches(kind):
+            return
+        self._entries.append(_Entry(kind, self.scope, normalize_query(query), vector, answer, latency))
+        if len(self._entries) > self.max_entries:
+            self._entries = self._entries[-self.max_entries:]
+
+    def clear(self):
+        self._entries = []
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "latency_saved_seconds": round(self.saved_seconds, 2),
+            "avg_lookup_ms": round(self.lookup_seconds / lookups * 1000, 2) if lookups else 0.0,
+            "scope": self.scope,
+            "thresholds": self.thresholds,
+            "ttl": self.ttl,
+        }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_conf: Optional[Dict[str, Any]] = None
+
+
+def get_answer_cache(kind: str = None) -> Optional[SemanticAnswerCache]:
+    """
+    configured by "answer_cache" in config.json, read once until reset_answer_cache()
+    {"enabled": true, "thresholds": {"search": 0.95, "quick": 0.95}, "ttl": 600,
+     "max_entries": 1000}
+    add e.g. "chat": 0.98 to thresholds to cache plain chat answers too
+    None when disabled, or when kind is given and not cached
+    """
+    global _answer_cache, _answer_cache_conf
+    if _answer_cache_conf is None:
+        config = read_config()
+        _answer_cache_conf = config.get("answer_cache", {})
+        if _answer_cache_conf.get("enabled", True):
+            _answer_cache = SemanticAnswerCache(
+                scope=f"{config.get('provider')}:{config.get('model')}",
+                thresholds=_answer_cache_conf.get("thresholds"),
+                ttl=_answer_cache_conf.get("ttl", 600),
+                max_entries=_answer_cache_conf.get("max_entries", 1000),
+            )
+    if _answer_cache is None or (kind is not None and not _answer_cache.caches(kind)):
+        return None
+    return _answer_cache
+
+
+def reset_answer_cache():
+    """drop the cache and its config, e.g. after the provider / model changed"""
+    global _answer_cache, _answer_cache_conf
+    _answer_cache = None
+    _answer_cache_conf = None
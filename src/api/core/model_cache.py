@@ -1,44 +1,65 @@
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from ..core.config import read_config
+from ...model import Model, ResilientModel
+from ...model.client_pool import get_client_pool
+from .answer_cache import reset_answer_cache
 
-# Global model cache to avoid 7+ second model loading
-_model_cache: Dict[str, Any] = {}
 _config_cache: Optional[Dict[str, Any]] = None
 _cache_lock = asyncio.Lock()
 
-async def get_or_create_model():
-    """Get cached model or create new one. Eliminates 7+ second model loading delay."""
-    global _model_cache, _config_cache, _cache_lock
-    
+async def get_cached_config() -> Dict[str, Any]:
+    """config.json, read once until invalidate_models()"""
+    global _config_cache
+
     async with _cache_lock:
-        # Load config once and cache it
         if _config_cache is None:
             _config_cache = await asyncio.to_thread(read_config)
-        
-        # Create cache key
-        cache_key = f"{_config_cache['provider']}_{_config_cache['model']}"
-        
-        # Return cached model if exists
-        if cache_key in _model_cache:
-            return _model_cache[cache_key]
-        
-        # Create new model and cache it
-        from ...factory import Factory
-        model = await asyncio.to_thread(Factory.get_model, _config_cache["provider"], _config_cache["model"])
-        _model_cache[cache_key] = model
-        
-        return model
+        return _config_cache
+
+async def get_selected_model() -> Tuple[str, str]:
+    """(provider, model) from config.json"""
+    config = await get_cached_config()
+    return config["provider"], config["model"]
+
+def build_model(provider: str, model_name: str) -> Model:
+    from ...factory import Factory
+    model = Factory.get_model(provider, model_name)
+    if model is None:
+        raise ValueError(f"unknown model provider {provider}")
+    return model
+
+def build_resilient_model(candidates, conf: dict) -> ResilientModel:
+    model = ResilientModel(candidates, build_model, conf)
+    # fallbacks are built when they are needed, the primary right away
+    model.primary()
+    return model
 
 async def get_user_model():
-    """Create a dedicated model instance for user session"""
-    model = await get_or_create_model()
-    try:
-        # Create a fresh model instance
-        config = await asyncio.to_thread(read_config)
-        from ...factory import Factory
-        user_model = await asyncio.to_thread(Factory.get_model, config["provider"], config["model"])
-        return user_model
-    except:
-        # Fallback: use the cached model
-        return model
+    """Create a dedicated model instance for user session
+
+    The instance only holds the session's messages, its HTTP clients come from
+    the process wide client pool so warm keep alive connections are reused.
+    Wrapped in a ResilientModel unless "resilience.enabled" is false. Building a
+    provider can take seconds, it runs in a thread.
+    """
+    config = await get_cached_config()
+    provider, model_name = config["provider"], config["model"]
+    conf = config.get("resilience", {})
+    if not conf.get("enabled", True):
+        return await asyncio.to_thread(build_model, provider, model_name)
+
+    # retries, deadlines and fallback to the configured providers
+    candidates = [(provider, model_name)]
+    for fallback in conf.get("fallbacks", []):
+        candidate = (fallback["provider"], fallback["model"])
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return await asyncio.to_thread(build_resilient_model, candidates, conf)
+
+def invalidate_models():
+    """Drop the cached config, pooled clients and cached answers after config.json changed"""
+    global _config_cache
+    _config_cache = None
+    get_client_pool().invalidate()
+    reset_answer_cache()
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from ..models.schemas import AgentsRequest
 from ..core.config import read_config, write_config
+from ..core.model_cache import invalidate_models
 
 router = APIRouter()
 
@@ -23,6 +24,7 @@ async def select_agent(body: AgentsRequest):
         config["provider"] = body.provider
         config["model"] = body.model
         write_config(config)
+        invalidate_models()
         
         return {
             "success": True,
@@ -4,6 +4,9 @@ from typing import Optional, List
 import os
 from ..models.schemas import FolderCreateRequest, FolderListResponse
 from ..services.file_service import FileService
+from ..controller.files import select_folder_handler
+from ...RAG.ingest import get_ingestion_queue
+from ...utils import read_config
 
 router = APIRouter()
 file_service = FileService()
@@ -25,6 +28,10 @@ async def select_folder(folder_name: str):
     """Select folder - SAME ENDPOINT"""
     try:
         folder_path = file_service.select_folder(folder_name)
+        # the agents and upload_file read the selected folder from config "db"
+        select_folder_handler(folder_path)
+        # convert and embed the folder now, not on the first query
+        get_ingestion_queue().schedule_folder(folder_path)
         return {"success": True, "selected_folder": folder_name}
     except HTTPException as e:
         raise e
@@ -35,6 +42,11 @@ async def upload_file(file: UploadFile = File(...), filepath: str = Form(...)):
     success = await file_service.upload_file(file, filepath)
     
     if success:
+        full_path = os.path.join(file_service.base_path, filepath)
+        selected = os.path.join(os.path.abspath(read_config().get("db", "./local_files")), "")
+        if os.path.abspath(full_path).startswith(selected):
+            # the vector db only mirrors the selected folder
+            get_ingestion_queue().submit(full_path)
         return {"success": True, "filename": file.filename, "filepath": filepath}
     else:
         return {"success": False, "error": "Upload failed"}
@@ -62,4 +74,12 @@ async def download_file(filepath: str):
             media_type="application/octet-stream"
         )
     except HTTPException as e:
-        raise e
\ No newline at end of file
+        raise e
+
+@router.get("/ingestion_status")
+async def ingestion_status(filepath: Optional[str] = None):
+    """Ingestion status of one file (path as in /upload_file) or of all files"""
+    queue = get_ingestion_queue()
+    if filepath is None:
+        return queue.status()
+    return queue.status(os.path.join(file_service.base_path, filepath))
@@ -2,12 +2,16 @@ from fastapi import APIRouter, Form, File, UploadFile, HTTPException
 from typing import List, Optional
 import json
 import logging
+import time
 from ..models.schemas import Message
 from ..core.config import read_config
+from ..core.answer_cache import get_answer_cache
+from ..core.model_cache import get_user_model
 
 from ...factory import Factory
 from ...generate_report import generate_report
-from ...model import Model
+from ...model import Model, Conversation
+from ...model.ollama import PRIORITY_INTERACTIVE, set_request_priority
 from ...agent import Planner , Agent
 
 router = APIRouter()
@@ -77,6 +81,46 @@ def get_news(category: str):
     res = DuckSearch().today_new(category)
     return {"news": res}
 
+def _stats_sources() -> dict:
+    """name -> stats of a shared cache, pool or provider component"""
+    from ...browser.pool import get_browser_pool
+    from ...browser.content_cache import get_content_cache
+    from ...browser.duckduckgo import get_search_cache, get_host_latency
+    from ...RAG.embedding import get_embedding_cache
+    from ...RAG.summary_cache import get_summary_cache
+    from ...model.client_pool import get_client_pool
+    from ...model.context import context_stats
+    from ...model.resilient import provider_health_stats
+    from ...model.ollama import dispatcher_stats
+
+    def answer_cache():
+        cache = get_answer_cache()
+        return cache.stats() if cache is not None else {"enabled": False}
+
+    return {
+        "browser_pool": lambda: get_browser_pool().stats(),
+        "content_cache": lambda: get_content_cache().stats(),
+        "search_cache": lambda: get_search_cache().stats(),
+        "search_latency": lambda: get_host_latency().stats(),
+        "embedding_cache": lambda: get_embedding_cache().stats(),
+        "summary_cache": lambda: get_summary_cache().stats(),
+        "answer_cache": answer_cache,
+        "model_pool": lambda: get_client_pool().stats(),
+        "context": context_stats,
+        "model_health": provider_health_stats,
+        "ollama_dispatch": dispatcher_stats,
+    }
+
+@router.get("/stats")
+def stats(name: Optional[str] = None):
+    """Stats of every shared cache / pool / provider, or only of ?name="""
+    sources = _stats_sources()
+    if name is None:
+        return {key: source() for key, source in sources.items()}
+    if name not in sources:
+        raise HTTPException(status_code=404, detail=f"unknown stats {name}, one of {sorted(sources)}")
+    return {name: sources[name]()}
+
 @router.get("/messags_record")
 async def get_messages_record():
     """Get messages record - SAME ENDPOINT"""
@@ -90,37 +134,58 @@ async def quick_response_logic(
     api: Optional[str] = None,
 ):
     """Quick response logic - original function"""
-    config = read_config()
-    
-    quick_model: Model = Factory.get_model(config["provider"], config["model"])
-    quick_model.messages = messages[::-1]
+    set_request_priority(PRIORITY_INTERACTIVE)
+    quick_model: Model = await get_user_model()
+    # same layout as /stream_completion: history first, the query last
+    conversation = Conversation(messages[:-1])
     
     if files != None:
         pass  # TODO use mark it down to convert to text and append into the data arr
     
+    # only first questions, answers to follow ups depend on the conversation
+    cache = get_answer_cache("quick") if len(messages) <= 1 and not files else None
+    vector = None
+    if cache is not None:
+        start = time.perf_counter()
+        cached, vector = await cache.lookup(query, "quick")
+        if cached is not None:
+            return cached
+    
     from ...browser.duckduckgo import DuckSearch
     from ...prompt.quick_search import quick_search_prompt
     
-    search_result = await DuckSearch().search_result(query)
+    search_result = await DuckSearch().asearch_result(query)
     prompt = quick_search_prompt(query, search_result)
-    res = quick_model.completion(prompt)
+    res = await quick_model.acompletion(prompt, conversation)
+    if cache is not None and res:
+        cache.store(query, "quick", vector, res, time.perf_counter() - start)
     return res
 
-async def main(query, api: str = None):
-    """Main function - original logic"""
+async def main(query, api: str = None, section_handler=None):
+    """Main function - original logic
+
+    section_handler: optional async callback (index, section) attached to the
+    reporter so finished sections can be streamed while the report is written
+    """
     config = read_config()
     logging.info("finish reading config ...")
     
     
-    m = Factory.get_model(config["provider"], config["model"])
+    # one model per agent for separate messages, the clients are pooled
+    m = await get_user_model()
     planner = Planner(m)
     logging.info("creating agents ... ")
     agents = []
     
     for agent in config["agents"]:
-        m = Factory.get_model(config["provider"], config["model"])
+        m = await get_user_model()
         agents.append(Factory.get_agent(agent, m))
     
+    if section_handler is not None:
+        for agent in agents:
+            if hasattr(agent, "set_section_handler"):
+                agent.set_section_handler(section_handler)
+    
     logging.info(f"finish creating {agents}")
     logging.info("generating report ... ")
     
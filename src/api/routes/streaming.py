@@ -4,10 +4,14 @@ from typing import List, Optional
 import json
 import asyncio
 import logging
+import time
 from ..models.schemas import Message
 from ..core.model_cache import get_user_model
+from ..core.answer_cache import get_answer_cache
 from ..core.config import read_config
 from ...prompt.quick_search import quick_search_prompt
+from ...model import Conversation
+from ...model.ollama import PRIORITY_INTERACTIVE, set_request_priority
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -21,6 +25,8 @@ async def stream_data(
     """Stream completion data"""
     session_id = f"session_{asyncio.current_task().get_name()}_{id(asyncio.current_task())}"
     logger.info(f"[{session_id}] start the stream ...")
+    # ahead of report steps on a local Ollama
+    set_request_priority(PRIORITY_INTERACTIVE)
 
     try:
         # Parse messages
@@ -28,6 +34,19 @@ async def stream_data(
 
         needs_search = "search:" in query
 
+        # a near identical first question answered recently: replay its stream
+        kind = "search" if needs_search else "chat"
+        cache = get_answer_cache(kind) if len(validated_messages) == 1 else None
+        vector = None
+        if cache is not None:
+            start = time.perf_counter()
+            cached, vector = await cache.lookup(query, kind)
+            if cached is not None:
+                logger.info(f"[{session_id}] answer cache hit")
+                for chunk in cached:
+                    yield chunk
+                return
+
         # Get user model
         model_task = asyncio.create_task(get_user_model())
 
@@ -36,7 +55,7 @@ async def stream_data(
             async def search_pipeline():
                 from ...browser.duckduckgo import DuckSearch
                 search_instance = DuckSearch()
-                return await asyncio.to_thread(search_instance.search_result, query)
+                return await search_instance.asearch_result(query)
 
             search_task = asyncio.create_task(search_pipeline())
             model, search_result = await asyncio.gather(model_task, search_task)
@@ -46,30 +65,32 @@ async def stream_data(
             model = await model_task
             prompt = query
 
-        # Configure model
-        user_messages = [] if len(validated_messages) == 1 else validated_messages[:-1].copy()
-        model.messages = user_messages
+        # the session's history, the model instance is not touched
+        conversation = Conversation(validated_messages[:-1])
 
         logger.info(f"[{session_id}] Finished creating model")
         logger.info(f"[{session_id}] Finished Prompt preparation, starting completion stream")
 
         # Stream completion
-        completion_stream = model.completion_stream(prompt)
+        completion_stream = model.acompletion_stream(prompt, conversation)
         chunk_count = 0
         seen_content = set()
+        streamed = []
 
-        for chunk in completion_stream:
+        async for chunk in completion_stream:
             if chunk and chunk.strip():
                 chunk_hash = hash(chunk.strip())
                 if chunk_hash not in seen_content:
                     seen_content.add(chunk_hash)
                     chunk_count += 1
+                    streamed.append(chunk)
                     yield chunk
-                    await asyncio.sleep(0)
 
         if chunk_count == 0:
             logger.warning(f"[{session_id}] No chunks received from model")
             yield "No response generated"
+        elif cache is not None:
+            cache.store(query, kind, vector, streamed, time.perf_counter() - start)
 
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
@@ -98,23 +119,23 @@ async def stream_academic_data(
     api: Optional[str] = Form(None),
 ):
     """Stream academic data"""
+    set_request_priority(PRIORITY_INTERACTIVE)
     try:
         messages_list = json.loads(messages)
         validated_messages = [Message(**msg) for msg in messages_list]
 
         model = await get_user_model()
-        model.messages = validated_messages[:-1] if len(validated_messages) != 1 else []
+        conversation = Conversation(validated_messages[:-1])
 
         # Search arXiv
         from ...browser.duckduckgo import DuckSearch
         from ...prompt.quick_search import quick_search_prompt
 
-        search_result = DuckSearch().search_result("site:arxiv.org " + query)
+        search_result = await DuckSearch().asearch_result("site:arxiv.org " + query)
         prompt = quick_search_prompt(query, search_result)
 
-        for chunk in model.completion_stream(prompt):
+        async for chunk in model.acompletion_stream(prompt, conversation):
             yield chunk
-            await asyncio.sleep(0)
 
     except Exception as e:
         yield f"Error: {str(e)}"
@@ -130,3 +151,41 @@ async def stream_response_academic(
     return StreamingResponse(
         stream_academic_data(query, messages, files, api), media_type="text/plain"
     )
+
+async def stream_report_data(query: str):
+    """Stream report sections in order as soon as they are written"""
+    from .misc import main
+
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def section_handler(index: int, section: str):
+        await queue.put(section)
+
+    async def run_report():
+        try:
+            await main(query, section_handler=section_handler)
+        except Exception as e:
+            logger.error(f"Error in report streaming: {str(e)}")
+            await queue.put(f"Error: {str(e)}")
+        finally:
+            await queue.put(done)
+
+    report_task = asyncio.create_task(run_report())
+    try:
+        while True:
+            section = await queue.get()
+            if section is done:
+                break
+            yield section
+    finally:
+        report_task.cancel()
+
+@router.post("/stream_report/{query}")
+async def stream_report(query: str):
+    """Stream report sections
+
+    A report only depends on the query, form fields sent by older clients
+    (messages, files, api) are ignored.
+    """
+    return StreamingResponse(stream_report_data(query), media_type="text/plain")
@@ -0,0 +1,199 @@
+"""
+Process wide page content cache shared by DuckSearch and Crawl
+
+Stored in SQLite so it survives restarts and is shared between every DuckSearch /
+Crawl instance. Entries are keyed by (kind, normalized url), "kind" separates what
+was stored for the url (e.g. "snippet" from DuckSearch, "markdown" from crawl4ai).
+    - ttl: an entry older than ttl seconds is stale, callers may revalidate it with
+      the stored ETag / Last-Modified and call touch() on a 304
+    - max_bytes: total size budget, least recently used entries are removed first
+Storage and eviction are the shared SQLiteCache (src/utils/sqlite_cache.py).
+The async variants (aget, aput, atouch) run the SQLite work in a thread.
+"""
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import asyncio
+import time
+
+from ..utils import SQLiteCache, config_section
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_url(url: str) -> str:
+    """
+    lower case scheme / host, drop default ports, fragments, tracking parameters
+    and the trailing slash so the same page is cached once
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (
+        (scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)
+    ):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_")
+        )
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class CacheEntry:
+    def __init__(self, content: str, etag: str, last_modified: str, fetched_at: float, fresh: bool):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.fresh = fresh
+
+    def validators(self) -> dict:
+        """
+        conditional request headers for revalidating a stale entry
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ContentCache(SQLiteCache):
+    def __init__(
+        self,
+        path: str = "./cache/content.db",
+        ttl: float = 24 * 3600,
+        max_bytes: int = 200 * 1024 * 1024,
+        flush_every: int = 256,
+        flush_interval: float = 30,
+    ):
+        # stale entries are kept for revalidation, only the size budget evicts
+        super().__init__(
+            path,
+            "entries",
+            {"content": "TEXT NOT NULL", "etag": "TEXT", "last_modified": "TEXT"},
+            max_bytes=max_bytes,
+            schema_version=2,
+            flush_every=flush_every,
+            flush_interval=flush_interval,
+        )
+        self.ttl = ttl
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def _key(self, url: str, kind: str) -> str:
+        return f"{kind}:{normalize_url(url)}"
+
+    def get(self, url: str, kind: str = "page") -> CacheEntry | None:
+        """
+        return the entry (fresh or stale) or None, reading counts as a use for LRU
+        """
+        key = self._key(url, kind)
+        row = self._read([key], ["content", "etag", "last_modified"]).get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        fresh = time.time() - row[3] < self.ttl
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return CacheEntry(row[0], row[1], row[2], row[3], fresh)
+
+    def put(
+        self,
+        url: str,
+        content: str,
+        kind: str = "page",
+        etag: str = None,
+        last_modified: str = None,
+    ):
+        self._write(
+            {
+                self._key(url, kind): {
+                    "content": content,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                }
+            }
+        )
+
+    def touch(self, url: str, kind: str = "page"):
+        """
+        mark an entry fresh again, e.g. the server answered 304 Not Modified
+        """
+        self._renew(self._key(url, kind))
+        self.revalidated += 1
+
+    async def aget(self, url: str, kind: str = "page") -> CacheEntry | None:
+        return await asyncio.to_thread(self.get, url, kind)
+
+    async def aget_many(self, urls: list, kind: str = "page") -> list:
+        """
+        entries (or None) in the order of urls, looked up in one thread hop
+        """
+        return await asyncio.to_thread(lambda: [self.get(u, kind) for u in urls])
+
+    async def aput(
+        self,
+        url: str,
+        content: str,
+        kind: str = "page",
+        etag: str = None,
+        last_modified: str = None,
+    ):
+        await asyncio.to_thread(self.put, url, content, kind, etag, last_modified)
+
+    async def atouch(self, url: str, kind: str = "page"):
+        await asyncio.to_thread(self.touch, url, kind)
+
+    def clear(self, kind: str = None):
+        super().clear(None if kind is None else f"{kind}:")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            **super().stats(),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache: ContentCache = None
+
+
+def get_content_cache() -> ContentCache:
+    """
+    process wide cache, configured by "content_cache" in config.json
+    {"path": "./cache/content.db", "ttl": 86400, "max_bytes": 209715200,
+     "flush_every": 256, "flush_interval": 30}
+    """
+    global _cache
+    if _cache is None:
+        conf = config_section("content_cache")
+        _cache = ContentCache(
+            path=conf.get("path", "./cache/content.db"),
+            ttl=conf.get("ttl", 24 * 3600),
+            max_bytes=conf.get("max_bytes", 200 * 1024 * 1024),
+            flush_every=conf.get("flush_every", 256),
+            flush_interval=conf.get("flush_interval", 30),
+        )
+    return _cache
@@ -1,6 +1,5 @@
 # we may use crew_ai write some api for it
 from crawl4ai import (
-    AsyncWebCrawler,
     BrowserConfig,
     CrawlerRunConfig,
     CacheMode,
@@ -10,12 +9,28 @@ from crawl4ai.extraction_strategy import LLMExtractionStrategy
 from pydantic import BaseModel, Field
 from markitdown import MarkItDown
 
+import asyncio
+import hashlib
+import httpx
 import json
-import requests
+import re
 import os
 
 from ..model import Model
 from ..RAG.summary import Summary
+from ..RAG.manifest import file_hash
+from ..RAG.summary_cache import get_summary_cache, content_key, model_name
+from ..prompt import page_summary_prompt
+from ..prompt.summary import PAGE_SUMMARY_PROMPT_VERSION, SUMMARY_PROMPT_VERSION
+from ..utils import config_section
+from .pool import get_browser_pool
+from .http_client import get_http_client
+from .content_cache import get_content_cache, normalize_url
+from .prune import select_relevant, batch_pages
+
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Crawl:
@@ -27,6 +42,7 @@ class Crawl:
     --> then use crawl4ai to help for search
 
     All api is expected to be sync and use crawl4ai
+    Browsers are leased from the process wide pool (see pool.py) instead of started per call
     Expected API list
         get_links: given a url which is the result from a search website like google return the result list of that page
         get_images: get all images from the webpage
@@ -38,7 +54,6 @@ class Crawl:
 
     def __init__(self, model: Model, db=None, url_search=None):
         self.model = model
-        self.crawler = AsyncWebCrawler()
         self.db = [] if db == None else db
 
         """
@@ -51,11 +66,9 @@ class Crawl:
         self.broswer_conf = BrowserConfig()
         self.run_conf = CrawlerRunConfig()
 
-    async def start_crawler(self):
-        await self.crawler.start()
-
-    async def close_crawler(self):
-        await self.crawler.close()
+        # knobs of the fetch -> prune -> summarise pipeline used by get_summary
+        self.summary_conf = config_section("page_summary")
+        self.pdf_max_bytes = config_section("pdf_max_bytes", 50 * 1024 * 1024)
 
     # problem: still so slow --> for example searching takes 124.12s for arxiv website
     # TODO: concurrent process other state first ?
@@ -93,11 +106,8 @@ class Crawl:
                     """,
             ),
         )
-        self.crawler = AsyncWebCrawler(config=self.broswer_conf)
-        await self.start_crawler()
-
-        result = await self.crawler.arun(url=url, config=self.run_conf)
-        await self.close_crawler()
+        async with get_browser_pool().lease(self.broswer_conf) as crawler:
+            result = await crawler.arun(url=url, config=self.run_conf)
         self.url_list = json.loads(result.extracted_content)
 
         return self.url_list
@@ -108,87 +118,220 @@ class Crawl:
         user markitdown to convert to markdown
         generate summary with LLM --> we need a specific method to handle this
         """
-        p = self._download_pdf(url)
+        p = await self._download_pdf(url)
+        # the same pdf (by content, not url) is neither converted nor summarised twice
+        cache = get_summary_cache()
+        key = await asyncio.to_thread(file_hash, p)
+        map_reduce_words = self.summary_conf.get("pdf_map_reduce_words", 10000)
+        chunk_words = self.summary_conf.get("pdf_chunk_words", 3000)
+        version = f"pdf:{SUMMARY_PROMPT_VERSION}:{map_reduce_words}:{chunk_words}"
+        cached = await cache.aget(key, model_name(self.model), version)
+        if cached is not None:
+            return cached
+
         md = MarkItDown()
-        result = md.convert(p)
+        result = await asyncio.to_thread(md.convert, p)
         s = Summary(self.model)
-        r = s.summary(result.markdown)
+        # large pdfs: summarise the parts concurrently, then merge (map-reduce)
+        if len(result.markdown.split()) > map_reduce_words:
+            r = await s.map_reduce(
+                result.markdown,
+                k=chunk_words,
+                concurrency=self.summary_conf.get("concurrency", 4),
+            )
+        else:
+            r = await asyncio.to_thread(s.summary, result.markdown)
+        partial = s.partial
         del s
+        if r and not partial:
+            await cache.aput(key, model_name(self.model), version, r)
         return r
 
     async def get_summary(self, url: list, query):
+        """
+        Return one Page_summary like record {title, summary, brief_summary, keywords, url}
+        per relevant page.
+        Pages are fetched as markdown first, pruned to the chunks relevant to the query
+        and then summarised in batches instead of one full page LLM call per url.
+        """
+        pdf_urls, html_urls = await self._classify_urls(url)
+
+        results = await asyncio.gather(
+            *[self.get_pdf_summary(u) for u in pdf_urls],
+            self._get_html_summary(html_urls, query),
+            return_exceptions=True,
+        )
+
         summary = []
-        for u in url:
-            is_pdf = await self._is_pdf(u)
-            if is_pdf:
-                try:
-                    content = await self.get_pdf_summary(u)
-                    response = await summary.append(content)
-                    summary.append(response)
-                except Exception as e:
-                    print("Handling pdf error: ", e)
-                # current not support pdf first
-                url.remove(u)
+        for u, res in zip(pdf_urls + [None], results):
+            if isinstance(res, Exception):
+                logger.error(f"Handling {u or 'html pages'} error: {res}")
+                continue
+            for record in res:
+                if u and not record.get("url"):
+                    record["url"] = u
+            summary.extend(res)
+        return summary
 
-        self.broswer_conf = BrowserConfig()
-        self.run_conf = CrawlerRunConfig(
-            word_count_threshold=1,
-            extraction_strategy=LLMExtractionStrategy(
-                llm_config=self.model.get_llm_config(),
-                schema=Page_summary.model_json_schema(),
-                extraction_type="schema",
-                instruction=f"""
-                You are given the content of a webpage. Extract the following information relevant to the query: {query}
-
-                - Title: The main title of the page.
-                - Summary: A detailed summary describing the main content of the page. (around 300 - 400 words)
-                - Brief_summary: A concise, one or two sentence summary of the page. (2 to 3 sentences)
-                - Keywords: A list of relevant keywords or key phrases that represent the main topics of the page.
-                - url: the page url
-
-                Return the information as a JSON object matching this schema:
-
-                {{
-                    "title": "string",
-                    "summary": "string",
-                    "brief_summary": "string",
-                    "keywords": ["string", "string", ...],
-                    "url": "string,
-                }}
-                
-                If the content is not relevant to the query, return:
-
-                
-                {{
-                "title": "error",
-                "summary": "error",
-                "brief_summary": "error",
-                "keywords": null, 
-                "url": "",
-                }}
-            
-
-                Only provide the JSON object without any additional text or explanation.
-                """,
-            ),
-            cache_mode=CacheMode.BYPASS,
+    async def _get_html_summary(self, url: list, query) -> list[dict]:
+        # phase 1: fetch and convert to markdown, no LLM involved
+        pages = await self.fetch_markdown(url)
+        # phase 2: drop duplicates and keep the query relevant chunks only
+        pages = select_relevant(
+            pages,
+            query,
+            max_chunks_per_page=self.summary_conf.get("max_chunks_per_page", 6),
+            max_chars_per_page=self.summary_conf.get("max_chars_per_page", 4000),
         )
-        self.crawler = AsyncWebCrawler(config=self.broswer_conf)
-        await self.start_crawler()
+        # phase 3: summarise several pages per LLM call
+        return await self._summarise_pages(pages, query)
 
-        result = await self.crawler.arun_many(
-            urls=url,
-            config=self.run_conf,
+    async def fetch_markdown(self, url: list) -> list[dict]:
+        """
+        crawl the urls concurrently and return [{"url", "title", "markdown"}]
+        Pages found in the shared content cache are not crawled again, stale ones
+        are revalidated with a conditional request first.
+        """
+        if not url:
+            return []
+        cache = get_content_cache()
+        pages = {}
+        stale = []
+        entries = await cache.aget_many(url, "markdown")
+        for u, entry in zip(url, entries):
+            if entry is None:
+                continue
+            if entry.fresh:
+                pages[u] = json.loads(entry.content)
+            elif entry.validators():
+                stale.append((u, entry))
+
+        not_modified = await asyncio.gather(
+            *[self._not_modified(u, entry) for u, entry in stale]
         )
-        await self.close_crawler()
+        for (u, entry), unchanged in zip(stale, not_modified):
+            if unchanged:
+                await cache.atouch(u, "markdown")
+                pages[u] = json.loads(entry.content)
+
+        to_crawl = [u for u in url if u not in pages]
+        if to_crawl:
+            self.broswer_conf = BrowserConfig()
+            # caching is done by the shared content cache, not crawl4ai
+            self.run_conf = CrawlerRunConfig(
+                word_count_threshold=1,
+                cache_mode=CacheMode.BYPASS,
+            )
+            async with get_browser_pool().lease(self.broswer_conf, pages=len(to_crawl)) as crawler:
+                result = await crawler.arun_many(
+                    urls=to_crawl,
+                    config=self.run_conf,
+                )
+
+            crawled = {normalize_url(u): u for u in to_crawl}
+            for ele in result:
+                if not ele.success or not ele.markdown:
+                    continue
+                u = crawled.get(normalize_url(ele.url), ele.url)
+                page = {
+                    "url": u,
+                    "title": (ele.metadata or {}).get("title", "") or "",
+                    "markdown": str(ele.markdown),
+                }
+                pages[u] = page
+                headers = {k.lower(): v for k, v in (ele.response_headers or {}).items()}
+                await cache.aput(
+                    u,
+                    json.dumps(page),
+                    "markdown",
+                    etag=headers.get("etag"),
+                    last_modified=headers.get("last-modified"),
+                )
+
+        return [pages[u] for u in url if u in pages]
+
+    async def _not_modified(self, url, entry) -> bool:
+        try:
+            async with get_http_client().stream("GET", url, headers=entry.validators()) as response:
+                return response.status_code == 304
+        except httpx.HTTPError:
+            return False
 
-        for ele in result:
-            page_summary = json.loads(ele.extracted_content)
-            try:
-                summary.append(page_summary[0])
-            except:
-                pass
+    async def _summarise_pages(self, pages: list[dict], query) -> list[dict]:
+        """
+        pages already summarised for the same query terms come from the summary
+        cache, only the others are sent to the model
+        """
+        cache = get_summary_cache()
+        model = model_name(self.model)
+        summary = []
+        missing = []
+        for page in pages:
+            page["content_hash"] = content_key(page["content"])
+        found = await cache.aget_many(
+            [page["content_hash"] for page in pages], model, PAGE_SUMMARY_PROMPT_VERSION, query
+        )
+        for page, cached in zip(pages, found):
+            if cached is None:
+                missing.append(page)
+            else:
+                summary.extend(dict(record, url=page["url"]) for record in cached)
+        if not missing:
+            return summary
+
+        batches = batch_pages(
+            missing,
+            batch_chars=self.summary_conf.get("batch_chars", 12000),
+            max_pages=self.summary_conf.get("pages_per_call", 5),
+        )
+        semaphore = asyncio.Semaphore(self.summary_conf.get("concurrency", 4))
 
+        async def summarise(batch):
+            async with semaphore:
+                try:
+                    res = await self.model.acompletion(page_summary_prompt(query, batch))
+                except Exception as e:
+                    logger.error(f"page summary failed: {e}")
+                    return []
+            records = self._parse_page_summaries(res, batch)
+            by_url = {normalize_url(page["url"]): page for page in batch}
+            for record in records:
+                page = by_url.get(normalize_url(record["url"]))
+                if page is not None:
+                    await cache.aput(
+                        page["content_hash"], model, PAGE_SUMMARY_PROMPT_VERSION, [record], query
+                    )
+            return records
+
+        for records in await asyncio.gather(*[summarise(b) for b in batches]):
+            summary.extend(records)
+        return summary
+
+    def _parse_page_summaries(self, res: str, batch: list[dict]) -> list[dict]:
+        match = re.search(r"```(?:json)?\s*(.*?)\s*```", res, re.DOTALL)
+        text = match.group(1) if match else res
+        try:
+            records = json.loads(text[text.find("[") : text.rfind("]") + 1])
+        except (json.JSONDecodeError, ValueError):
+            logger.warning("failed to parse page summaries")
+            return []
+
+        summary = []
+        for i, record in enumerate(records):
+            if not isinstance(record, dict) or record.get("title", "") == "error":
+                continue
+            url = record.get("url", "")
+            if not url and i < len(batch):
+                url = batch[i]["url"]
+            summary.append(
+                {
+                    "title": record.get("title", ""),
+                    "summary": record.get("summary", ""),
+                    "brief_summary": record.get("brief_summary", ""),
+                    "keywords": record.get("keywords") or [],
+                    "url": url,
+                }
+            )
         return summary
 
     async def get_table(self, url, query: str):
@@ -227,11 +370,8 @@ class Crawl:
                 """,
             ),
         )
-        self.crawler = AsyncWebCrawler(config=self.browser_conf)
-        await self.start_crawler()
-
-        result = await self.crawler.arun(url=url, config=self.run_conf)
-        await self.close_crawler()
+        async with get_browser_pool().lease(self.browser_conf) as crawler:
+            result = await crawler.arun(url=url, config=self.run_conf)
 
         # Parse the JSON extracted content into TableData model
 
@@ -246,10 +386,8 @@ class Crawl:
             wait_for_images=True,
         )
 
-        self.crawler = AsyncWebCrawler(config=self.broswer_conf)
-        await self.start_crawler()
-
-        result = await self.crawler.arun(url=url, config=self.run_conf)
+        async with get_browser_pool().lease(self.broswer_conf) as crawler:
+            result = await crawler.arun(url=url, config=self.run_conf)
 
         if result.screenshot:
             from base64 import b64decode
@@ -257,50 +395,86 @@ class Crawl:
             with open("./tmp/screenshot/screenshot.png", "wb") as f:
                 f.write(b64decode(result.screenshot))
 
-        await self.close_crawler()
-
     async def _is_pdf(self, url):
+        """
+        HEAD the url first, if the content type does not tell fall back to a
+        range GET of the first 5 bytes and look for '%PDF-'
+        """
+        client = get_http_client()
         try:
-            # Use GET request with stream=True to avoid downloading the entire file
-            response = requests.get(url, stream=True, allow_redirects=True, timeout=10)
-            response.raise_for_status()
-
+            response = await client.head(url)
             content_type = response.headers.get("Content-Type", "").lower()
-            # Check if content-type indicates PDF
-            if "application/pdf" in content_type:
-                return True
-
-            # Sometimes content-type is not set correctly,
-            # so check the first 5 bytes for '%PDF-'
-            start = response.raw.read(5)
-            return start == b"%PDF-"
-
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
+            if response.status_code < 400:
+                if "application/pdf" in content_type:
+                    return True
+                if "text/html" in content_type:
+                    return False
+
+            async with client.stream("GET", url, headers={"Range": "bytes=0-4"}) as response:
+                response.raise_for_status()
+                if "application/pdf" in response.headers.get("Content-Type", "").lower():
+                    return True
+                start = b""
+                async for chunk in response.aiter_bytes():
+                    start += chunk
+                    if len(start) >= 5:
+                        break
+                return start[:5] == b"%PDF-"
+
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+            # malformed search result urls are not pdfs either
+            logger.info(f"Request failed: {e}")
             return False
 
+    async def _classify_urls(self, url: list) -> tuple[list, list]:
+        """
+        split urls into (pdf urls, other urls), all urls are checked concurrently
+        """
+        checks = await asyncio.gather(
+            *[self._is_pdf(u) for u in url], return_exceptions=True
+        )
+        # one failing check must not abort the whole summary
+        is_pdf = [c is True for c in checks]
+        pdf_urls = [u for u, pdf in zip(url, is_pdf) if pdf]
+        html_urls = [u for u, pdf in zip(url, is_pdf) if not pdf]
+        return pdf_urls, html_urls
+
     def search_content(self):
         pass
 
     def run(self):
         pass
 
-    def _download_pdf(self, url, save_path="./tmp"):
+    async def _download_pdf(self, url, save_path="./tmp"):
         """
-        Download every file ?
+        Stream the pdf to disk chunk by chunk, stop if it is larger than
+        "pdf_max_bytes" in config (default 50MB)
         """
         filename = url.rstrip("/").split("/")[-1]
         filename = filename.split("?")[0]
         # Ensure the filename ends with .pdf
         if not filename.lower().endswith(".pdf"):
             filename += ".pdf"
+        # prefix with the url hash so concurrent downloads of a.com/paper.pdf and b.com/paper.pdf do not clash
+        filename = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8] + "_" + filename
+        os.makedirs(save_path, exist_ok=True)
         save_path = os.path.join(save_path, filename)
 
-        response = requests.get(url)
-        response.raise_for_status()
-
-        with open(save_path, "wb") as f:
-            f.write(response.content)
+        max_bytes = self.pdf_max_bytes
+        size = 0
+        try:
+            async with get_http_client().stream("GET", url) as response:
+                response.raise_for_status()
+                with open(save_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise ValueError(f"pdf larger than {max_bytes} bytes: {url}")
+                        f.write(chunk)
+        except Exception:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise
         return save_path
 
 
@@ -10,9 +10,232 @@ import re
 from urllib.parse import urlparse
 from selectolax.parser import HTMLParser
 import os
+import copy
+import math
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from .content_cache import get_content_cache
+from .http_client import get_aiohttp_session
 
 logger = logging.getLogger(__name__)
 
+
+class _LeaderGone(Exception):
+    """the coalesced search was cancelled, waiters retry"""
+
+
+class SearchResultCache:
+    """
+    Short lived cache of search results shared by every DuckSearch instance.
+
+    Keyed by (normalized query, backend, k, deep_search). Concurrent identical
+    searches are coalesced: the first caller runs the search, the others wait
+    for its result instead of hitting DuckDuckGo again.
+    Empty results (failed / timed out searches) are not cached.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, query: str, backend: str, k: int, deep_search: bool) -> tuple:
+        return (" ".join(query.lower().split()), backend, k, deep_search)
+
+    def get_or_load(self, key: tuple, loader) -> List[Dict]:
+        while True:
+            future, leader = self._lookup(key)
+            if leader:
+                break
+            try:
+                return copy.deepcopy(future.result())
+            except _LeaderGone:
+                continue
+        try:
+            results = loader()
+        except Exception as e:
+            self._finish(key, future, exception=e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, results=results)
+        return copy.deepcopy(results)
+
+    async def aget_or_load(self, key: tuple, loader) -> List[Dict]:
+        """same as get_or_load, loader is an async function"""
+        while True:
+            future, leader = self._lookup(key)
+            if leader:
+                break
+            # shielded: a cancelled waiter must not cancel the shared future
+            waiter = asyncio.wrap_future(future)
+            try:
+                return copy.deepcopy(await asyncio.shield(waiter))
+            except _LeaderGone:
+                continue
+            except asyncio.CancelledError:
+                waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+                raise
+        try:
+            results = await loader()
+        except Exception as e:
+            self._finish(key, future, exception=e)
+            raise
+        except BaseException:
+            # cancelled leader, a waiter takes over the search
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, results=results)
+        return copy.deepcopy(results)
+
+    def _lookup(self, key: tuple) -> tuple[Future, bool]:
+        """
+        return (future, is_leader). A finished future is returned on a cache hit.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(entry[1])
+                return future, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _finish(self, key: tuple, future: Future, results=None, exception=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if exception is None and results:
+                self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(results))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if exception is None:
+            future.set_result(results)
+        else:
+            future.set_exception(exception)
+
+    def _abandon(self, key: tuple, future: Future):
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_exception(_LeaderGone())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced_waiters": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+_search_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> SearchResultCache:
+    """process wide search result cache, ttl from "search_cache_ttl" in config.json"""
+    global _search_cache
+    if _search_cache is None:
+        from ..utils import config_section
+
+        _search_cache = SearchResultCache(ttl=config_section("search_cache_ttl", 60))
+    return _search_cache
+
+
+class HostLatencyTracker:
+    """
+    Per host latency of deep search page fetches, shared by every DuckSearch.
+
+    Used to pick a per host timeout (p90 of recent fetches with some head room,
+    clamped) and the fan-out: how many result pages to fetch so that about k of
+    them finish before the deadline.
+    """
+
+    def __init__(self, default_timeout: float = 0.4, min_timeout: float = 0.15, max_timeout: float = 1.2, window: int = 20):
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._failures: Dict[str, int] = {}
+        # EWMA of the share of fetches that return content in time
+        self.success_rate = 0.7
+        self._lock = threading.Lock()
+
+    def record(self, host: str, latency: float, ok: bool):
+        with self._lock:
+            samples = self._samples.get(host)
+            if samples is None:
+                if len(self._samples) > 5000:
+                    self._samples.clear()
+                    self._failures.clear()
+                samples = self._samples[host] = deque(maxlen=self.window)
+            samples.append(latency)
+            if not ok:
+                self._failures[host] = self._failures.get(host, 0) + 1
+            self.success_rate = 0.9 * self.success_rate + 0.1 * (1.0 if ok else 0.0)
+
+    def timeout_for(self, host: str) -> float:
+        with self._lock:
+            samples = self._samples.get(host)
+            if not samples:
+                return self.default_timeout
+            ordered = sorted(samples)
+        p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+        return min(self.max_timeout, max(self.min_timeout, p90 * 1.5))
+
+    def fan_out(self, k: int) -> int:
+        """number of pages to fetch so about k of them succeed, at most 2k"""
+        return min(2 * k, max(k, math.ceil(k / max(self.success_rate, 0.3))))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hosts = {
+                host: {
+                    "samples": len(samples),
+                    "avg_latency": round(sum(samples) / len(samples), 3),
+                    "failures": self._failures.get(host, 0),
+                }
+                for host, samples in self._samples.items()
+            }
+        slowest = sorted(hosts.items(), key=lambda h: h[1]["avg_latency"], reverse=True)[:20]
+        return {
+            "hosts": len(hosts),
+            "success_rate": round(self.success_rate, 3),
+            "slowest_hosts": dict(slowest),
+        }
+
+
+_host_latency = HostLatencyTracker()
+
+
+def get_host_latency() -> HostLatencyTracker:
+    return _host_latency
+
+
 class DuckSearch:
     def __init__(self):
         self.search_engine = DuckDuckGoSearchResults(
@@ -39,9 +262,13 @@ class DuckSearch:
             'enable_cleanup_closed': True,
         }
         
-        # Simple caches
+        # Simple caches, page content lives in the process wide content cache
         self._failed_urls = set()
-        self._content_cache = {}
+        self._content_cache = get_content_cache()
+        
+        # latency budget of a whole search in seconds
+        from ..utils import config_section
+        self._deadline = config_section("search_deadline", 1.5)
         
         # Regex patterns
         self._text_cleanup = re.compile(r'\s+')
@@ -56,16 +283,41 @@ class DuckSearch:
         except:
             return False
 
-    async def _extract_content_fast(self, session: aiohttp.ClientSession, url: str) -> str:
-        """Ultra-fast content extraction - fail fast, succeed faster."""
+    async def _extract_content_fast(self, session: aiohttp.ClientSession, url: str, budget: Optional[float] = None) -> str:
+        """Ultra-fast content extraction - fail fast, succeed faster.
+
+        The timeout is learned per host and never longer than the remaining budget.
+        """
         if not url or url in self._failed_urls or not self._is_valid_url(url):
             return ""
         
-        if url in self._content_cache:
-            return self._content_cache[url]
+        cached = await self._content_cache.aget(url, "snippet")
+        if cached is not None and cached.fresh:
+            return cached.content
         
+        host = urlparse(url).netloc
+        tracker = get_host_latency()
+        total = tracker.timeout_for(host)
+        if budget is not None:
+            total = max(0.05, min(total, budget))
+        start = time.monotonic()
+        content = ""
         try:
-            async with session.get(url, allow_redirects=True, max_redirects=2) as response:
+            content = await self._fetch_content(session, url, cached, aiohttp.ClientTimeout(total=total, connect=min(total, 0.3)))
+            return content
+        finally:
+            # also reached when the deadline cancels us, which counts as a slow failure
+            tracker.record(host, time.monotonic() - start, bool(content))
+
+    async def _fetch_content(self, session: aiohttp.ClientSession, url: str, cached, timeout: aiohttp.ClientTimeout) -> str:
+        # stale entry: ask the server if it changed
+        headers = cached.validators() if cached is not None else {}
+        
+        try:
+            async with session.get(url, allow_redirects=True, max_redirects=2, headers=headers, timeout=timeout) as response:
+                if response.status == 304 and cached is not None:
+                    await self._content_cache.atouch(url, "snippet")
+                    return cached.content
                 if response.status != 200:
                     self._failed_urls.add(url)
                     return ""
@@ -104,14 +356,13 @@ class DuckSearch:
                 
                 final_text = self._text_cleanup.sub(' ', unescape(' '.join(texts))).strip()[:300]
                 
-                # Simple cache management
-                if len(self._content_cache) > 100:
-                    # Remove oldest 20 entries
-                    old_keys = list(self._content_cache.keys())[:20]
-                    for key in old_keys:
-                        del self._content_cache[key]
-                
-                self._content_cache[url] = final_text
+                await self._content_cache.aput(
+                    url,
+                    final_text,
+                    "snippet",
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
                 return final_text
                 
         except Exception as e:
@@ -119,11 +370,18 @@ class DuckSearch:
             logger.debug(f"Content extraction failed for {url}: {e}")
             return ""
 
-    async def _process_results_fast(self, results: List[Dict], k: int) -> List[Dict]:
-        """Process search results with content extraction - ultra fast or fail."""
+    async def _process_results_fast(self, results: List[Dict], k: int, session: Optional[aiohttp.ClientSession] = None, budget: float = 1.2) -> List[Dict]:
+        """Process search results with content extraction within the time budget.
+
+        Uses the given (long lived) session, a temporary one is created only when
+        called without one, e.g. from the sync search_result.
+        """
         if not results:
             return []
         
+        if session is not None:
+            return await self._extract_all(session, results, k, budget)
+        
         connector = aiohttp.TCPConnector(**self._connector_config)
         
         try:
@@ -135,108 +393,119 @@ class DuckSearch:
                     "Accept": "text/html,*/*;q=0.8",
                 },
             ) as session:
-                
-                # Limit concurrent requests for speed
-                semaphore = asyncio.Semaphore(min(k * 2, 20))
-                
-                async def process_single(result):
-                    async with semaphore:
-                        url = result.get("link", "")
-                        content = await self._extract_content_fast(session, url)
-                        result["full_content"] = content
-                        return result
-                
-                # Process only the URLs we need
-                tasks = [process_single(result) for result in results[:k]]
-                
-                # Race against time - 1.2s max for content extraction
-                try:
-                    completed_results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=1.2
-                    )
-                    
-                    final_results = []
-                    for i, result_or_exc in enumerate(completed_results):
-                        if isinstance(result_or_exc, Exception):
-                            # On any error, set empty content but keep the result
-                            results[i]["full_content"] = ""
-                            final_results.append(results[i])
-                        else:
-                            final_results.append(result_or_exc)
-                    
-                    return final_results
-                    
-                except asyncio.TimeoutError:
-                    logger.debug("Content extraction timed out - returning results without content")
-                    # If we timeout, return results with empty content
-                    for result in results[:k]:
-                        result["full_content"] = ""
-                    return results[:k]
+                return await self._extract_all(session, results, k, budget)
                     
         except Exception as e:
             logger.error(f"Session creation failed: {e}")
-            # Return empty list on session creation failure
-            return []
+            # Return the plain results on session creation failure
+            for result in results[:k]:
+                result["full_content"] = ""
+            return results[:k]
         finally:
             await connector.close()
 
-    def search_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
-        """Super efficient search - 1.5s max total time or return empty list."""
-        start_time = time.time()
+    async def _extract_all(self, session: aiohttp.ClientSession, results: List[Dict], k: int, budget: float) -> List[Dict]:
+        """Fetch pages until the budget runs out.
+
+        Pages that finished in time keep their content, stragglers are cancelled.
+        Results with content come first (in search rank order), then the others.
+        """
+        fan_out = get_host_latency().fan_out(k)
+        candidates = results[:fan_out]
+        # Limit concurrent requests for speed
+        semaphore = asyncio.Semaphore(min(fan_out * 2, 20))
+        deadline = time.monotonic() + budget
+        
+        async def process_single(result):
+            async with semaphore:
+                url = result.get("link", "")
+                remaining = deadline - time.monotonic()
+                content = await self._extract_content_fast(session, url, remaining)
+                result["full_content"] = content
+                return result
+        
+        for result in candidates:
+            result["full_content"] = ""
+        tasks = [asyncio.create_task(process_single(result)) for result in candidates]
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, budget))
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.debug(f"Deadline reached - {len(done)} of {len(tasks)} pages finished")
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        with_content = [r for r in candidates if r["full_content"]]
+        without_content = [r for r in candidates if not r["full_content"]]
+        return (with_content + without_content)[:k]
+
+    def search_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True, deadline: Optional[float] = None) -> List[Dict]:
+        """Sync wrapper for scripts - runs asearch_result on its own event loop.
+
+        Do not call it from a running event loop, use asearch_result instead.
+        """
+        cache = get_search_cache()
+        return cache.get_or_load(
+            cache.key(query, backend, k, deep_search),
+            lambda: asyncio.run(self._asearch_result(query, k, backend, deep_search, deadline=deadline)),
+        )
+
+    async def asearch_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True, deadline: Optional[float] = None) -> List[Dict]:
+        """Cached search on the caller's loop - identical concurrent queries share one upstream search."""
+        cache = get_search_cache()
+        return await cache.aget_or_load(
+            cache.key(query, backend, k, deep_search),
+            lambda: self._asearch_result(query, k, backend, deep_search, session=get_aiohttp_session(), deadline=deadline),
+        )
+
+    async def _asearch_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True, session: Optional[aiohttp.ClientSession] = None, deadline: Optional[float] = None) -> List[Dict]:
+        """Deadline driven search.
+
+        deadline is the latency budget in seconds for the whole search (default
+        "search_deadline" in config, 1.5s). Whatever page content is ready by then
+        is returned, the search results themselves are never thrown away.
+        """
+        if deadline is None:
+            deadline = self._deadline
+        start_time = time.monotonic()
         logger.info(f"Starting efficient search for: '{query}'")
         
         try:
-            # Get initial results - should be fast
-            results = self.search_engine.invoke(query, max_results=k)
-            
-            if not results:
-                logger.info(f"No results found for: '{query}'")
-                return []
-                
-            # Check if we're already close to time limit
-            elapsed = time.time() - start_time
-            if elapsed > 1.5:  # If basic search took too long, skip deep search
-                logger.warning(f"Basic search took {elapsed:.3f}s - skipping deep search")
-                for result in results:
-                    result["full_content"] = ""
-                return results[:k]
-            
-            if not deep_search:
-                for result in results:
-                    result["full_content"] = ""
-                return results[:k]
-            
-            # Deep search with remaining time budget
-            try:
-                # Run async content extraction
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    final_results = loop.run_until_complete(
-                        self._process_results_fast(results, k)
-                    )
-                    
-                    total_time = time.time() - start_time
-                    logger.info(f"Search completed in {total_time:.3f}s")
-                    
-                    # Final time check - if we exceeded 1.5s, we failed
-                    if total_time > 1.5:
-                        logger.warning(f"Search exceeded 1.5s limit ({total_time:.3f}s) - returning empty")
-                        return []
-                    
-                    return final_results if final_results else []
-                    
-                finally:
-                    loop.close()
-                    
-            except Exception as e:
-                logger.error(f"Deep search failed: {e}")
-                return []  # Return empty on any deep search failure
-                
+            # ask for a few more results when many pages fail to load in time
+            max_results = get_host_latency().fan_out(k) if deep_search else k
+            # the duckduckgo client is sync, keep it off the event loop. invoke() always
+            # asks for the tool's num_results, the wrapper takes the count per call
+            results = await asyncio.to_thread(
+                self.search_engine.api_wrapper.results,
+                query,
+                max_results,
+                source=self.search_engine.backend,
+            )
         except Exception as e:
             logger.error(f"Search failed for '{query}': {e}")
             return []  # Return empty on any search failure
+        
+        if not results:
+            logger.info(f"No results found for: '{query}'")
+            return []
+        
+        remaining = deadline - (time.monotonic() - start_time)
+        if not deep_search or remaining <= 0.05:
+            if deep_search:
+                logger.warning(f"Basic search used the whole {deadline:.2f}s budget - skipping deep search")
+            for result in results:
+                result["full_content"] = ""
+            return results[:k]
+        
+        try:
+            final_results = await self._process_results_fast(results, k, session, remaining)
+        except Exception as e:
+            logger.error(f"Deep search failed: {e}")
+            for result in results:
+                result["full_content"] = ""
+            return results[:k]
+        
+        logger.info(f"Search completed in {time.monotonic() - start_time:.3f}s")
+        return final_results
 
     def today_new(self, category: str) -> List[Dict]:
         """Fast news retrieval."""
@@ -258,6 +527,7 @@ class DuckSearch:
 
     def clear_cache(self):
         """Clear caches."""
-        self._content_cache.clear()
+        self._content_cache.clear("snippet")
+        get_search_cache().clear()
         self._failed_urls.clear()
         self._is_valid_url.cache_clear()
\ No newline at end of file
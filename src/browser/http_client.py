@@ -0,0 +1,65 @@
+"""
+Shared async http clients
+
+One httpx.AsyncClient (pdf handling) and one aiohttp.ClientSession (DuckSearch deep
+search) for the whole process so connections (and TLS sessions) are reused between
+requests instead of opening a new connector for every search.
+Closed in the app lifespan with close_http_client().
+"""
+
+import asyncio
+
+import aiohttp
+import httpx
+
+_client: httpx.AsyncClient = None
+_session: aiohttp.ClientSession = None
+_session_loop = None
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """
+    must be called from a running event loop, the session belongs to that loop
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=50,
+                limit_per_host=20,
+                ttl_dns_cache=300,
+                use_dns_cache=True,
+                keepalive_timeout=30,
+                enable_cleanup_closed=True,
+            ),
+            headers={**HEADERS, "Accept": "text/html,*/*;q=0.8"},
+        )
+        _session_loop = loop
+    return _session
+
+
+async def close_http_client():
+    global _client, _session
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _session is not None:
+        await _session.close()
+        _session = None
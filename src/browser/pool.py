@@ -0,0 +1,289 @@
+"""
+Process wide browser pool for crawl4ai
+
+Starting a headless browser is the slowest part of a crawl, so instead of
+start() / close() an AsyncWebCrawler on every call we keep one warm crawler per
+BrowserConfig and lease it out.
+    - every lease runs in a browser context of its own (cookies, storage), closed
+      when the lease ends, and every arun opens its own page
+    - max_pages limits how many pages are open across the whole pool, a lease
+      reserves at most max_pages and runs arun_many in batches of that size
+    - browsers that have not been leased for idle_timeout seconds are closed
+Closing the context of one lease needs crawl4ai internals (the version is pinned
+in requirements.txt). Without them the contexts stay open, and after
+max_leaked_leases such leases the browser is replaced and closed once idle.
+"""
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
+
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
+import uuid
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    def __init__(self, max_pages: int = 8, idle_timeout: float = 300, max_leaked_leases: int = 16):
+        self.max_pages = max(1, max_pages)
+        self.idle_timeout = idle_timeout
+        self.max_leaked_leases = max(1, max_leaked_leases)
+
+        self._browsers: dict[str, _PooledBrowser] = {}
+        self._pages_in_use = 0
+        self._pages_cond = asyncio.Condition()
+        self._start_lock = asyncio.Lock()
+        self._evict_task = None
+
+        self._leases = 0
+        self._cold_starts = 0
+        self._waits = 0
+        self._evictions = 0
+        self._retired = 0
+
+    async def warm_up(self, config: BrowserConfig = None):
+        """
+        start a browser before the first request, e.g. on app startup
+        """
+        await self._get_browser(BrowserConfig() if config is None else config)
+
+    @asynccontextmanager
+    async def lease(self, config: BrowserConfig = None, pages: int = 1):
+        """
+        Lease a started crawler for the given config.
+        Args:
+            config: browser config, browsers are shared between equal configs
+            pages: how many pages the caller will open (e.g. len(urls) for arun_many)
+        Yield:
+            LeasedCrawler with arun / arun_many
+        """
+        config = BrowserConfig() if config is None else config
+        pages = min(max(1, pages), self.max_pages)
+
+        async with self._pages_cond:
+            if self._pages_in_use + pages > self.max_pages:
+                self._waits += 1
+            await self._pages_cond.wait_for(
+                lambda: self._pages_in_use + pages <= self.max_pages
+            )
+            self._pages_in_use += pages
+
+        browser = None
+        leased = None
+        try:
+            browser = await self._get_browser(config)
+            browser.active += 1
+            browser.leases += 1
+            self._leases += 1
+            leased = LeasedCrawler(browser.crawler, pages)
+            yield leased
+        finally:
+            if leased is not None and not await leased.close():
+                browser.leaked += 1
+            if browser is not None:
+                await self._release(browser)
+            async with self._pages_cond:
+                self._pages_in_use -= pages
+                self._pages_cond.notify_all()
+
+    async def _release(self, browser: "_PooledBrowser"):
+        browser.active -= 1
+        browser.last_used = time.monotonic()
+        if browser.leaked >= self.max_leaked_leases and self._browsers.get(browser.key) is browser:
+            # the contexts of ended leases are still open, new leases get a fresh browser
+            del self._browsers[browser.key]
+            browser.retired = True
+            self._retired += 1
+        if browser.retired and browser.active == 0:
+            await self._close_browser(browser)
+
+    async def _get_browser(self, config: BrowserConfig) -> "_PooledBrowser":
+        key = self._key(config)
+        browser = self._browsers.get(key)
+        if browser is not None:
+            return browser
+
+        async with self._start_lock:
+            browser = self._browsers.get(key)
+            if browser is None:
+                start = time.monotonic()
+                crawler = AsyncWebCrawler(config=config)
+                await crawler.start()
+                browser = _PooledBrowser(key, crawler)
+                self._browsers[key] = browser
+                self._cold_starts += 1
+                logger.info(f"browser started in {time.monotonic() - start:.2f}s")
+            self._ensure_evictor()
+        return browser
+
+    def _key(self, config: BrowserConfig) -> str:
+        try:
+            return json.dumps(config.to_dict(), sort_keys=True, default=str)
+        except Exception:
+            return repr(config)
+
+    def _ensure_evictor(self):
+        if self.idle_timeout and (self._evict_task is None or self._evict_task.done()):
+            self._evict_task = asyncio.create_task(self._evict_loop())
+
+    async def _evict_loop(self):
+        while self._browsers:
+            await asyncio.sleep(max(1, self.idle_timeout / 2))
+            await self.evict_idle()
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        for key, browser in list(self._browsers.items()):
+            if browser.active == 0 and now - browser.last_used >= self.idle_timeout:
+                del self._browsers[key]
+                self._evictions += 1
+                await self._close_browser(browser)
+
+    async def close(self):
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+        browsers = list(self._browsers.values())
+        self._browsers = {}
+        for browser in browsers:
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser: "_PooledBrowser"):
+        try:
+            await browser.crawler.close()
+        except Exception as e:
+            logger.warning(f"closing browser failed: {e}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "browsers": len(self._browsers),
+            "pages_in_use": self._pages_in_use,
+            "max_pages": self.max_pages,
+            "leases": self._leases,
+            "cold_starts": self._cold_starts,
+            "waits": self._waits,
+            "evictions": self._evictions,
+            "retired": self._retired,
+            "idle_timeout": self.idle_timeout,
+            "per_browser": [
+                {
+                    "active": b.active,
+                    "leases": b.leases,
+                    "idle_seconds": round(now - b.last_used, 1),
+                }
+                for b in self._browsers.values()
+            ],
+        }
+
+
+class LeasedCrawler:
+    """
+    The pooled crawler as seen by one lease. Runs get their own browser context
+    (the run config is tagged with the lease id, crawl4ai keys contexts by run
+    config) and arun_many never opens more pages than the lease reserved.
+    """
+
+    def __init__(self, crawler: AsyncWebCrawler, pages: int):
+        self.crawler = crawler
+        self.pages = pages
+        self.lease_id = uuid.uuid4().hex
+        self._configs: list[CrawlerRunConfig] = []
+
+    def _isolate(self, config: CrawlerRunConfig = None) -> CrawlerRunConfig:
+        config = CrawlerRunConfig() if config is None else config
+        shared = dict(config.shared_data or {})
+        shared["browser_pool_lease"] = self.lease_id
+        config = config.clone(shared_data=shared)
+        self._configs.append(config)
+        return config
+
+    async def arun(self, url: str, config: CrawlerRunConfig = None, **kwargs):
+        return await self.crawler.arun(url=url, config=self._isolate(config), **kwargs)
+
+    async def arun_many(self, urls: list[str], config: CrawlerRunConfig = None, **kwargs):
+        config = self._isolate(config)
+        results = []
+        for start in range(0, len(urls), self.pages):
+            results.extend(
+                await self.crawler.arun_many(
+                    urls=urls[start : start + self.pages], config=config, **kwargs
+                )
+            )
+        return results
+
+    async def close(self) -> bool:
+        """
+        close the browser contexts opened by this lease, False if some stay open
+        """
+        if not self._configs:
+            return True
+        # crawl4ai has no public call to close the context of one run config
+        manager = getattr(getattr(self.crawler, "crawler_strategy", None), "browser_manager", None)
+        if not (
+            hasattr(manager, "_make_config_signature")
+            and isinstance(getattr(manager, "contexts_by_config", None), dict)
+        ):
+            _warn_no_context_close()
+            return False
+        closed = True
+        for config in self._configs:
+            try:
+                signature = manager._make_config_signature(config)
+                context = manager.contexts_by_config.pop(signature, None)
+                if context is not None:
+                    await context.close()
+            except Exception as e:
+                closed = False
+                logger.warning(f"closing browser context failed: {e}")
+        return closed
+
+
+_warned_no_context_close = False
+
+
+def _warn_no_context_close():
+    global _warned_no_context_close
+    if not _warned_no_context_close:
+        _warned_no_context_close = True
+        logger.warning(
+            "this crawl4ai version does not expose the browser contexts, "
+            "pooled browsers are replaced to close them"
+        )
+
+
+class _PooledBrowser:
+    def __init__(self, key: str, crawler: AsyncWebCrawler):
+        self.key = key
+        self.crawler = crawler
+        self.active = 0
+        self.leases = 0
+        # leases whose browser context could not be closed
+        self.leaked = 0
+        self.retired = False
+        self.last_used = time.monotonic()
+
+
+_pool: BrowserPool = None
+
+
+def get_browser_pool() -> BrowserPool:
+    """
+    process wide pool, sized by "browser_pool" in config.json
+    {"max_pages": 8, "idle_timeout": 300, "max_leaked_leases": 16}
+    """
+    global _pool
+    if _pool is None:
+        from ..utils import config_section
+
+        conf = config_section("browser_pool")
+        _pool = BrowserPool(
+            max_pages=conf.get("max_pages", 8),
+            idle_timeout=conf.get("idle_timeout", 300),
+            max_leaked_leases=conf.get("max_leaked_leases", 16),
+        )
+    return _pool
@@ -0,0 +1,178 @@
+"""
+Cheap pre-filter run between fetching pages and summarising them with a LLM
+
+Pages are converted to markdown first, then
+    - duplicated pages / paragraphs are dropped
+    - every page is cut into paragraph chunks
+    - chunks are scored against the query with BM25
+    - only the best chunks of every page are kept (in reading order)
+so the LLM only reads the part of the page that is relevant to the query.
+"""
+
+from collections import Counter
+import hashlib
+import math
+import re
+
+# letters and digits of any script, accented / non latin words are kept
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# bumped when tokenize changes, indexes built with an older one are rebuilt
+TOKENIZER_VERSION = 2
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+
+STOP_WORDS = frozenset(
+    [
+        "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "is", "are",
+        "was", "were", "be", "by", "with", "as", "at", "it", "this", "that", "from",
+        "what", "which", "who", "how", "why", "when", "where", "do", "does", "about",
+    ]
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        t for t in TOKEN_PATTERN.findall(text.casefold()) if t not in STOP_WORDS
+    ]
+
+
+def content_hash(text: str) -> str:
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def split_paragraphs(markdown: str, min_chars: int = 200, max_chars: int = 1200) -> list[str]:
+    """
+    split markdown on blank lines, merge short paragraphs (headings, list items)
+    with the next one and cut very long ones
+    """
+    chunks = []
+    buffer = []
+    size = 0
+    for paragraph in PARAGRAPH_PATTERN.split(markdown):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for start in range(0, len(paragraph), max_chars):
+            piece = paragraph[start : start + max_chars]
+            buffer.append(piece)
+            size += len(piece)
+            if size >= min_chars:
+                chunks.append("\n\n".join(buffer))
+                buffer = []
+                size = 0
+    if buffer:
+        chunks.append("\n\n".join(buffer))
+    return chunks
+
+
+def bm25_scores(query: str, chunks: list[str], k1: float = 1.5, b: float = 0.75) -> list[float]:
+    query_terms = set(tokenize(query))
+    if not query_terms or not chunks:
+        return [0.0] * len(chunks)
+
+    docs = [Counter(tokenize(c)) for c in chunks]
+    lengths = [sum(d.values()) for d in docs]
+    avg_length = (sum(lengths) / len(lengths)) or 1
+    n = len(docs)
+
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for d in docs if term in d)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    scores = []
+    for d, length in zip(docs, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = d.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+def select_relevant(
+    pages: list[dict],
+    query: str,
+    max_chunks_per_page: int = 6,
+    max_chars_per_page: int = 4000,
+) -> list[dict]:
+    """
+    Args:
+        pages: [{"url", "title", "markdown"}]
+    Return:
+        [{"url", "title", "content"}] deduplicated, only the relevant chunks kept
+    """
+    seen_pages = set()
+    seen_chunks = set()
+    page_chunks = []
+    for page in pages:
+        markdown = page.get("markdown") or ""
+        h = content_hash(markdown)
+        if not markdown.strip() or h in seen_pages:
+            continue
+        seen_pages.add(h)
+
+        chunks = []
+        for chunk in split_paragraphs(markdown):
+            ch = content_hash(chunk)
+            if ch in seen_chunks:
+                continue
+            seen_chunks.add(ch)
+            chunks.append(chunk)
+        if chunks:
+            page_chunks.append((page, chunks))
+
+    # score every chunk against the whole collection so idf is shared between pages
+    all_chunks = [c for _, chunks in page_chunks for c in chunks]
+    all_scores = bm25_scores(query, all_chunks)
+
+    result = []
+    offset = 0
+    for page, chunks in page_chunks:
+        scores = all_scores[offset : offset + len(chunks)]
+        offset += len(chunks)
+
+        ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        if scores and max(scores) > 0:
+            ranked = [i for i in ranked if scores[i] > 0]
+        else:
+            # nothing matches the query lexically, keep the beginning of the page
+            ranked = list(range(len(chunks)))
+
+        keep = []
+        size = 0
+        for i in ranked[:max_chunks_per_page]:
+            if size + len(chunks[i]) > max_chars_per_page and keep:
+                break
+            keep.append(i)
+            size += len(chunks[i])
+
+        result.append(
+            {
+                "url": page.get("url", ""),
+                "title": page.get("title", ""),
+                "content": "\n\n".join(chunks[i] for i in sorted(keep))[:max_chars_per_page],
+            }
+        )
+    return result
+
+
+def batch_pages(pages: list[dict], batch_chars: int = 12000, max_pages: int = 5) -> list[list[dict]]:
+    """
+    group pruned pages into batches so one LLM call summarise several pages
+    """
+    batches = []
+    batch = []
+    size = 0
+    for page in pages:
+        length = len(page["content"])
+        if batch and (size + length > batch_chars or len(batch) >= max_pages):
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(page)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
@@ -1,5 +1,6 @@
 from .agent import Planner, Agent
 from .router import Server, Router
+from .utils import read_config
 
 import logging 
 
@@ -10,7 +11,8 @@ async def generate_report(query, planner: Planner, agents: list[Agent]):
     TODO : refactor 
     """
     planner.query = query
-    server = Server()
+    config = read_config()
+    server = Server(max_concurrency=config.get("max_concurrency", 4))
 
     planner_router = Router(server, planner)
     server.add_router(planner.name, planner_router)
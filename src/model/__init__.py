@@ -1,6 +1,8 @@
 from .model import Model
+from .conversation import Conversation
 from .deepseek import Deepseek
 from .gemini import Gemini
 from .ollama import Ollama
 from .openai import OpenAI
 from .gork import Gork
+from .resilient import ResilientModel
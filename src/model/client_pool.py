@@ -0,0 +1,179 @@
+"""
+Process wide pool of provider clients
+
+Provider clients (OpenAI / AsyncOpenAI, genai.Client, ollama AsyncClient) own
+HTTP connection pools, building one per request throws away keep alive and TLS
+sessions. Model instances stay per session (they hold the conversation) but take
+their clients from here, shared by provider, api key and base url. The clients
+are thread safe, so sessions and agents running in threads can share them.
+
+invalidate() drops every client and re-reads .env on next use. Requests already
+running keep the client they hold, the dropped clients are closed close_delay
+seconds later (or by aclose() on shutdown) so their connections are released.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from ..utils import config_section
+
+logger = logging.getLogger(__name__)
+
+
+async def close_client(client: Any):
+    """
+    close a provider client: OpenAI / AsyncOpenAI close(), genai.Client close(),
+    ollama AsyncClient wraps an httpx client without closing it itself
+    """
+    for name in ("aclose", "close"):
+        close = getattr(client, name, None)
+        if callable(close):
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+            return
+    inner = getattr(client, "_client", None)
+    if inner is not None:
+        await close_client(inner)
+
+
+class ClientPool:
+    def __init__(self, close_delay: float = 600):
+        """
+        close_delay: seconds a dropped client stays open for requests still using it
+        """
+        self.close_delay = close_delay
+        self._lock = threading.RLock()
+        self._clients: Dict[Tuple, Any] = {}
+        self._env_loaded = False
+        # dropped by invalidate(), not closed yet
+        self._retired: list = []
+        self._closing: set = set()
+
+        self.created = 0
+        self.reused = 0
+        self.invalidations = 0
+
+    def env(self, name: str, default: str = None) -> Optional[str]:
+        """
+        os.getenv with .env loaded once per pool generation
+        """
+        with self._lock:
+            if not self._env_loaded:
+                load_dotenv(override=True)
+                self._env_loaded = True
+        return os.getenv(name, default)
+
+    def get(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+                self.created += 1
+            else:
+                self.reused += 1
+            return client
+
+    def openai(self, api_key: str, base_url: str = None):
+        """
+        Return:
+            (OpenAI, AsyncOpenAI) for any openai compatible endpoint
+        """
+        from openai import OpenAI, AsyncOpenAI
+
+        kwargs = {"api_key": api_key}
+        if base_url:
+            kwargs["base_url"] = base_url
+        return (
+            self.get(("openai", api_key, base_url), lambda: OpenAI(**kwargs)),
+            self.get(("async_openai", api_key, base_url), lambda: AsyncOpenAI(**kwargs)),
+        )
+
+    def genai(self, api_key: str):
+        from google import genai
+
+        return self.get(("genai", api_key), lambda: genai.Client(api_key=api_key))
+
+    def ollama(self, host: str = None):
+        from ollama import AsyncClient
+
+        return self.get(("ollama", host), lambda: AsyncClient(host))
+
+    def invalidate(self):
+        with self._lock:
+            retired = list(self._clients.values())
+            self._clients = {}
+            self._env_loaded = False
+            self.invalidations += 1
+            self._retired.extend(retired)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop to close them on, aclose() does it on shutdown
+            return
+        loop.call_later(self.close_delay, self._schedule_close, retired)
+
+    def _schedule_close(self, clients: list):
+        task = asyncio.ensure_future(self._close(clients))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, clients: list):
+        for client in clients:
+            with self._lock:
+                if client not in self._retired:
+                    continue
+                self._retired.remove(client)
+            try:
+                await close_client(client)
+            except Exception as e:
+                logger.warning(f"failed to close {type(client).__name__}: {e}")
+
+    async def aclose(self):
+        """
+        close every client, the current and the dropped ones, e.g. on shutdown
+        """
+        with self._lock:
+            current = list(self._clients.values())
+            self._clients = {}
+            self._retired.extend(current)
+            clients = list(self._retired)
+        await self._close(clients)
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = [key[0] for key in self._clients]
+        return {
+            "clients": len(clients),
+            "kinds": sorted(set(clients)),
+            "created": self.created,
+            "reused": self.reused,
+            "invalidations": self.invalidations,
+            "retired": len(self._retired),
+        }
+
+
+_pool: ClientPool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """
+    process wide pool, configured by "client_pool" in config.json
+    {"close_delay": 600}
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ClientPool(
+                    close_delay=config_section("client_pool").get("close_delay", 600)
+                )
+    return _pool
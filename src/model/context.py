@@ -0,0 +1,252 @@
+"""
+Per call context window of a Conversation
+
+Agents reuse one model (and its default conversation) for a whole report, so
+without a limit every call re-sends all earlier prompts and report sections.
+Before each call the ContextManager fits the conversation into a prompt-token
+budget:
+    - source blocks (long paragraphs, e.g. search results or pdf text) repeated
+      in a newer message are replaced by a short marker in the older ones
+    - the newest turns that fit are kept as they are, always the latest one
+    - older turns are folded into a rolling summary (headings and first
+      sentence of each turn) capped at summary_tokens, sent as a system message
+The folded turns leave the conversation, so it stays bounded as a session grows.
+Tokens are counted with the provider's tokenizer where one is available
+(tiktoken for openai compatible apis, loaded in a thread) and estimated otherwise.
+
+Configured by "context" in config.json
+{"max_prompt_tokens": 16000, "summary_tokens": 512, "min_block_chars": 300}
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..utils import config_section
+from .conversation import Conversation
+
+logger = logging.getLogger(__name__)
+
+BLOCK_PATTERN = re.compile(r"\n[ \t]*\n")
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE)
+SENTENCE_PATTERN = re.compile(r"(.+?[.!?])(\s|$)", re.DOTALL)
+
+REPEATED_MARKER = "[repeated source, see the latest message]"
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+# role / content overhead of a message in the chat template
+MESSAGE_OVERHEAD = 4
+
+# providers served through openai compatible apis, counted with tiktoken
+TIKTOKEN_PROVIDERS = ("openai", "gpt", "deepseek", "xAI", "gork")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ~4 characters per token for english text with BPE tokenizers
+    """
+    return len(text) // 4 + 1
+
+
+def _load_tiktoken(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # the encodings are downloaded on first use
+        logger.warning(f"tiktoken unavailable, estimating tokens: {e}")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenCounter:
+    """
+    Token count of a text, cached by the text's digest so the (long) texts
+    themselves are not kept alive by the cache.
+    The tokenizer of a tiktoken provider is loaded in a thread (the encodings
+    may be downloaded), texts are estimated until it is ready.
+    """
+
+    def __init__(self, count: Callable[[str], int] = estimate_tokens, max_entries: int = 16384):
+        self._count = count
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, loader: Callable[[], Optional[Callable[[str], int]]]):
+        def run():
+            count = loader()
+            if count is not None:
+                with self._lock:
+                    self._count = count
+                    # estimates are replaced by real counts
+                    self._cache.clear()
+
+        threading.Thread(target=run, name="token-counter-load", daemon=True).start()
+
+    def __call__(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+                return n
+            count = self._count
+        n = count(text)
+        with self._lock:
+            if count is self._count:
+                self._cache[key] = n
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return n
+
+
+def get_token_counter(provider: str, model: str = "") -> TokenCounter:
+    counter = TokenCounter()
+    if provider in TIKTOKEN_PROVIDERS:
+        counter.load(lambda: _load_tiktoken(model))
+    return counter
+
+
+class ContextManager:
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        max_prompt_tokens: int = 16000,
+        summary_tokens: int = 512,
+        min_block_chars: int = 300,
+    ):
+        self.count_tokens = count_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summary_tokens = summary_tokens
+        self.min_block_chars = min_block_chars
+
+        self.calls = 0
+        self.folded_turns = 0
+        self.deduped_blocks = 0
+
+    def _message_tokens(self, message: dict) -> int:
+        return self.count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+    def _dedupe(self, conversation: Conversation):
+        """
+        replace source blocks seen in a newer message, newest copy is kept
+        """
+        seen = set()
+        for message in reversed(conversation.messages):
+            blocks = BLOCK_PATTERN.split(message["content"])
+            changed = False
+            for i, block in enumerate(blocks):
+                if len(block) < self.min_block_chars:
+                    continue
+                digest = hashlib.sha1(block.strip().encode("utf-8")).digest()
+                if digest in seen:
+                    blocks[i] = REPEATED_MARKER
+                    changed = True
+                    self.deduped_blocks += 1
+                else:
+                    seen.add(digest)
+            if changed:
+                message["content"] = "\n\n".join(blocks)
+
+    def _gist(self, message: dict) -> str:
+        content = message["content"]
+        headings = HEADING_PATTERN.findall(content)
+        if headings:
+            gist = "; ".join(h.strip() for h in headings[:5])
+        else:
+            text = content.replace(REPEATED_MARKER, " ").strip()
+            match = SENTENCE_PATTERN.match(text)
+            gist = (match.group(1) if match else text)[:300]
+        return f"- {message['role']}: {' '.join(gist.split())}"
+
+    def _fold(self, conversation: Conversation, messages: List[dict]):
+        lines = conversation.summary.splitlines() if conversation.summary else []
+        lines += [self._gist(m) for m in messages]
+        # oldest lines go first when the summary outgrows its budget
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        conversation.summary = "\n".join(lines)
+        self.folded_turns += len(messages)
+
+    def fit(self, conversation: Conversation, max_prompt_tokens: int = None) -> List[dict]:
+        """
+        Fold / dedupe the conversation in place so it fits the budget
+
+        Return:
+            openai style messages for the call, system instruction and summary first
+        """
+        self.calls += 1
+        budget = max_prompt_tokens or conversation.max_tokens or self.max_prompt_tokens
+        self._dedupe(conversation)
+
+        fixed = 0
+        if conversation.system:
+            fixed += self.count_tokens(conversation.system) + MESSAGE_OVERHEAD
+        tokens = [self._message_tokens(m) for m in conversation.messages]
+        total = fixed + sum(tokens)
+        if conversation.summary:
+            total += self.count_tokens(conversation.summary) + MESSAGE_OVERHEAD
+
+        if total > budget:
+            # newest turns that fit next to a full summary, at least the latest one
+            summary = self.summary_tokens + self.count_tokens(SUMMARY_HEADER) + MESSAGE_OVERHEAD
+            kept, used = 0, fixed + summary
+            for t in reversed(tokens):
+                if kept and used + t > budget:
+                    break
+                kept += 1
+                used += t
+            drop = len(conversation.messages) - kept
+            if drop > 0:
+                self._fold(conversation, conversation.messages[:drop])
+                del conversation.messages[:drop]
+
+        messages = []
+        if conversation.system:
+            messages.append({"role": "system", "content": conversation.system})
+        if conversation.summary:
+            messages.append(
+                {"role": "system", "content": f"{SUMMARY_HEADER}\n{conversation.summary}"}
+            )
+        return messages + conversation.messages
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "folded_turns": self.folded_turns,
+            "deduped_blocks": self.deduped_blocks,
+            "max_prompt_tokens": self.max_prompt_tokens,
+        }
+
+
+_managers: Dict[Tuple[str, str], ContextManager] = {}
+
+
+def get_context_manager(provider: str, model: str = "") -> ContextManager:
+    """
+    one manager per provider / model, the state lives in the conversations
+    """
+    key = (provider, model)
+    if key not in _managers:
+        conf = config_section("context")
+        _managers[key] = ContextManager(
+            count_tokens=get_token_counter(provider, model),
+            max_prompt_tokens=conf.get("max_prompt_tokens", 16000),
+            summary_tokens=conf.get("summary_tokens", 512),
+            min_block_chars=conf.get("min_block_chars", 300),
+        )
+    return _managers[key]
+
+
+def context_stats() -> dict:
+    return {f"{provider}:{model}": m.stats() for (provider, model), m in _managers.items()}
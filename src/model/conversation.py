@@ -0,0 +1,57 @@
+"""
+Conversation state, kept apart from the provider clients
+
+A provider instance is only a client plus a model name, the chat history lives
+in a Conversation passed to completion / completion_stream (and their async
+versions). One shared provider can then serve many sessions at once. Providers
+keep a default conversation for callers that do not pass one (the agents).
+
+What is sent on each call is decided by the provider's ContextManager
+(src/model/context.py): it keeps the newest turns within the prompt-token budget
+and folds older ones into the summary.
+"""
+
+from typing import Iterable, List
+
+
+class Conversation:
+    def __init__(self, messages: Iterable = None, max_tokens: int = None, system: str = None):
+        """
+        messages: dicts or objects with role / content (e.g. api Message)
+        max_tokens: prompt-token budget of this conversation, the configured
+            "context.max_prompt_tokens" when None
+        """
+        self.max_tokens = max_tokens
+        self.system = system
+        # rolling summary of the turns folded out of messages
+        self.summary = ""
+        self.messages: List[dict] = []
+        for message in messages or []:
+            if isinstance(message, dict):
+                self.add(message["content"], message.get("role", "user"))
+            else:
+                self.add(message.content, message.role)
+
+    def add(self, content: str, role: str = "user"):
+        self.messages.append({"role": role, "content": content})
+
+    def to_messages(self) -> List[dict]:
+        """
+        openai style message list, untrimmed, system instruction first
+        """
+        if self.system:
+            return [{"role": "system", "content": self.system}] + self.messages
+        return list(self.messages)
+
+    def copy(self) -> "Conversation":
+        conversation = Conversation(max_tokens=self.max_tokens, system=self.system)
+        conversation.summary = self.summary
+        conversation.messages = [dict(m) for m in self.messages]
+        return conversation
+
+    def clear(self):
+        self.messages = []
+        self.summary = ""
+
+    def __len__(self) -> int:
+        return len(self.messages)
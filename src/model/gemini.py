@@ -1,13 +1,11 @@
-from google import genai
 from google.genai import types
-from openai import OpenAI
 
 from crawl4ai import LLMConfig
 
-import os
-from dotenv import load_dotenv
-
 from .model import Model
+from .client_pool import get_client_pool
+from .context import get_context_manager
+from .conversation import Conversation
 
 
 """
@@ -17,37 +15,78 @@ from .model import Model
 
 class Gemini(Model):
     def __init__(self, model):
-        load_dotenv(override=True)
-        self.api_key = os.getenv("GEMINI_API")
+        self.api_key = get_client_pool().env("GEMINI_API")
         self.model = model
-        self.client = genai.Client(api_key=self.api_key)
-        self.messages = self.client.chats.create(model=model)
+        self.client = get_client_pool().genai(self.api_key)
+        # like a chat session, the replies are kept in the conversation
+        self.conversation = Conversation()
+        self.context = get_context_manager("gemini", model)
 
     def clear_message(self):
-        self.messages = self.client.chats.create(model=self.model)
+        self.conversation.clear()
 
     def set_api(self, api):
         self.api = api
 
-    def completion(self, query: str):
-        res = self.message.send_message(query)
+    def _request(self, message: str, conversation: Conversation = None):
+        conversation = conversation if conversation is not None else self.conversation
+        conversation.add(message, "user")
+        messages = self.context.fit(conversation)
+        # instruction and summary go to the system instruction
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            types.Content(
+                role="model" if m["role"] == "assistant" else "user",
+                parts=[types.Part(text=m["content"])],
+            )
+            for m in messages
+            if m["role"] != "system"
+        ]
+        config = types.GenerateContentConfig(system_instruction=system) if system else None
+        return conversation, dict(model=self.model, contents=contents, config=config)
+
+    def completion(self, query: str, conversation: Conversation = None):
+        conversation, request = self._request(query, conversation)
+        res = self.client.models.generate_content(**request)
+        conversation.add(res.text or "", "assistant")
         return res.text
 
+    def completion_stream(self, message: str, conversation: Conversation = None):
+        conversation, request = self._request(message, conversation)
+        reply = []
+        for chunk in self.client.models.generate_content_stream(**request):
+            if chunk.text:
+                reply.append(chunk.text)
+                yield chunk.text
+        conversation.add("".join(reply), "assistant")
+
+    async def acompletion(self, query: str, conversation: Conversation = None):
+        conversation, request = self._request(query, conversation)
+        res = await self.client.aio.models.generate_content(**request)
+        conversation.add(res.text or "", "assistant")
+        return res.text
+
+    async def acompletion_stream(self, message: str, conversation: Conversation = None):
+        conversation, request = self._request(message, conversation)
+        reply = []
+        async for chunk in await self.client.aio.models.generate_content_stream(**request):
+            if chunk.text:
+                reply.append(chunk.text)
+                yield chunk.text
+        conversation.add("".join(reply), "assistant")
+
     def reset(self):
         """
         Reset chat message
         """
-        self.message = self.client.chats.create(model=Model)
+        self.clear_message()
 
     def add_system_instruction(self, instruction: str):
-        self.message.send_message(
-            config=types.GenerateContentConfig(system_instruction=instruction)
-        )
+        self.conversation.system = instruction
 
     def get_client(self):
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        client, _ = get_client_pool().openai(
+            self.api_key, "https://generativelanguage.googleapis.com/v1beta/openai/"
         )
         return client
 
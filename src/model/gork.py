@@ -1,31 +1,36 @@
 from .model import Model
-
-from openai import OpenAI
-from dotenv import load_dotenv
+from .client_pool import get_client_pool
+from .context import get_context_manager
+from .conversation import Conversation
 
 from crawl4ai import LLMConfig
 
-import os
-
 
 class Gork(Model):
     def __init__(self, model: str = "", api_key: str = ""):
-        load_dotenv(override=True)
-        self.api_key = os.getenv("XAI_API_KEY")
+        pool = get_client_pool()
+        self.api_key = pool.env("XAI_API_KEY")
         self.model = model
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.x.ai/v1",
+        self.client, self.async_client = pool.openai(
+            self.api_key, "https://api.x.ai/v1"
         )
-        self.messages = []
+        self.conversation = Conversation()
+        self.context = get_context_manager("gork", model)
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
-    def completion(self, query):
-        self._add_message(query)
+    def completion(self, query, conversation: Conversation = None):
+        conversation = self._add_message(query, conversation=conversation)
         response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
+            model=self.model, messages=self.context.fit(conversation), stream=False
+        )
+        return response.choices[0].message.content
+
+    async def acompletion(self, query, conversation: Conversation = None):
+        conversation = self._add_message(query, conversation=conversation)
+        response = await self.async_client.chat.completions.create(
+            model=self.model, messages=self.context.fit(conversation), stream=False
         )
         return response.choices[0].message.content
 
@@ -42,17 +47,29 @@ class Gork(Model):
         return self.model
 
     def clear_message(self):
-        self.messages = []
+        self.conversation.clear()
 
-    def _add_message(self, message, role="user"):
-        self.messages.append({"role": "user", "content": message})
+    def _add_message(self, message, role="user", conversation: Conversation = None):
+        conversation = conversation if conversation is not None else self.conversation
+        conversation.add(message, role)
+        return conversation
 
-    def completion_stream(self, message):
-        self._add_message(message=message, role="user")
+    def completion_stream(self, message, conversation: Conversation = None):
+        conversation = self._add_message(message, conversation=conversation)
         stream = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=True
+            model=self.model, messages=self.context.fit(conversation), stream=True
         )
         for event in stream:
             text_chunk = getattr(event.choices[0].delta, "content", None)
             if text_chunk:
                 yield text_chunk
+
+    async def acompletion_stream(self, message, conversation: Conversation = None):
+        conversation = self._add_message(message, conversation=conversation)
+        stream = await self.async_client.chat.completions.create(
+            model=self.model, messages=self.context.fit(conversation), stream=True
+        )
+        async for event in stream:
+            text_chunk = getattr(event.choices[0].delta, "content", None)
+            if text_chunk:
+                yield text_chunk
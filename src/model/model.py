@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 
 from crawl4ai import LLMConfig
 
+from .conversation import Conversation
+
 
 class Model(ABC):
     """
@@ -11,6 +13,10 @@ class Model(ABC):
     TODO: should we have one api that support
     """
 
+    # served by one local host (e.g. Ollama): a hedged request only competes
+    # for the same server, and requests may queue before they are sent
+    local = False
+
     @abstractmethod
     def __init__(self):
         pass
@@ -19,12 +25,23 @@ class Model(ABC):
         Completion is 
         Args:
             query: query can be a prompt or RAG sentence
+            conversation: history to use and extend, the model's own
+                default conversation when None
         Output:
             return a string response
     """
 
     @abstractmethod
-    def completion(self, query: str) -> str:
+    def completion(self, query: str, conversation: Conversation = None) -> str:
+        pass
+
+    """
+        Async version of completion, it should not block the event loop
+        so it is safe to call inside FastAPI handlers and agents' run method
+    """
+
+    @abstractmethod
+    async def acompletion(self, query: str, conversation: Conversation = None) -> str:
         pass
 
     @abstractmethod
@@ -48,5 +65,12 @@ class Model(ABC):
         pass
 
     @abstractmethod
-    def completion_stream(self, message):
+    def completion_stream(self, message, conversation: Conversation = None):
+        pass
+
+    @abstractmethod
+    def acompletion_stream(self, message, conversation: Conversation = None):
+        """
+        async generator yielding text chunks
+        """
         pass
@@ -1,14 +1,218 @@
 from .model import Model
-from openai import OpenAI
+from .client_pool import get_client_pool
+from .context import get_context_manager
+from .conversation import Conversation
+from ..utils import config_section
 
 from ollama import chat
 from crawl4ai import LLMConfig
 
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar, Token
+import itertools
+import os
+import time
+from typing import Callable, Optional
+import weakref
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+_priority: ContextVar[int] = ContextVar("ollama_priority", default=PRIORITY_BACKGROUND)
+_on_dispatch: ContextVar[Optional[Callable[[], None]]] = ContextVar("ollama_on_dispatch", default=None)
+
+
+def set_request_priority(priority: int):
+    """
+    priority of the Ollama requests made by the current task (and tasks it creates)
+    """
+    _priority.set(priority)
+
+
+def set_dispatch_callback(callback: Optional[Callable[[], None]]) -> Token:
+    """
+    callback run when a request made in the current context leaves the queue,
+    e.g. to start its timeout only then. Undo with reset_dispatch_callback(token)
+    """
+    return _on_dispatch.set(callback)
+
+
+def reset_dispatch_callback(token: Token):
+    _on_dispatch.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "future")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.future = future
+
+
+class OllamaDispatcher:
+    """
+    Dispatcher for concurrent async requests to the local Ollama server
+
+    Ollama runs OLLAMA_NUM_PARALLEL requests per model at once and queues the
+    rest in arrival order, so a report's background steps can delay an
+    interactive stream. Async requests take a slot from the model's dispatcher:
+        - requests arriving within window_ms are collected and dispatched
+          together, most urgent first
+        - at most max_in_flight run at once (the server's parallelism), so
+          waiting happens here where priority applies, not in the server queue
+        - priority comes from the request context (set_request_priority),
+          interactive before background; a waiting request gains one level
+          every aging seconds so background work is never starved
+    Ollama's chat api has no batch endpoint, so a "batch" is the set of requests
+    released together into the server's parallel slots.
+
+    Configured by "ollama_dispatch" in config.json
+    {"enabled": true, "max_in_flight": null, "window_ms": 5, "aging": 10}
+    max_in_flight null: OLLAMA_NUM_PARALLEL from the environment, else 4
+    """
+
+    def __init__(self, max_in_flight: int = 4, window_ms: float = 5, aging: float = 10):
+        self.max_in_flight = max_in_flight
+        self.window = window_ms / 1000
+        self.aging = aging
+        self._waiting: list[_Waiter] = []
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._flush = None
+
+        self.dispatched = 0
+        self.batches = 0
+        self.max_queued = 0
+        self._waits: dict[int, list] = {}
+
+    def _dispatch(self):
+        self._flush = None
+        now = time.monotonic()
+        released = 0
+        while self._waiting and self._in_flight < self.max_in_flight:
+            waiter = min(
+                self._waiting,
+                key=lambda w: (w.priority - (now - w.enqueued) / self.aging, w.seq),
+            )
+            self._waiting.remove(waiter)
+            if waiter.future.done():
+                continue
+            self._in_flight += 1
+            released += 1
+            wait = self._waits.setdefault(waiter.priority, [0, 0.0])
+            wait[0] += 1
+            wait[1] += now - waiter.enqueued
+            waiter.future.set_result(None)
+        if released:
+            self.dispatched += released
+            self.batches += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        if self._waiting:
+            self._dispatch()
+
+    async def acquire(self, priority: int):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), loop.create_future())
+        self._waiting.append(waiter)
+        self.max_queued = max(self.max_queued, len(self._waiting))
+        if self._flush is None:
+            self._flush = loop.call_later(self.window, self._dispatch)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # granted a slot but cancelled before using it
+                self._release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire(_priority.get())
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queued": len(self._waiting),
+            "max_queued": self.max_queued,
+            "dispatched": self.dispatched,
+            "avg_batch": round(self.dispatched / self.batches, 2) if self.batches else 0.0,
+            "avg_wait_ms": {
+                PRIORITY_NAMES.get(p, f"priority_{p}"): round(total / count * 1000, 2)
+                for p, (count, total) in self._waits.items()
+            },
+        }
+
+
+_dispatch_conf: dict = None
+# futures belong to a loop, so dispatchers are per event loop and model
+_dispatchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def _get_dispatch_conf() -> dict:
+    global _dispatch_conf
+    if _dispatch_conf is None:
+        _dispatch_conf = config_section("ollama_dispatch")
+    return _dispatch_conf
+
+
+def get_dispatcher(model: str) -> OllamaDispatcher | None:
+    """
+    None when "ollama_dispatch.enabled" is false
+    """
+    conf = _get_dispatch_conf()
+    if not conf.get("enabled", True):
+        return None
+    loop = asyncio.get_running_loop()
+    dispatchers = _dispatchers.setdefault(loop, {})
+    if model not in dispatchers:
+        max_in_flight = conf.get("max_in_flight") or int(os.getenv("OLLAMA_NUM_PARALLEL") or 4)
+        dispatchers[model] = OllamaDispatcher(
+            max_in_flight=max_in_flight,
+            window_ms=conf.get("window_ms", 5),
+            aging=conf.get("aging", 10),
+        )
+    return dispatchers[model]
+
+
+@asynccontextmanager
+async def dispatch_slot(model: str):
+    dispatcher = get_dispatcher(model)
+    async with dispatcher.slot() if dispatcher is not None else nullcontext():
+        callback = _on_dispatch.get()
+        if callback is not None:
+            callback()
+        yield
+
+
+def dispatcher_stats() -> dict:
+    return {
+        model: dispatcher.stats()
+        for dispatchers in list(_dispatchers.values())
+        for model, dispatcher in dispatchers.items()
+    }
+
 
 class Ollama(Model):
+    local = True
+
     def __init__(self, model: str):
         self.model = model
-        self.messages = []
+        self.conversation = Conversation()
+        self.context = get_context_manager("ollama", model)
+        self.async_client = get_client_pool().ollama()
 
     def set_api(self, api):
         """
@@ -16,33 +220,52 @@ class Ollama(Model):
         """
         return
 
-    def completion(self, message: str, stream: str = False):
-        self._append_message(message=message, role="user")
+    def completion(self, message: str, stream: str = False, conversation: Conversation = None):
+        conversation = self._append_message(message=message, role="user", conversation=conversation)
         msg_cache = ""
         if stream == False:
-            res = chat(model=self.model, messages=self.messages, stream=False)
-            self._append_message(role="assistant", message=res["message"]["content"])
+            res = chat(model=self.model, messages=self.context.fit(conversation), stream=False)
+            conversation.add(res["message"]["content"], "assistant")
         else:
             """
             Should be removed
             """
-            res = chat(model=self.model, messages=self.messages, stream=True)
+            res = chat(model=self.model, messages=self.context.fit(conversation), stream=True)
             for chunk in res:
                 msg_cache += chunk["message"]["content"]
                 print(chunk["message"]["content"], end="", flush=True)
         return res["message"]["content"] if stream == False else msg_cache
 
-    def completion_stream(self, message: str):
-        self._append_message(message=message, role="user")
-        res = chat(model=self.model, messages=self.messages, stream=True)
+    def completion_stream(self, message: str, conversation: Conversation = None):
+        conversation = self._append_message(message=message, role="user", conversation=conversation)
+        res = chat(model=self.model, messages=self.context.fit(conversation), stream=True)
         for chunk in res:
             if chunk["message"]["content"]:
                 yield chunk["message"]["content"]
 
+    async def acompletion(self, message: str, conversation: Conversation = None):
+        conversation = self._append_message(message=message, role="user", conversation=conversation)
+        async with dispatch_slot(self.model):
+            res = await self.async_client.chat(
+                model=self.model, messages=self.context.fit(conversation), stream=False
+            )
+        conversation.add(res["message"]["content"], "assistant")
+        return res["message"]["content"]
+
+    async def acompletion_stream(self, message: str, conversation: Conversation = None):
+        conversation = self._append_message(message=message, role="user", conversation=conversation)
+        # the server slot is busy until the stream ends
+        async with dispatch_slot(self.model):
+            res = await self.async_client.chat(
+                model=self.model, messages=self.context.fit(conversation), stream=True
+            )
+            async for chunk in res:
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
+
     def get_client(self):
-        client = OpenAI(
-            base_url="http://localhost:11434/v1",
-            api_key="ollama",  # required, but unused
+        client, _ = get_client_pool().openai(
+            "ollama", "http://localhost:11434/v1"  # api key required, but unused
         )
         return client
 
@@ -53,7 +276,9 @@ class Ollama(Model):
         return LLMConfig(provider="ollama/" + self.model, api_token=None)
 
     def clear_message(self):
-        self.messages = []
+        self.conversation.clear()
 
-    def _append_message(self, role: str, message: str):
-        self.messages.append({"role": role, "content": message})
+    def _append_message(self, role: str, message: str, conversation: Conversation = None):
+        conversation = conversation if conversation is not None else self.conversation
+        conversation.add(message, role)
+        return conversation
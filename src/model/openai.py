@@ -1,13 +1,12 @@
 from .model import Model
+from .client_pool import get_client_pool
+from .context import get_context_manager
+from .conversation import Conversation
+from .resilient import EmptyResponseError
 from ..utils import read_config
 
-from openai import OpenAI as openai
-from dotenv import load_dotenv
-
 from crawl4ai import LLMConfig
 
-import os
-
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,43 +14,47 @@ logger = logging.getLogger(__name__)
 
 class OpenAI(Model):
     def __init__(self, model: str = "", api_key: str = ""):
-        load_dotenv(override=True)
-        self.api_key = os.getenv("OPENAI_API_KEY")
+        pool = get_client_pool()
+        self.api_key = pool.env("OPENAI_API_KEY")
 
         config = read_config()
-        if config.get("base_url", "") == "":
-            self.client = openai(
-                api_key=self.api_key,
-            )
-        else:
-            self.client = openai(
-                api_key=self.api_key, base_url=config.get("base_url", "")
-            )
+        self.client, self.async_client = pool.openai(
+            self.api_key, config.get("base_url", "") or None
+        )
 
         self.model = model
-        self.messages = []
+        self.conversation = Conversation()
+        self.context = get_context_manager("openai", model)
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
-    def completion(self, query):
-        self._add_message(query)
+    def completion(self, query, conversation: Conversation = None):
+        conversation = self._add_message(query, conversation=conversation)
         response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
+            model=self.model, messages=self.context.fit(conversation), stream=False
         )
-        while not response.choices:
-            response = self.client.chat.completions.create(
-                model=self.model, messages=self.messages, stream=False
-            )
+        if not response.choices:
+            # retried with backoff by ResilientModel
+            raise EmptyResponseError(f"no choices in the response of {self.model}")
         return response.choices[0].message.content
 
-    def completion_stream(self, message):
-        self._add_message(message=message, role="user")
+    async def acompletion(self, query, conversation: Conversation = None):
+        conversation = self._add_message(query, conversation=conversation)
+        response = await self.async_client.chat.completions.create(
+            model=self.model, messages=self.context.fit(conversation), stream=False
+        )
+        if not response.choices:
+            raise EmptyResponseError(f"no choices in the response of {self.model}")
+        return response.choices[0].message.content
+
+    def completion_stream(self, message, conversation: Conversation = None):
+        conversation = self._add_message(message, conversation=conversation)
 
         try:
             stream = self.client.chat.completions.create(
                 model=self.model,
-                messages=self.messages,
+                messages=self.context.fit(conversation),
                 stream=True,
                 temperature=0.7,
                 extra_body={
@@ -91,6 +94,52 @@ class OpenAI(Model):
             logger.error(f"Stream error: {e}")
             raise
 
+    async def acompletion_stream(self, message, conversation: Conversation = None):
+        conversation = self._add_message(message, conversation=conversation)
+
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=self.context.fit(conversation),
+                stream=True,
+                temperature=0.7,
+                extra_body={
+                    "provider": {
+                        "order": ["cerebras","groq"], 
+                        "allow_fallbacks": True
+                    }
+                }
+            )
+
+            buffer = []
+            buffer_size = 3  # smaller buffer for faster yield
+
+            async for event in stream:
+                if not event.choices:
+                    continue
+
+                choice = event.choices[0]
+
+                if hasattr(choice, "finish_reason") and choice.finish_reason:
+                    if buffer:
+                        yield "".join(buffer)
+                    break
+
+                content = getattr(choice.delta, "content", None)
+                if content:
+                    buffer.append(content)
+
+                    if len(buffer) >= buffer_size:
+                        yield "".join(buffer)
+                        buffer = []
+
+            if buffer:
+                yield "".join(buffer)
+
+        except Exception as e:
+            logger.error(f"Stream error: {e}")
+            raise
+
     def add_system_instructuion(self, instruction: str):
         pass
 
@@ -104,10 +153,9 @@ class OpenAI(Model):
         return self.model
 
     def clear_message(self):
-        self.messages = []
+        self.conversation.clear()
 
-    def _add_message(self, message, role="user"):
-        max_history = 20
-        self.messages.append({"role": role, "content": message})
-        if len(self.messages) > max_history:
-            self.messages = self.messages[-max_history:]
+    def _add_message(self, message, role="user", conversation: Conversation = None):
+        conversation = conversation if conversation is not None else self.conversation
+        conversation.add(message, role)
+        return conversation
@@ -0,0 +1,633 @@
+"""
+Resilience layer around the Model interface
+
+ResilientModel wraps an ordered list of (provider, model) candidates, the
+configured model first and then the fallbacks, and is itself a Model:
+    - retries with exponential backoff and full jitter
+    - a timeout per attempt and a deadline for the whole call
+    - optional hedging: when an attempt is slower than the provider's recent p95,
+      a second identical request is sent and the first answer wins (not for
+      local models, the second request would only compete for the same server)
+    - ordered fallback to the next candidate when one keeps failing
+    - a circuit breaker per provider, so a provider that is down is skipped
+      until reset_timeout has passed instead of eating every call's deadline
+Latency histograms and breaker states are process wide (ProviderHealth) and
+shared by every session.
+
+Streams are retried / failed over only until their first chunk, a stream that
+breaks after that raises to the caller.
+
+A local model's request may first wait in the Ollama dispatcher queue. Its
+attempt timeout starts when it leaves the queue; the time queued only counts
+against the deadline, and running out of it while queued is not held against
+the provider's breaker.
+
+Every attempt runs on a copy of the conversation, only the successful one is
+kept, so retried and hedged requests do not add the query twice.
+
+Configured by "resilience" in config.json
+{
+    "enabled": true,
+    "fallbacks": [],           # e.g. [{"provider": "deepseek", "model": "deepseek-chat"}]
+    "retries": 2,              # per candidate, after the first attempt
+    "base_delay": 0.5,
+    "max_delay": 8,
+    "timeout": 60,             # per attempt (first chunk for streams)
+    "deadline": 180,           # whole call
+    "hedge": false,
+    "hedge_min_samples": 20,
+    "hedge_min_delay": 1.0,
+    "failure_threshold": 5,
+    "reset_timeout": 30
+}
+"""
+
+import asyncio
+from bisect import bisect_left
+from collections import deque
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from crawl4ai import LLMConfig
+
+from .model import Model
+from .conversation import Conversation
+from .ollama import reset_dispatch_callback, set_dispatch_callback
+
+logger = logging.getLogger(__name__)
+
+# client errors a retry cannot fix, the next candidate may still work
+NON_RETRYABLE_STATUS = (400, 401, 403, 404, 422)
+
+
+class EmptyResponseError(Exception):
+    """
+    the provider answered without any choice / text
+    """
+
+
+class QueueTimeoutError(asyncio.TimeoutError):
+    """
+    the deadline passed while the request waited for a local model, not a provider failure
+    """
+
+
+class ProviderUnavailableError(Exception):
+    """
+    every candidate failed or has its circuit open
+    """
+
+
+class LatencyHistogram:
+    BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(self, window: int = 200):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.BUCKETS, seconds)] += 1
+        self.total += seconds
+        self._recent.append(seconds)
+
+    def samples(self) -> int:
+        return len(self._recent)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        over the recent window, None without samples
+        """
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def stats(self) -> dict:
+        count = sum(self.counts)
+        labels = [f"<={b}s" for b in self.BUCKETS] + [f">{self.BUCKETS[-1]}s"]
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "count": count,
+            "avg": round(self.total / count, 3) if count else None,
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and (
+            # a probe that never reported back expires
+            not self._probing or now - self._probe_started >= self.reset_timeout
+        ):
+            # one trial request decides whether the provider is back
+            self._probing = True
+            self._probe_started = now
+            return True
+        return False
+
+    def release(self):
+        """
+        the trial request ended without a verdict (cancelled), allow the next one
+        """
+        if self.state == "half_open":
+            self._probing = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ProviderHealth:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+        # time to first chunk of streams
+        self.first_chunk = LatencyHistogram()
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            return self.breaker.allow()
+
+    def success(self, seconds: float, stream: bool = False):
+        with self._lock:
+            self.successes += 1
+            (self.first_chunk if stream else self.latency).observe(seconds)
+            self.breaker.record_success()
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def abandon(self):
+        """
+        the request ended without success or failure, e.g. it was cancelled
+        """
+        with self._lock:
+            self.breaker.release()
+
+    def hedge_delay(self, min_samples: int, min_delay: float) -> Optional[float]:
+        with self._lock:
+            if self.latency.samples() < min_samples:
+                return None
+            return max(min_delay, self.latency.quantile(0.95))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "circuit": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "trips": self.breaker.trips,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "fallbacks": self.fallbacks,
+                "latency": self.latency.stats(),
+                "first_chunk": self.first_chunk.stats(),
+            }
+
+
+_health: Dict[str, ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_provider_health(name: str, conf: dict = None) -> ProviderHealth:
+    conf = conf or {}
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth(
+                failure_threshold=conf.get("failure_threshold", 5),
+                reset_timeout=conf.get("reset_timeout", 30),
+            )
+        return _health[name]
+
+
+def provider_health_stats() -> dict:
+    with _health_lock:
+        health = dict(_health)
+    return {name: h.stats() for name, h in health.items()}
+
+
+def _retryable(error: Exception) -> bool:
+    return getattr(error, "status_code", None) not in NON_RETRYABLE_STATUS
+
+
+def _next_within(stream, timeout: float):
+    """
+    next(stream) for a blocking stream, TimeoutError after timeout seconds.
+    The read runs in a daemon thread that cannot be interrupted, on a timeout
+    the stream is left to it and dropped
+    """
+    box = {}
+    done = threading.Event()
+
+    def read():
+        try:
+            box["chunk"] = next(stream)
+        except BaseException as e:
+            box["error"] = e
+        done.set()
+
+    # keep the request priority and other context of the caller
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(read,), daemon=True).start()
+    if not done.wait(max(timeout, 0)):
+        raise TimeoutError(f"no chunk within {timeout:.1f}s")
+    if "error" in box:
+        raise box["error"]
+    return box["chunk"]
+
+
+class ResilientModel(Model):
+    def __init__(
+        self,
+        candidates: List[Tuple[str, str]],
+        build: Callable[[str, str], Model],
+        conf: dict = None,
+    ):
+        """
+        candidates: [(provider, model)] in the order they are tried
+        build: makes the provider instance, only called when a candidate is needed
+        """
+        conf = conf or {}
+        self.candidates = candidates
+        self.build = build
+        self.conf = conf
+        self.retries = conf.get("retries", 2)
+        self.base_delay = conf.get("base_delay", 0.5)
+        self.max_delay = conf.get("max_delay", 8)
+        self.timeout = conf.get("timeout", 60)
+        self.deadline = conf.get("deadline", 180)
+        self.hedge = conf.get("hedge", False)
+        self.hedge_min_samples = conf.get("hedge_min_samples", 20)
+        self.hedge_min_delay = conf.get("hedge_min_delay", 1.0)
+
+        self.conversation = Conversation()
+        self._models: Dict[int, Model] = {}
+
+    def _model(self, index: int) -> Optional[Model]:
+        if index not in self._models:
+            provider, model = self.candidates[index]
+            try:
+                self._models[index] = self.build(provider, model)
+            except Exception as e:
+                logger.warning(f"cannot create {provider}:{model}: {e}")
+                self._models[index] = None
+        return self._models[index]
+
+    def _available(self):
+        """
+        yield (name, health, model) of candidates whose circuit lets a call through
+        """
+        for i, (provider, model_name) in enumerate(self.candidates):
+            name = f"{provider}:{model_name}"
+            health = get_provider_health(name, self.conf)
+            if not health.allow():
+                continue
+            model = self._model(i)
+            if model is None:
+                health.failure()
+                continue
+            if i > 0:
+                health.fallbacks += 1
+                logger.info(f"falling back to {name}")
+            yield name, health, model
+
+    def _backoff(self, attempt: int, remaining: float) -> float:
+        cap = min(self.max_delay, self.base_delay * 2**attempt)
+        return min(random.uniform(0, cap), max(remaining, 0))
+
+    def _conversation(self, conversation: Conversation = None) -> Conversation:
+        return conversation if conversation is not None else self.conversation
+
+    @staticmethod
+    def _commit(conversation: Conversation, attempt: Conversation):
+        conversation.messages = attempt.messages
+        conversation.summary = attempt.summary
+
+    async def _dispatched(self, task: asyncio.Future, dispatched: asyncio.Event, end: float):
+        """
+        wait until a local model's request left the dispatcher queue (or ended),
+        the time queued is only bounded by the deadline
+        """
+        waiter = asyncio.ensure_future(dispatched.wait())
+        try:
+            await asyncio.wait(
+                [task, waiter],
+                timeout=max(end - time.monotonic(), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            waiter.cancel()
+        if not dispatched.is_set() and not task.done():
+            raise QueueTimeoutError("deadline exceeded while queued for the local model")
+
+    async def _call(self, health: ProviderHealth, model: Model, query: str, conversation: Conversation, end: float):
+        """
+        one attempt, hedged with a second request after the provider's p95
+        The attempt timeout starts once the request is sent, a local model's
+        request may wait in the dispatcher queue before that.
+        """
+        dispatched = asyncio.Event()
+
+        async def request():
+            attempt = conversation.copy()
+            start = time.perf_counter()
+
+            def on_dispatch():
+                nonlocal start
+                start = time.perf_counter()
+                dispatched.set()
+
+            # the task runs in its own copy of the context
+            set_dispatch_callback(on_dispatch)
+            res = await model.acompletion(query, attempt)
+            if not res:
+                raise EmptyResponseError(f"empty response from {model.get_model()}")
+            return res, attempt, time.perf_counter() - start
+
+        first = asyncio.create_task(request())
+        tasks = [first]
+        try:
+            if model.local:
+                await self._dispatched(first, dispatched, end)
+            start = time.monotonic()
+            timeout = min(self.timeout, end - start)
+            delay = (
+                health.hedge_delay(self.hedge_min_samples, self.hedge_min_delay)
+                if self.hedge and not model.local
+                else None
+            )
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    health.hedges += 1
+                    tasks.append(asyncio.create_task(request()))
+            error = None
+            while tasks:
+                remaining = timeout - (time.monotonic() - start)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if model.local and timeout < self.timeout:
+                        # the queue used up the deadline, the server did not time out
+                        raise QueueTimeoutError("deadline exceeded while queued for the local model")
+                    raise asyncio.TimeoutError(f"no response within {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            health.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                tasks = [t for t in tasks if not t.done()]
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _first_chunk(self, model: Model, stream, end: float):
+        """
+        Return:
+            (first chunk, perf_counter time the request was sent)
+        """
+        sent = time.perf_counter()
+        if not model.local:
+            first = await asyncio.wait_for(
+                stream.__anext__(), timeout=min(self.timeout, end - time.monotonic())
+            )
+            return first, sent
+
+        dispatched = asyncio.Event()
+
+        def on_dispatch():
+            nonlocal sent
+            sent = time.perf_counter()
+            dispatched.set()
+
+        # the task copies the context, the callback does not outlive this call
+        token = set_dispatch_callback(on_dispatch)
+        try:
+            task = asyncio.ensure_future(stream.__anext__())
+        finally:
+            reset_dispatch_callback(token)
+        try:
+            await self._dispatched(task, dispatched, end)
+            timeout = min(self.timeout, end - time.monotonic())
+            try:
+                first = await asyncio.wait_for(task, timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                if timeout < self.timeout:
+                    raise QueueTimeoutError("deadline exceeded while queued for the local model") from None
+                raise
+        except BaseException:
+            task.cancel()
+            raise
+        return first, sent
+
+    async def acompletion(self, query: str, conversation: Conversation = None) -> str:
+        conversation = self._conversation(conversation)
+        end = time.monotonic() + self.deadline
+        error: Exception = None
+        for name, health, model in self._available():
+            for attempt in range(self.retries + 1):
+                if end - time.monotonic() <= 0:
+                    health.abandon()
+                    raise ProviderUnavailableError(f"deadline of {self.deadline}s exceeded: {error}")
+                try:
+                    res, result, seconds = await self._call(health, model, query, conversation, end)
+                except asyncio.CancelledError:
+                    health.abandon()
+                    raise
+                except QueueTimeoutError as e:
+                    # the local server is busy, not failing
+                    error = e
+                    health.abandon()
+                    break
+                except Exception as e:
+                    error = e
+                    health.failure()
+                    logger.warning(f"{name} attempt {attempt + 1} failed: {e!r}")
+                    if not _retryable(e) or attempt == self.retries or not health.allow():
+                        break
+                    health.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, end - time.monotonic()))
+                    continue
+                health.success(seconds)
+                self._commit(conversation, result)
+                return res
+        raise ProviderUnavailableError(f"no model provider available: {error!r}")
+
+    def completion(self, query: str, conversation: Conversation = None) -> str:
+        """
+        blocking version: retries, fallback and breakers, the deadline is only
+        checked between attempts and there is no hedging
+        """
+        conversation = self._conversation(conversation)
+        end = time.monotonic() + self.deadline
+        error: Exception = None
+        for name, health, model in self._available():
+            for attempt in range(self.retries + 1):
+                if time.monotonic() >= end:
+                    health.abandon()
+                    raise ProviderUnavailableError(f"deadline of {self.deadline}s exceeded: {error}")
+                result = conversation.copy()
+                start = time.perf_counter()
+                try:
+                    res = model.completion(query, result)
+                    if not res:
+                        raise EmptyResponseError(f"empty response from {model.get_model()}")
+                except Exception as e:
+                    error = e
+                    health.failure()
+                    logger.warning(f"{name} attempt {attempt + 1} failed: {e!r}")
+                    if not _retryable(e) or attempt == self.retries or not health.allow():
+                        break
+                    health.retries += 1
+                    time.sleep(self._backoff(attempt, end - time.monotonic()))
+                    continue
+                health.success(time.perf_counter() - start)
+                self._commit(conversation, result)
+                return res
+        raise ProviderUnavailableError(f"no model provider available: {error!r}")
+
+    async def acompletion_stream(self, message, conversation: Conversation = None):
+        conversation = self._conversation(conversation)
+        end = time.monotonic() + self.deadline
+        error: Exception = None
+        for name, health, model in self._available():
+            for attempt in range(self.retries + 1):
+                if end - time.monotonic() <= 0:
+                    health.abandon()
+                    raise ProviderUnavailableError(f"deadline of {self.deadline}s exceeded: {error}")
+                result = conversation.copy()
+                stream = model.acompletion_stream(message, result)
+                try:
+                    first, start = await self._first_chunk(model, stream, end)
+                except asyncio.CancelledError:
+                    health.abandon()
+                    await stream.aclose()
+                    raise
+                except QueueTimeoutError as e:
+                    # the local server is busy, not failing
+                    await stream.aclose()
+                    error = e
+                    health.abandon()
+                    break
+                except Exception as e:
+                    await stream.aclose()
+                    error = e if not isinstance(e, StopAsyncIteration) else EmptyResponseError(
+                        f"empty stream from {model.get_model()}"
+                    )
+                    health.failure()
+                    logger.warning(f"{name} stream attempt {attempt + 1} failed: {error!r}")
+                    if not _retryable(error) or attempt == self.retries or not health.allow():
+                        break
+                    health.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, end - time.monotonic()))
+                    continue
+                health.success(time.perf_counter() - start, stream=True)
+                yield first
+                async for chunk in stream:
+                    yield chunk
+                self._commit(conversation, result)
+                return
+        raise ProviderUnavailableError(f"no model provider available: {error!r}")
+
+    def completion_stream(self, message, conversation: Conversation = None):
+        """
+        blocking version: failover until the first chunk, within the attempt
+        timeout and the deadline like acompletion_stream but without hedging.
+        A first read that times out keeps a thread until the provider gives up,
+        async callers should use acompletion_stream
+        """
+        conversation = self._conversation(conversation)
+        end = time.monotonic() + self.deadline
+        error: Exception = None
+        for name, health, model in self._available():
+            for attempt in range(self.retries + 1):
+                if end - time.monotonic() <= 0:
+                    health.abandon()
+                    raise ProviderUnavailableError(f"deadline of {self.deadline}s exceeded: {error}")
+                result = conversation.copy()
+                stream = model.completion_stream(message, result)
+                start = time.perf_counter()
+                try:
+                    first = _next_within(stream, min(self.timeout, end - time.monotonic()))
+                except Exception as e:
+                    error = e if not isinstance(e, StopIteration) else EmptyResponseError(
+                        f"empty stream from {model.get_model()}"
+                    )
+                    health.failure()
+                    logger.warning(f"{name} stream attempt {attempt + 1} failed: {error!r}")
+                    if not _retryable(error) or attempt == self.retries or not health.allow():
+                        break
+                    health.retries += 1
+                    time.sleep(self._backoff(attempt, end - time.monotonic()))
+                    continue
+                health.success(time.perf_counter() - start, stream=True)
+                yield first
+                yield from stream
+                self._commit(conversation, result)
+                return
+        raise ProviderUnavailableError(f"no model provider available: {error!r}")
+
+    def primary(self) -> Model:
+        return self._model(0)
+
+    def get_client(self):
+        return self.primary().get_client()
+
+    def get_model(self):
+        return self.candidates[0][1]
+
+    def get_llm_config(self) -> LLMConfig:
+        return self.primary().get_llm_config()
+
+    def set_api(self, api: str) -> None:
+        self.primary().set_api(api)
+
+    def clear_message(self):
+        self.conversation.clear()
@@ -1,4 +1,4 @@
 from .rag import retrival_agent_prompt
 from .planner import planner_agent_prompt
-from .summary import summary_prompt
-from .retrival import retrieval_prompt
+from .summary import summary_prompt, page_summary_prompt, summary_reduce_prompt
+from .retrival import retrieval_prompt, retrieval_batch_prompt
@@ -29,12 +29,17 @@ def planner_agent_prompt(
     - Ensure each subtask is specific and well-defined.
     - Your response must be strictly in the following JSON format, including the triple backticks and the "json" language tag exactly as shown. This is critical for proper parsing:
     - You should only call one time reporter to generate a full report ! 
+    - Give every subtask a unique "id". In "depends_on" list the ids of the subtasks that must finish before it can start.
+    - Subtasks that do not depend on each other (e.g. searching two different topics) should not depend on each other so they can run at the same time.
+    - The reporter must depend on every subtask that collects information.
 
     ```json
     [
         {{
+            "id": "<unique id, e.g. 1>",
             "task": "<specific subtask>",
-            "agent": "<assigned agent>"
+            "agent": "<assigned agent>",
+            "depends_on": ["<id of a subtask that must finish first>", ...]
         }},
         ...
     ]
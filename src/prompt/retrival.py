@@ -29,3 +29,44 @@ Return the result strictly in the following JSON format:
 
 Ensure the JSON is properly formatted and valid.
 """
+
+
+def retrieval_batch_prompt(query: str, sources: list[dict]) -> str:
+    """
+    sources: [{"url": file path, "content": retrieved chunks of that file}]
+    """
+    files = "\n\n".join(
+        f"""### Source {i + 1}
+file: {source["url"]}
+\"\"\"
+{source["content"]}
+\"\"\""""
+        for i, source in enumerate(sources)
+    )
+    return f"""
+You are provided with text passages retrieved from {len(sources)} local files for the query: {query}
+
+{files}
+
+For EVERY source generate a structured JSON object containing the following fields:
+
+- "title": A concise and descriptive title capturing the main topic of the content.
+- "summary": A detailed summary of approximately 200 words that captures all key points and insights.
+- "brief_summary": A very short summary (1-2 sentences) highlighting the core idea.
+- "keywords": A list of relevant keywords or key phrases that best represent the content.
+- "url": The file path exactly as given.
+
+Return a JSON array with one object per source, in the same order as the sources:
+
+[
+  {{
+    "title": "string",
+    "summary": "string",
+    "brief_summary": "string",
+    "keywords": ["string", "string", ...],
+    "url": "string"
+  }}
+]
+
+Ensure the JSON is properly formatted and valid.
+"""
@@ -1,3 +1,9 @@
+# bump a version when its prompt changes, cached summaries of older versions are not reused
+SUMMARY_PROMPT_VERSION = "summary-1"
+PAGE_SUMMARY_PROMPT_VERSION = "page-1"
+SUMMARY_REDUCE_PROMPT_VERSION = "reduce-1"
+
+
 def summary_prompt(content: str, db: list[str]) -> str:
     previous_summaries_text = "None."
     if db:
@@ -62,3 +68,81 @@ def summary_prompt(content: str, db: list[str]) -> str:
 
       Adhere strictly to these instructions to ensure high-quality, non-redundant summarization.
       """
+
+
+def page_summary_prompt(query: str, pages: list[dict]) -> str:
+    """
+    pages: [{"url", "title", "content"}] already pruned to the query relevant part
+    """
+    sources = "\n\n".join(
+        f"""### Page {i + 1}
+url: {page["url"]}
+title: {page["title"]}
+---
+{page["content"]}
+---"""
+        for i, page in enumerate(pages)
+    )
+    return f"""
+      You are given the relevant parts of {len(pages)} webpages. For EVERY page extract the following information relevant to the query: {query}
+
+      - title: The main title of the page.
+      - summary: A detailed summary describing the main content of the page. (around 300 - 400 words)
+      - brief_summary: A concise summary of the page. (2 to 3 sentences)
+      - keywords: A list of relevant keywords or key phrases that represent the main topics of the page.
+      - url: the page url exactly as given
+
+      {sources}
+
+      Return a JSON array with one object per page, in the same order as the pages:
+
+      ```json
+      [
+        {{
+          "title": "string",
+          "summary": "string",
+          "brief_summary": "string",
+          "keywords": ["string", "string", ...],
+          "url": "string"
+        }}
+      ]
+      ```
+
+      If a page is not relevant to the query, use "error" as its title.
+      Only provide the JSON array without any additional text or explanation.
+      """
+
+
+def summary_reduce_prompt(records: list[dict]) -> str:
+    """
+    records: summaries of consecutive parts of one document, in document order
+    """
+    parts = "\n\n".join(
+        f"""### Part {i + 1}: {record.get("title", "")}
+{record.get("summary", "")}
+keywords: {", ".join(record.get("keywords") or [])}"""
+        for i, record in enumerate(records)
+    )
+    return f"""
+      You are given the summaries of {len(records)} consecutive parts of the same document, in order.
+
+      {parts}
+
+      Merge them into ONE summary of the whole text they cover:
+         *   Keep every key argument, finding and data point, drop repetitions between parts.
+         *   summary: around 300 - 400 words.
+         *   brief_summary: 1 to 3 concise sentences.
+         *   keywords: the most representative keywords of all parts.
+
+      Provide your response strictly in the following JSON format:
+
+      ```json
+      {{
+         "title": "Title of the whole text",
+         "summary": "merged summary",
+         "brief_summary": "short summary",
+         "keywords": ["keyword_1", ...],
+         "url": "string"
+      }}
+      ```
+      """
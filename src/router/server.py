@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,14 +26,21 @@ class Server:
             state 1: no more searching step action terminate
             state 2: not enough content --> action: summary with local top k selected document [TODO: maybe save in sqlite3 ?]
             state 3: enough content --> action return summary
+
+        parallel:
+            planner may send {"agent": "PARALLEL", "task": [{"agent", "task"}, ...]}
+            when several independent tasks are ready. They run concurrently (at most
+            max_concurrency at a time) and their data is merged in plan order before
+            control goes back to the planner.
     """
 
-    def __init__(self):
+    def __init__(self, max_concurrency: int = 4):
         self.routers: dict = {}
         self.router_list: list = []
         self.initial_router: str = ""
         self.next_router = None
         self.data = []
+        self.max_concurrency = max(1, max_concurrency)
 
     def recv_message(self):
         pass
@@ -50,8 +58,61 @@ class Server:
             if self.check_response(query):
                 return query
 
+            if query["agent"] == "PARALLEL":
+                query = await self.run_parallel(query["task"], query["data"])
+                if self.check_response(query):
+                    return query
+
             self.next_router, query, self.data = self.query_handler(query)
 
+    async def run_parallel(self, tasks: list[dict], data: list):
+        """
+        Run independent tasks concurrently and merge what they produce.
+
+        Agents keep per-run state (e.g. the searcher's todo and url list), so
+        tasks for the same agent run one after another and only different agents
+        run concurrently. Every task gets its own copy of data so agents
+        appending in place do not race each other. New items are appended to
+        data in the order the planner listed the tasks, not in the order they
+        finish, so the merged result is deterministic. If one of the tasks
+        terminates the workflow its response is returned directly.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        responses: list = [None] * len(tasks)
+
+        by_agent: dict[str, list[int]] = {}
+        for i, t in enumerate(tasks):
+            by_agent.setdefault(t["agent"], []).append(i)
+
+        async def run_agent(agent: str, indexes: list[int]):
+            router = self.routers[agent]
+            for i in indexes:
+                async with semaphore:
+                    logger.info(f"handling parallel task {agent} , {tasks[i]['task']}")
+                    responses[i] = await router.recv_response(tasks[i]["task"], list(data))
+
+        await asyncio.gather(*[run_agent(a, ix) for a, ix in by_agent.items()])
+
+        merged = list(data)
+        for response in responses:
+            if self.check_response(response):
+                return response
+            merged.extend(self._new_items(data, response.get("data") or []))
+
+        return {"agent": self.initial_router, "task": "", "data": merged}
+
+    def _new_items(self, base: list, result: list) -> list:
+        """
+        Items an agent added on top of base. Most agents append to the list they
+        receive, others (e.g. searcher) return their own list.
+        """
+        if len(result) >= len(base) and all(
+            a is b for a, b in zip(base, result[: len(base)])
+        ):
+            return result[len(base) :]
+        base_ids = {id(b) for b in base}
+        return [item for item in result if id(item) not in base_ids]
+
     def query_handler(self, query: dict):
         """
         This should parese the query and get
@@ -1 +1,2 @@
-from .config import read_config, write_config
+from .config import read_config, write_config, config_section
+from .sqlite_cache import SQLiteCache
@@ -16,3 +16,15 @@ def read_config():
 def write_config(config):
     with open("./config.json", "w") as file:
         json.dump(config, file, indent=4)
+
+
+def config_section(name: str, default=None):
+    """
+    a top level entry of config.json, default ({} when None) if it is missing
+    or there is no config.json
+    """
+    default = {} if default is None else default
+    try:
+        return read_config().get(name, default)
+    except FileNotFoundError:
+        return default
@@ -0,0 +1,238 @@
+"""
+SQLite backed key / value store with an age and size budget
+
+Base of the on disk caches (page content, summaries, embeddings). Every row is
+    (key, <the cache's columns>, created_at, accessed_at, size)
+    - max_age: rows created more than max_age seconds ago are not returned and
+      are dropped on the next write, None keeps them
+    - max_bytes: total size budget, least recently used rows are dropped first
+Reads only note the access time in memory, it is written with the next write or
+once flush_every reads or flush_interval seconds have gone by.
+A cache whose schema changed bumps schema_version, the old rows are dropped.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+def value_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 0
+
+
+class SQLiteCache:
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        columns: dict[str, str],
+        max_bytes: int,
+        max_age: float = None,
+        schema_version: int = 1,
+        flush_every: int = 256,
+        flush_interval: float = 30,
+        timeout: float = 5.0,
+    ):
+        """
+        columns: name -> sql type of the cache's own columns, e.g. {"content": "TEXT NOT NULL"}
+        """
+        self.table = table
+        self.columns = list(columns)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != schema_version:
+            self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"PRAGMA user_version = {schema_version}")
+        definitions = "".join(f"{name} {type}, " for name, type in columns.items())
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                {definitions}
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)"
+        )
+        self._conn.commit()
+        self._size = self._total_size()
+        # key -> last access time not yet written
+        self._accessed: dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+
+        self.evictions = 0
+
+    def _total_size(self) -> int:
+        return self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()[0]
+
+    def _read(self, keys: list[str], columns: list[str]) -> dict[str, tuple]:
+        """
+        key -> (*columns, created_at) of the keys found, reading counts as a use for LRU
+        """
+        now = time.time()
+        found = {}
+        with self._lock:
+            # stay below the sqlite variable limit
+            for start in range(0, len(keys), 500):
+                part = keys[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, {', '.join(columns)}, created_at FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    if self.max_age is not None and now - row[-1] > self.max_age:
+                        continue
+                    found[row[0]] = row[1:]
+                    self._accessed[row[0]] = now
+            if (
+                len(self._accessed) >= self.flush_every
+                or time.monotonic() - self._flushed_at > self.flush_interval
+            ):
+                self._flush_access()
+                self._conn.commit()
+        return found
+
+    def _write(self, rows: dict[str, dict]):
+        """
+        insert or replace key -> {column: value}, rows larger than max_bytes are skipped
+        """
+        now = time.time()
+        values = []
+        for key, row in rows.items():
+            size = sum(value_size(row.get(name)) for name in self.columns)
+            if size <= self.max_bytes:
+                values.append((key, *[row.get(name) for name in self.columns], now, now, size))
+        if not values:
+            return
+        names = ", ".join(self.columns)
+        marks = ", ".join("?" * (len(self.columns) + 4))
+        with self._lock:
+            keys = [v[0] for v in values]
+            old = 0
+            for start in range(0, len(keys), 500):
+                part = keys[start : start + 500]
+                old += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchone()[0]
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} "
+                f"(key, {names}, created_at, accessed_at, size) VALUES ({marks})",
+                values,
+            )
+            for key in keys:
+                self._accessed.pop(key, None)
+            self._size += sum(v[-1] for v in values) - old
+            self._evict(now)
+            self._conn.commit()
+
+    def _renew(self, key: str):
+        """
+        the row counts as created now, e.g. the source confirmed it did not change
+        """
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._flush_access()
+            self._conn.execute(
+                f"UPDATE {self.table} SET created_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key),
+            )
+            self._conn.commit()
+
+    def flush(self):
+        """
+        write the pending access times
+        """
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self):
+        # caller holds the lock and commits
+        if self._accessed:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                [(t, key) for key, t in self._accessed.items()],
+            )
+            self._accessed = {}
+        self._flushed_at = time.monotonic()
+
+    def _evict(self, now: float):
+        # caller holds the lock
+        if self.max_age is not None:
+            cutoff = now - self.max_age
+            expired = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table} WHERE created_at < ?",
+                (cutoff,),
+            ).fetchone()
+            if expired[0]:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (cutoff,))
+                self._size -= expired[1]
+                self.evictions += expired[0]
+        if self._size <= self.max_bytes:
+            return
+        # other processes may share the file, evict by the real size
+        self._size = self._total_size()
+        if self._size > self.max_bytes:
+            # evict by the real access order
+            self._flush_access()
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+
+    def clear(self, prefix: str = None):
+        """
+        drop every row, or the rows whose key starts with prefix
+        """
+        with self._lock:
+            self._flush_access()
+            if prefix is None:
+                self._conn.execute(f"DELETE FROM {self.table}")
+            else:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE substr(key, 1, ?) = ?",
+                    (len(prefix), prefix),
+                )
+            self._conn.commit()
+            self._size = self._total_size()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return {
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.browser.duckduckgo import DuckSearch, get_host_latency
+
+
+class FakeWrapper:
+    def __init__(self):
+        self.calls = []
+
+    def results(self, query, max_results, source="text"):
+        self.calls.append((query, max_results, source))
+        return [
+            {"title": f"r{i}", "link": f"https://example.com/{i}", "snippet": ""}
+            for i in range(max_results)
+        ]
+
+
+def make_search() -> tuple[DuckSearch, FakeWrapper]:
+    wrapper = FakeWrapper()
+    search = DuckSearch.__new__(DuckSearch)
+    search.search_engine = SimpleNamespace(api_wrapper=wrapper, backend="text")
+    search._deadline = 1.5
+    return search, wrapper
+
+
+def test_search_requests_k_results():
+    search, wrapper = make_search()
+    results = asyncio.run(search._asearch_result("python", k=3, deep_search=False))
+    assert wrapper.calls == [("python", 3, "text")]
+    assert len(results) == 3
+
+
+def test_deep_search_requests_the_fan_out():
+    search, wrapper = make_search()
+    # no budget left for fetching pages, only the search itself runs
+    results = asyncio.run(search._asearch_result("python", k=4, deadline=0))
+    assert wrapper.calls == [("python", get_host_latency().fan_out(4), "text")]
+    assert len(results) == 4